@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 import os
-import copy
+import sys
 
 import copy_srcs
 
@@ -10,59 +10,90 @@ from iob_gpio import iob_gpio
 from iob_axistream_in import iob_axistream_in
 from iob_axistream_out import iob_axistream_out
 from iob_ram_2p_be import iob_ram_2p_be
-from verilog_gen import insert_verilog_in_module
+from verilog_patch import VerilogPatchSet
+from portmap_gen import PortmapIndex, to_external, to_internal, connect
+from regs_bulk_gen import reg_array, generate_bulk_header
+from reg_model import Register, register_views
 from config_gen import append_str_config_build_mk
+from setup_cache import record_step, file_hash
 
+# Supported widths of the AXI stream data (TDATA_W), in bits
+AXIS_TDATA_W_VALUES = [32, 64, 128]
+
+
+def _axis_tdata_w():
+    """Return TDATA_W of the AXI streams (`AXIS_TDATA_W=<bits>` setup argument)"""
+    width = 32
+    for arg in sys.argv:
+        if arg.startswith("AXIS_TDATA_W="):
+            width = int(arg.split("=", 1)[1])
+    if width not in AXIS_TDATA_W_VALUES:
+        raise ValueError(
+            f"AXIS_TDATA_W must be one of {AXIS_TDATA_W_VALUES}, got {width}"
+        )
+    return width
+
+
+# Width of the AXI streams between the SUT and the Tester. Both systems use this
+# value for their AXISTREAMIN0/OUT0 peripherals, so both ends always match.
+AXIS_TDATA_W = _axis_tdata_w()
+
+# Register definitions are shared, immutable records (see reg_model.py).
+# Each module gets its own lightweight views of them, with `register_views()`.
 sut_regs = [
     {
         "name": "regfileif",
         "descr": "REGFILEIF software accessible registers.",
         "regs": [
-            {
-                "name": "REG1",
-                "type": "W",
-                "n_bits": 8,
-                "rst_val": 0,
-                "log2n_items": 0,
-                "autoreg": True,
-                "descr": "Write register: 8 bit",
-            },
-            {
-                "name": "REG2",
-                "type": "W",
-                "n_bits": 16,
-                "rst_val": 0,
-                "log2n_items": 0,
-                "autoreg": True,
-                "descr": "Write register: 16 bit",
-            },
-            {
-                "name": "REG3",
-                "type": "R",
-                "n_bits": 8,
-                "rst_val": 0,
-                "log2n_items": 0,
-                "autoreg": True,
-                "descr": "Read register: 8 bit",
-            },
-            {
-                "name": "REG4",
-                "type": "R",
-                "n_bits": 16,
-                "rst_val": 0,
-                "log2n_items": 0,
-                "autoreg": True,
-                "descr": "Read register 16 bit",
-            },
-            {
-                "name": "REG5",
-                "type": "R",
-                "n_bits": 32,
-                "rst_val": 0,
-                "log2n_items": 0,
-                "autoreg": True,
-                "descr": "Read register 32 bit. In this example, we use this to pass the sutMemoryMessage address.",
-            },
+            Register("REG1", "W", 8, descr="Write register: 8 bit"),
+            Register("REG2", "W", 16, descr="Write register: 16 bit"),
+            Register("REG3", "R", 8, descr="Read register: 8 bit"),
+            Register("REG4", "R", 16, descr="Read register 16 bit"),
+            Register(
+                "REG5",
+                "R",
+                32,
+                descr="Read register 32 bit. In this example, we use this to pass the sutMemoryMessage address.",
+            ),
+            # Register arrays, accessed in bulk via the generated `*_bulk.h` headers
+            reg_array(
+                "DATA_IN", "W", 32, 8, "Write register array: 8 words of 32 bit"
+            ),
+            reg_array(
+                "DATA_OUT", "R", 32, 8, "Read register array: 8 words of 32 bit"
+            ),
+            Register(
+                "PHASES",
+                "R",
+                32,
+                descr="Address of the phase timing table of the SUT firmware (see iob_soc_sut_phases.h).",
+            ),
+            # Mailbox in shared memory (see iob_soc_sut_mailbox.h). Ring indices are
+            # written by a single side: the producer writes the head, the consumer the tail.
+            Register(
+                "MBOX_BASE",
+                "R",
+                32,
+                descr="Address of the mailbox in the SUT memory (0 while not initialized).",
+            ),
+            Register(
+                "T2S_HEAD", "W", 32, descr="Head index of the Tester to SUT ring."
+            ),
+            Register(
+                "T2S_TAIL", "R", 32, descr="Tail index of the Tester to SUT ring."
+            ),
+            Register(
+                "S2T_HEAD", "R", 32, descr="Head index of the SUT to Tester ring."
+            ),
+            Register(
+                "S2T_TAIL", "W", 32, descr="Tail index of the SUT to Tester ring."
+            ),
+            Register(
+                "AXIS_NWORDS",
+                "W",
+                32,
+                descr="Number of words of the next AXI stream packet sent by the Tester, looped back by the SUT.",
+            ),
         ],
     }
 ]
@@ -108,368 +139,101 @@ class iob_soc_sut(iob_soc_opencryptolinux):
             iob_axistream_in(
                 "AXISTREAMIN0",
                 "SUT AXI input stream interface",
-                parameters={"TDATA_W": "32"},
+                parameters={"TDATA_W": str(AXIS_TDATA_W)},
             )
         )
         cls.peripherals.append(
             iob_axistream_out(
                 "AXISTREAMOUT0",
                 "SUT AXI output stream interface",
-                parameters={"TDATA_W": "32"},
+                parameters={"TDATA_W": str(AXIS_TDATA_W)},
             )
         )
-        cls.peripheral_portmap += [
-            (  # Map REGFILEIF0 to external interface
-                {
-                    "corename": "REGFILEIF0",
-                    "if_name": "external_iob_s_port",
-                    "port": "",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "REGFILEIF0",
-                    "port": "",
-                    "bits": [],
-                    "ios_table_prefix": False,  # Don't add interface table prefix (REGFILEIF0) to the signal names
-                    "remove_string_from_port_names": "external_",  # Remove this string from the port names of the external IO
-                },
-            ),
-            # AXISTREAM IN
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_clk_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_cke_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_arst_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_tvalid_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_tready_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_tdata_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_tlast_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            # AXISTREAM IN DMA
-            # Connect these signals to internal floating wires.
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tvalid_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tready_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tdata_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "general",
-                    "port": "interrupt_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            # AXISTREAM OUT
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_clk_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_cke_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_arst_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_tvalid_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_tready_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_tdata_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_tlast_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "external",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            # AXISTREAM OUT DMA
-            # Connect these signals to internal floating wires.
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tvalid_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTRREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tready_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTRREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tdata_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTRREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "general",
-                    "port": "interrupt_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTRREAMOUT0",
-                    "port": "input_ports",
-                    "bits": [1],
-                },
-            ),
-        ]
+        # Index connections by port, to detect ports mapped more than once
+        cls.peripheral_portmap = PortmapIndex(
+            [
+                # Map REGFILEIF0 to external interface
+                to_external(
+                    "REGFILEIF0",
+                    "external_iob_s_port",
+                    "",
+                    ios_table_prefix=False,  # Don't add interface table prefix (REGFILEIF0) to the signal names
+                    remove_string_from_port_names="external_",  # Remove this string from the port names of the external IO
+                ),
+                # AXISTREAM IN
+                to_external(
+                    "AXISTREAMIN0",
+                    "axistream",
+                    [
+                        "axis_clk_i",
+                        "axis_cke_i",
+                        "axis_arst_i",
+                        "axis_tvalid_i",
+                        "axis_tready_o",
+                        "axis_tdata_i",
+                        "axis_tlast_i",
+                    ],
+                ),
+                # AXISTREAM IN DMA interface connected to the AXISTREAM OUT DMA
+                # interface: hardware loopback, when both are in DMA mode.
+                connect(
+                    "AXISTREAMIN0",
+                    "sys_axis",
+                    "AXISTREAMOUT0",
+                    "sys_axis",
+                    [
+                        ("sys_tvalid_o", "sys_tvalid_i"),
+                        ("sys_tready_i", "sys_tready_o"),
+                        ("sys_tdata_o", "sys_tdata_i"),
+                    ],
+                ),
+                to_internal("AXISTREAMIN0", "general", ["interrupt_o"]),
+                # AXISTREAM OUT
+                to_external(
+                    "AXISTREAMOUT0",
+                    "axistream",
+                    [
+                        "axis_clk_i",
+                        "axis_cke_i",
+                        "axis_arst_i",
+                        "axis_tvalid_o",
+                        "axis_tready_i",
+                        "axis_tdata_o",
+                        "axis_tlast_o",
+                    ],
+                ),
+                to_internal("AXISTREAMOUT0", "general", ["interrupt_o"]),
+            ],
+            cls.peripherals,
+            cls.peripheral_portmap,
+        )
 
         super()._create_instances()
 
     @classmethod
     def _generate_files(cls):
         super()._generate_files()
+        # Store fingerprints of the setup inputs (reported by `setup_cache.py`)
+        record_step(cls.build_dir, f"{cls.name}:regs", sut_regs)
+        record_step(cls.build_dir, f"{cls.name}:portmap", cls.peripheral_portmap)
+        record_step(cls.build_dir, f"{cls.name}:confs", cls.confs)
         # Remove iob_soc_sut_swreg_gen.v as it is not used
         os.remove(os.path.join(cls.build_dir, "hardware/src/iob_soc_sut_swreg_gen.v"))
-        # Connect unused peripheral inputs
-        insert_verilog_in_module(
-            """
-    assign AXISTREAMIN0_tready_i = 1'b0;
-    assign AXISTRREAMOUT0_tvalid_i = 1'b0;
-    assign AXISTRREAMOUT0_tdata_i = 1'b0;
-             """,
-            cls.build_dir + "/hardware/src/iob_soc_sut.v",
+        patches = VerilogPatchSet(cls.build_dir)
+        # Connect AXISTREAMIN0 interrupt to the PLIC (source 2), to wake up the
+        # firmware when data arrives
+        axis_in_irq = cls.peripheral_portmap.internal_wire(
+            "AXISTREAMIN0", "general", "interrupt_o"
+        )
+        patches.replace(
+            "hardware/src/iob_soc_sut.v",
+            ".plicInterrupts({{30{1'b0}}, uart_interrupt_o, 1'b0}),",
+            f".plicInterrupts({{{{29{{1'b0}}}}, {axis_in_irq}, uart_interrupt_o, 1'b0}}),",
         )
         # Update sim_wrapper connections
         if cls.is_top_module:
-            insert_verilog_in_module(
+            patches.insert(
+                "hardware/simulation/src/iob_soc_sut_sim_wrapper.v",
                 """
 `include "iob_regfileif_inverted_swreg_def.vh"
 
@@ -492,21 +256,42 @@ class iob_soc_sut(iob_soc_opencryptolinux):
    wire [`IOB_SOC_SUT_REGFILEIF0_DATA_W-1:0] iob_wdata_i = `IOB_SOC_SUT_REGFILEIF0_DATA_W'h0;
    wire [(`IOB_SOC_SUT_REGFILEIF0_DATA_W/8)-1:0] iob_wstrb_i = `IOB_SOC_SUT_REGFILEIF0_DATA_W / 8'h0;
                 """,
-                cls.build_dir
-                + "/hardware/simulation/src/iob_soc_sut_sim_wrapper.v",  # Name of the system file to generate the probe wires
                 after_line="iob_soc_sut_wrapper_pwires.vs",
             )
-            insert_verilog_in_module(
+            patches.insert(
+                "hardware/simulation/src/iob_soc_sut_sim_wrapper.v",
                 """
       .iob_valid_i(iob_valid_i),
       .iob_addr_i  (iob_addr_i),
       .iob_wdata_i (iob_wdata_i),
       .iob_wstrb_i (iob_wstrb_i),
                 """,
-                cls.build_dir
-                + "/hardware/simulation/src/iob_soc_sut_sim_wrapper.v",  # Name of the system file to generate the probe wires
                 after_line="soc0",
             )
+        # Write each modified file once
+        record_step(cls.build_dir, f"{cls.name}:verilog_patches", patches.patches)
+        patches.apply()
+        # Generate bulk access functions for the register arrays.
+        # Tester uses the SUT's registers, SUT uses the inverted REGFILEIF registers.
+        # Skipped if the registers and the generator did not change.
+        if record_step(
+            cls.build_dir,
+            f"{cls.name}:bulk_headers",
+            sut_regs,
+            file_hash(os.path.join(os.path.dirname(__file__), "regs_bulk_gen.py")),
+            outputs=[
+                "software/src/iob_soc_sut_bulk.h",
+                "software/src/iob_regfileif_inverted_bulk.h",
+            ],
+        ):
+            generate_bulk_header(
+                "IOB_SOC_SUT", sut_regs, os.path.join(cls.build_dir, "software/src")
+            )
+            generate_bulk_header(
+                "IOB_REGFILEIF_INVERTED",
+                register_views(sut_regs, inverted=True),
+                os.path.join(cls.build_dir, "software/src"),
+            )
         # Set ethernet MAC address
         if cls.is_top_module:
             append_str_config_build_mk(
@@ -535,7 +320,7 @@ endif
 
     @classmethod
     def _setup_regs(cls):
-        cls.regs += sut_regs
+        cls.regs += register_views(sut_regs)
 
     @classmethod
     def _setup_confs(cls):
@@ -550,6 +335,14 @@ endif
                     "max": "32",
                     "descr": "SRAM address width",
                 },
+                {
+                    "name": "AXIS_TDATA_W",
+                    "type": "M",
+                    "val": str(AXIS_TDATA_W),
+                    "min": "32",
+                    "max": "128",
+                    "descr": "Width of the data (TDATA_W) of the AXISTREAMIN0/OUT0 streams, in bits",
+                },
             ]
         )
 
@@ -559,4 +352,4 @@ class iob_regfileif_custom(iob_regfileif):
     @classmethod
     def _init_attributes(cls):
         super()._init_attributes()
-        cls.regs = copy.deepcopy(sut_regs)
+        cls.regs = register_views(sut_regs)
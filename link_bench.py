@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# Throughput and latency of the links between the Tester and the SUT.
+#
+# Runs the given simulation command (Tester set up with BENCHMARK), printing
+# its output, or reads the output of a previous run with `--log`. The Tester
+# firmware prints one line per measurement (see software/src/iob_soc_sut_bench.h):
+#   [Tester]: BENCH freq=<clock frequency>
+#   [Tester]: BENCH path=<path> size=<bytes> cycles=<clock cycles>
+#
+# The report (`--report`, link_bench_report.json by default) has the bytes/s of
+# each path and payload size, and the latency of each path (time to transfer
+# its smallest payload). With `--baseline <report>`, the cycles of each
+# measurement are compared with those of a previous report: the script fails if
+# any of them is more than `--tolerance` percent slower.
+#
+# Usage:
+#   ./link_bench.py [--report <file>] [--baseline <file>] [--tolerance <percent>]
+#                   (--log <file> | <simulation command> ...)
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+FREQ_RE = re.compile(r"\[Tester\]: BENCH freq=(\d+)")
+RESULT_RE = re.compile(r"\[Tester\]: BENCH path=(\w+) size=(\d+) cycles=(\d+)")
+
+
+def parse(lines, echo=False):
+    """Parse benchmark lines. returns: (frequency, [(path, size, cycles)])"""
+    freq = None
+    results = []
+    for line in lines:
+        if echo:
+            sys.stdout.write(line)
+        match = FREQ_RE.search(line)
+        if match:
+            freq = int(match.group(1))
+        match = RESULT_RE.search(line)
+        if match:
+            results.append(
+                (match.group(1), int(match.group(2)), int(match.group(3)))
+            )
+    return freq, results
+
+
+def run(command):
+    """Run simulation command. returns: (exit code, frequency, results)"""
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    freq, results = parse(process.stdout, echo=True)
+    process.wait()
+    return process.returncode, freq, results
+
+
+def make_report(freq, results):
+    report = {"freq": freq, "results": [], "latency": {}}
+    for path, size, cycles in results:
+        seconds = cycles / freq
+        report["results"].append(
+            {
+                "path": path,
+                "size": size,
+                "cycles": cycles,
+                "bytes_per_s": size / seconds if seconds else None,
+            }
+        )
+        latency = report["latency"].get(path)
+        if latency is None or size < latency["size"]:
+            report["latency"][path] = {
+                "size": size,
+                "cycles": cycles,
+                "us": seconds * 1e6,
+            }
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """Compare cycles of each measurement. returns: number of regressions"""
+    base_cycles = {(r["path"], r["size"]): r["cycles"] for r in baseline["results"]}
+    regressions = 0
+    print(f"{'path':<16} {'size':>6} {'cycles':>12} {'baseline':>12} {'change':>8}")
+    for result in report["results"]:
+        key = (result["path"], result["size"])
+        if key not in base_cycles:
+            print(f"{key[0]:<16} {key[1]:>6} {result['cycles']:>12} {'-':>12}")
+            continue
+        base = base_cycles.pop(key)
+        change = (result["cycles"] - base) * 100 / base if base else 0.0
+        mark = ""
+        if change > tolerance:
+            regressions += 1
+            mark = " REGRESSION"
+        print(
+            f"{key[0]:<16} {key[1]:>6} {result['cycles']:>12} {base:>12} "
+            f"{change:>+7.1f}%{mark}"
+        )
+    for path, size in base_cycles:
+        print(f"Warning: {path} {size} bytes is missing from the results.")
+    return regressions
+
+
+def print_report(report):
+    print(f"{'path':<16} {'size':>6} {'cycles':>12} {'bytes/s':>14}")
+    for result in report["results"]:
+        print(
+            f"{result['path']:<16} {result['size']:>6} {result['cycles']:>12} "
+            f"{result['bytes_per_s']:>14.0f}"
+        )
+    for path, latency in report["latency"].items():
+        print(
+            f"Latency of {path}: {latency['us']:.2f} us "
+            f"({latency['cycles']} cycles, {latency['size']} bytes)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Tester/SUT link throughput and latency benchmark"
+    )
+    parser.add_argument("--report", default="link_bench_report.json")
+    parser.add_argument("--baseline", help="Previous report to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=5.0,
+        help="Max increase of cycles, in percent (default: 5)",
+    )
+    parser.add_argument("--log", help="Read output of a previous run")
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    if args.log:
+        with open(args.log) as log:
+            freq, results = parse(log)
+    elif args.command:
+        code, freq, results = run(args.command)
+        if code:
+            sys.exit(code)
+    else:
+        parser.error("Give a simulation command or --log")
+    if freq is None or not results:
+        sys.exit("Benchmark results not found. Was the Tester set up with BENCHMARK?")
+
+    report = make_report(freq, results)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=4)
+    print_report(report)
+    print(f"Report stored in {args.report}.")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            sys.exit(f"{regressions} measurement(s) slower than the baseline.")
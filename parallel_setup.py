@@ -0,0 +1,394 @@
+# Parallel setup of the submodules of a system.
+#
+# The submodules of a system are independent of each other, so their setups can
+# run at the same time. Each submodule setup runs in a forked worker process, in
+# a private staging directory. It starts as a copy of the files of the build
+# directory that belong to the setup (see `setup_cache.setup_files`), so the
+# outputs of the simulation and FPGA tools are not copied. The changes of each
+# worker (written, appended, deleted files) are then replayed on the build
+# directory in the order of the submodule list, which gives the same result as
+# the serial setup:
+# - files written by a later submodule overwrite earlier ones;
+# - data appended to an existing file is appended again to the merged file;
+# - files deleted by a submodule are deleted from the build directory.
+# Items that are not modules (like interfaces) are set up by the parent process,
+# at their position in the list.
+#
+# The class attributes changed by each worker are also replayed in list order
+# (the instances created later by the system need the attributes set by the
+# submodule setups). A change that can not be transferred to the parent process
+# raises ParallelSetupError: use the serial setup for such submodules.
+#
+# Submodules are grouped in stages. All submodules of a stage run in parallel.
+# A worker starts from the build directory and class attributes with the changes
+# of the submodules that come before it in the list and belong to previous
+# stages. So a submodule can depend on the setup of earlier submodules of
+# previous stages, but not of interfaces or submodules of its own stage.
+#
+# The number of worker processes is given by `SETUP_JOBS=<n>` in the setup
+# arguments (or the SETUP_JOBS environment variable). It defaults to 1, which
+# uses the serial setup.
+import os
+import sys
+import json
+import hashlib
+import copy
+import pickle
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from setup_cache import STEPS_NAME, file_hash, setup_files
+
+# Attributes that hold the build directory of a module. Workers redirect them to their staging directory.
+BUILD_DIR_ATTRS = ["build_dir", "global_build_dir"]
+
+# Setup jobs of the current stage. Set before forking the workers, so they can be passed by index.
+_jobs = []
+
+
+class ParallelSetupError(Exception):
+    """Raised when the setup of a submodule can not be merged like the serial setup"""
+
+
+def get_setup_jobs():
+    """Return number of worker processes to use for the setup"""
+    for arg in sys.argv:
+        if arg.startswith("SETUP_JOBS="):
+            return max(int(arg.split("=", 1)[1]), 1)
+    return max(int(os.getenv("SETUP_JOBS", 1)), 1)
+
+
+def _module_classes(module_class):
+    """Return all classes of the module hierarchy of the given class, indexed by name"""
+    root = module_class.__mro__[-2]  # Base class of all modules (before `object`)
+    classes = {}
+    pending = [root]
+    while pending:
+        _class = pending.pop()
+        key = f"{_class.__module__}.{_class.__qualname__}"
+        if key in classes:
+            continue
+        classes[key] = _class
+        pending += _class.__subclasses__()
+    return classes
+
+
+def _copy(value):
+    try:
+        return copy.copy(value)
+    except Exception:
+        return value
+
+
+def _snapshot(classes):
+    """Return shallow copies of the attributes defined by each class"""
+    return {
+        key: {
+            attr: _copy(value)
+            for attr, value in vars(_class).items()
+            if not attr.startswith("__")
+            and not callable(value)
+            and not isinstance(value, (classmethod, staticmethod, property))
+        }
+        for key, _class in classes.items()
+    }
+
+
+def _attribute_changes(before, classes):
+    """Return the picklable class attributes that changed since the `before` snapshot.
+    returns: list of (class_key, attribute, operation, value) with operation:
+        "extend": list items appended to the attribute
+        "update": dictionary items added or changed in the attribute
+        "set": new attribute value
+    """
+    changes = []
+    after = _snapshot(classes)
+    for key, attrs in after.items():
+        for attr, value in attrs.items():
+            if attr in BUILD_DIR_ATTRS:
+                continue
+            old = before.get(key, {}).get(attr, None)
+            try:
+                if attr in before.get(key, {}) and old == value:
+                    continue
+            except Exception:
+                pass
+            if (
+                isinstance(old, list)
+                and isinstance(value, list)
+                and value[: len(old)] == old
+            ):
+                change = (key, attr, "extend", value[len(old) :])
+            elif (
+                isinstance(old, dict)
+                and isinstance(value, dict)
+                and old.keys() <= value.keys()
+            ):
+                change = (
+                    key,
+                    attr,
+                    "update",
+                    {k: v for k, v in value.items() if k not in old or old[k] != v},
+                )
+            else:
+                change = (key, attr, "set", value)
+            try:
+                pickle.dumps(change)
+            except Exception as e:
+                raise ParallelSetupError(
+                    f"Can't transfer attribute '{attr}' of '{key}' from the parallel "
+                    f"setup ({e}). Use SETUP_JOBS=1."
+                ) from None
+            changes.append(change)
+    return changes
+
+
+def _apply_changes(changes, classes):
+    """Apply attribute changes returned by a worker to the classes of this process"""
+    for key, attr, operation, value in changes:
+        _class = classes[key]
+        if operation == "extend":
+            setattr(_class, attr, list(vars(_class).get(attr, [])) + value)
+        elif operation == "update":
+            setattr(_class, attr, {**vars(_class).get(attr, {}), **value})
+        else:
+            setattr(_class, attr, value)
+
+
+def _setup_worker(index):
+    """Setup one submodule in a staging directory (runs in a forked process)"""
+    setup_fn, submodule, staging_dir, earlier_changes = _jobs[index]
+    module_class = submodule[0] if type(submodule) == tuple else submodule
+    classes = _module_classes(module_class)
+    # Class attributes set by the submodules before this one, in previous stages
+    for changes in earlier_changes:
+        _apply_changes(changes, classes)
+    before = _snapshot(classes)
+    for _class in classes.values():
+        for attr in BUILD_DIR_ATTRS:
+            if attr in vars(_class):
+                setattr(_class, attr, staging_dir)
+    setup_fn([submodule])
+    sys.stdout.flush()
+    return _attribute_changes(before, classes)
+
+
+def _list_files(root_dir):
+    """Return relative paths of the files and symlinks below root_dir"""
+    paths = set()
+    for root, dirs, files in os.walk(root_dir):
+        # Symlinks to directories are listed in dirs, but not followed
+        for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            paths.add(os.path.relpath(os.path.join(root, name), root_dir))
+    return paths
+
+
+def _copy_setup_files(build_dir, staging_dir):
+    """Create staging_dir with the directories of build_dir and its setup files"""
+    files = setup_files(build_dir)
+    if files is None:
+        # Any file may come from the setup
+        shutil.copytree(build_dir, staging_dir, symlinks=True)
+        return
+    for root, dirs, _ in os.walk(build_dir):
+        for name in dirs:
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                relpath = os.path.relpath(path, build_dir)
+                os.makedirs(os.path.join(staging_dir, relpath), exist_ok=True)
+    os.makedirs(staging_dir, exist_ok=True)
+    for relpath in files:
+        src = os.path.join(build_dir, relpath)
+        dst = os.path.join(staging_dir, relpath)
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), dst)
+        else:
+            shutil.copy2(src, dst)
+
+
+def _dir_snapshot(root_dir):
+    """Return state of the files below root_dir, to find the changes of a worker"""
+    snapshot = {}
+    for path in _list_files(root_dir):
+        full_path = os.path.join(root_dir, path)
+        if os.path.islink(full_path):
+            snapshot[path] = {"link": os.readlink(full_path)}
+        elif path == STEPS_NAME:
+            with open(full_path) as f:
+                snapshot[path] = {"steps": json.load(f)}
+        else:
+            stat = os.stat(full_path)
+            snapshot[path] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha": file_hash(full_path),
+            }
+    return snapshot
+
+
+def _prefix_hash(path, size):
+    """Return the sha256 of the first `size` bytes of the file"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read(size)).hexdigest()
+
+
+def _dir_changes(snapshot, staging_dir):
+    """Return the changes made by a worker to staging_dir since `snapshot`.
+    returns: list of (path, operation, value) sorted by path, with operation:
+        "write": copy file `value` (path in staging_dir)
+        "append": append bytes `value` to the file
+        "link": create symlink to `value`
+        "steps": merge step fingerprints `value` into the steps file
+        "delete": remove the file
+    """
+    changes = []
+    staged_files = _list_files(staging_dir)
+    for path in sorted(staged_files):
+        src = os.path.join(staging_dir, path)
+        old = snapshot.get(path, {})
+        if os.path.islink(src):
+            target = os.readlink(src)
+            if old.get("link") != target:
+                changes.append((path, "link", target))
+            continue
+        if path == STEPS_NAME:
+            # Step fingerprints are merged, not overwritten
+            old_steps = old.get("steps", {})
+            with open(src) as f:
+                steps = {k: v for k, v in json.load(f).items() if old_steps.get(k) != v}
+            if steps:
+                changes.append((path, "steps", steps))
+            continue
+        if "sha" in old:
+            stat = os.stat(src)
+            if stat.st_size == old["size"] and file_hash(src) == old["sha"]:
+                # Rewritten with the same contents: it still overwrites the
+                # contents written by earlier submodules in the serial setup
+                if stat.st_mtime_ns != old["mtime_ns"]:
+                    changes.append((path, "write", src))
+                continue
+            if (
+                stat.st_size > old["size"]
+                and _prefix_hash(src, old["size"]) == old["sha"]
+            ):
+                with open(src, "rb") as f:
+                    f.seek(old["size"])
+                    changes.append((path, "append", f.read()))
+                continue
+        changes.append((path, "write", src))
+    changes += [
+        (path, "delete", None) for path in sorted(snapshot.keys() - staged_files)
+    ]
+    return changes
+
+
+def _apply_dir_changes(changes, build_dir):
+    """Replay changes returned by `_dir_changes` on build_dir"""
+    for path, operation, value in changes:
+        dst = os.path.join(build_dir, path)
+        if operation == "delete":
+            if os.path.lexists(dst):
+                os.remove(dst)
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if operation == "link":
+            if os.path.lexists(dst):
+                os.remove(dst)
+            os.symlink(value, dst)
+        elif operation == "append":
+            with open(dst, "ab") as f:
+                f.write(value)
+        elif operation == "steps":
+            steps = {}
+            if os.path.exists(dst):
+                with open(dst) as f:
+                    steps = json.load(f)
+            with open(dst, "w") as f:
+                json.dump({**steps, **value}, f, indent=1, sort_keys=True)
+        else:
+            # Always write, as the setup does: `setup_cache.py` keeps the
+            # timestamps of files with unchanged contents
+            if os.path.islink(dst):
+                os.remove(dst)
+            shutil.copy(value, dst)
+
+
+def setup_submodules(build_dir, setup_fn, submodule_list, stage_of=lambda s: 0):
+    """Setup submodules in parallel.
+    build_dir: build directory of the system
+    setup_fn: function that sets up a list of submodules (serial setup)
+    submodule_list: list of submodules (classes, or tuples with class and setup options)
+    stage_of: function that returns the stage number of a submodule class
+    """
+    global _jobs
+    jobs = get_setup_jobs()
+    module_indexes = [
+        index
+        for index, s in enumerate(submodule_list)
+        if isinstance(s[0] if type(s) == tuple else s, type)
+    ]
+    if jobs == 1 or len(module_indexes) < 2:
+        setup_fn(submodule_list)
+        return
+
+    stages = {}
+    for index in module_indexes:
+        item = submodule_list[index]
+        module_class = item[0] if type(item) == tuple else item
+        stages.setdefault(stage_of(module_class), []).append(index)
+
+    os.makedirs(build_dir, exist_ok=True)
+    staging_root = tempfile.mkdtemp(
+        prefix=".setup_staging_", dir=os.path.dirname(os.path.abspath(build_dir))
+    )
+    context = multiprocessing.get_context("fork")
+    # Changes of each submodule, indexed by position in the submodule list
+    dir_changes = {}
+    attr_changes = {}
+    try:
+        for stage in sorted(stages):
+            _jobs = []
+            snapshots = {}
+            for index in stages[stage]:
+                # Build directory as seen by this submodule in the serial setup
+                staging_dir = os.path.join(staging_root, str(index))
+                _copy_setup_files(build_dir, staging_dir)
+                earlier = sorted(i for i in dir_changes if i < index)
+                for i in earlier:
+                    _apply_dir_changes(dir_changes[i], staging_dir)
+                snapshots[index] = _dir_snapshot(staging_dir)
+                _jobs.append(
+                    (
+                        setup_fn,
+                        submodule_list[index],
+                        staging_dir,
+                        [attr_changes[i] for i in earlier],
+                    )
+                )
+            sys.stdout.flush()
+            sys.stderr.flush()
+            with ProcessPoolExecutor(
+                max_workers=min(jobs, len(_jobs)), mp_context=context
+            ) as executor:
+                results = list(executor.map(_setup_worker, range(len(_jobs))))
+            for index, changes in zip(stages[stage], results):
+                dir_changes[index] = _dir_changes(
+                    snapshots[index], os.path.join(staging_root, str(index))
+                )
+                attr_changes[index] = changes
+        # Replay the changes in the order of the serial setup
+        first_module = submodule_list[module_indexes[0]]
+        classes = _module_classes(
+            first_module[0] if type(first_module) == tuple else first_module
+        )
+        for index, item in enumerate(submodule_list):
+            if index in dir_changes:
+                _apply_dir_changes(dir_changes[index], build_dir)
+                _apply_changes(attr_changes[index], classes)
+            else:
+                setup_fn([item])
+    finally:
+        _jobs = []
+        shutil.rmtree(staging_root, ignore_errors=True)
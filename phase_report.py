@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# Timeline of the phases of the Tester and SUT firmwares.
+#
+# Decodes the phase timing file sent by the Tester at the end of the test
+# (`phases.bin`, PHASE_TIMING setup, format in software/src/iob_soc_sut_phases.h)
+# and prints the start, end and duration of each phase, in clock cycles and
+# milliseconds, with a bar on a common timeline of both cores.
+#
+# With `--baseline <file>` (a previous phases.bin or JSON report), the duration
+# of each phase is compared with the same phase of the baseline: the script
+# fails if any phase is more than `--tolerance` percent (and `--min-cycles`
+# cycles) slower.
+#
+# Usage:
+#   ./phase_report.py <phases.bin> [--json <report>] [--baseline <file>]
+#                     [--tolerance <percent>] [--min-cycles <cycles>]
+import sys
+import json
+import struct
+import argparse
+
+HEADER = struct.Struct("<4sHHII")
+ENTRY = struct.Struct("<20sIQQ")
+CORES = {0: "Tester", 1: "SUT"}
+BAR_WIDTH = 40
+
+
+def decode(data):
+    """Decode phase timing file. returns: report dict"""
+    magic, version, entry_size, n_phases, freq = HEADER.unpack_from(data)
+    if magic != b"PHSB":
+        raise ValueError("Not a phase timing file (bad magic).")
+    if version != 1 or entry_size != ENTRY.size:
+        raise ValueError(f"Unsupported phase timing file version {version}.")
+    phases = []
+    for i in range(n_phases):
+        offset = HEADER.size + i * ENTRY.size
+        name, core, start, end = ENTRY.unpack_from(data, offset)
+        phases.append(
+            {
+                "core": CORES.get(core, str(core)),
+                "name": name.split(b"\0", 1)[0].decode(errors="replace"),
+                "start": start,
+                "end": end,
+                # Phases that did not end have no duration
+                "cycles": end - start if end else None,
+            }
+        )
+    return {"freq": freq, "phases": phases}
+
+
+def load(file_name):
+    if file_name.endswith(".json"):
+        with open(file_name) as f:
+            return json.load(f)
+    with open(file_name, "rb") as f:
+        return decode(f.read())
+
+
+def print_timeline(report):
+    phases = sorted(report["phases"], key=lambda p: p["start"])
+    if not phases:
+        print("No phases recorded.")
+        return
+    first = phases[0]["start"]
+    last = max(p["end"] or p["start"] for p in phases)
+    span = max(last - first, 1)
+    ms = 1e3 / report["freq"]
+    print(
+        f"{'core':<7} {'phase':<20} {'start':>12} {'cycles':>12} {'ms':>10}  timeline"
+    )
+    for phase in phases:
+        begin = min((phase["start"] - first) * BAR_WIDTH // span, BAR_WIDTH - 1)
+        end = ((phase["end"] or last) - first) * BAR_WIDTH // span
+        bar = " " * begin + "#" * max(end - begin, 1)
+        cycles = phase["cycles"]
+        if cycles is None:
+            duration = f"{'-':>12} {'-':>10}"
+        else:
+            duration = f"{cycles:>12} {cycles * ms:>10.3f}"
+        print(
+            f"{phase['core']:<7} {phase['name']:<20} {phase['start']:>12} "
+            f"{duration}  |{bar:<{BAR_WIDTH}}|"
+        )
+    print(f"Total: {span} cycles ({span * ms:.3f} ms)")
+
+
+def compare(report, baseline, tolerance, min_cycles):
+    """Compare phase durations. returns: number of regressions"""
+    base = {(p["core"], p["name"]): p["cycles"] for p in baseline["phases"]}
+    regressions = 0
+    print(f"{'core':<7} {'phase':<20} {'cycles':>12} {'baseline':>12} {'change':>8}")
+    for phase in report["phases"]:
+        key = (phase["core"], phase["name"])
+        cycles, base_cycles = phase["cycles"], base.pop(key, None)
+        if cycles is None or base_cycles is None:
+            print(
+                f"{key[0]:<7} {key[1]:<20} {cycles or '-':>12} "
+                f"{base_cycles or '-':>12}"
+            )
+            continue
+        change = (cycles - base_cycles) * 100 / base_cycles if base_cycles else 0.0
+        mark = ""
+        if change > tolerance and cycles - base_cycles > min_cycles:
+            regressions += 1
+            mark = " REGRESSION"
+        print(
+            f"{key[0]:<7} {key[1]:<20} {cycles:>12} {base_cycles:>12} "
+            f"{change:>+7.1f}%{mark}"
+        )
+    for core, name in base:
+        print(f"Warning: phase {name} of {core} is missing from the results.")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Timeline of the Tester and SUT firmware phases"
+    )
+    parser.add_argument("phases", help="Phase timing file (phases.bin)")
+    parser.add_argument("--json", help="Store report in JSON format")
+    parser.add_argument("--baseline", help="Previous phases.bin or JSON report")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=5.0,
+        help="Max increase of the duration of a phase, in percent (default: 5)",
+    )
+    parser.add_argument(
+        "--min-cycles",
+        type=int,
+        default=1000,
+        help="Ignore increases of fewer cycles (default: 1000)",
+    )
+    args = parser.parse_args()
+
+    try:
+        report = load(args.phases)
+    except (OSError, ValueError, struct.error) as e:
+        sys.exit(f"{args.phases}: {e}")
+    print_timeline(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        regressions = compare(
+            report, load(args.baseline), args.tolerance, args.min_cycles
+        )
+        if regressions:
+            sys.exit(f"{regressions} phase(s) slower than the baseline.")
@@ -0,0 +1,263 @@
+# Compact specification of peripheral port maps.
+#
+# The `peripheral_portmap` list of a system contains one tuple of two endpoint
+# dictionaries for each mapped port:
+#   ({"corename": ..., "if_name": ..., "port": ..., "bits": [...]},
+#    {"corename": ..., "if_name": ..., "port": ..., "bits": [...], <options>})
+#
+# Instead of writing these tuples by hand, systems describe their port maps with
+# the functions below, one call per group of ports:
+#   to_external("AXISTREAMIN0", "axistream")  # Map every `axistream` port to external
+#   to_internal("AXISTREAMIN0", "sys_axis", ["sys_tvalid_o", "sys_tready_i"])
+#   connect("SUT0", "uart", "UART1", "rs232", [("uart_rxd_i", "txd_o")])
+#
+# PortmapIndex is the `peripheral_portmap` list itself: specs are expanded when
+# they are added to it, and the resulting connections are also stored in a
+# dictionary indexed by (corename, if_name, port) of each endpoint, for lookups
+# and to detect ports that are mapped more than once (including a port mapped
+# on its own and with its whole interface). Systems use `internal_wire` to check
+# that the wires used by their Verilog patches are mapped.
+
+# Corenames with special meaning for the endpoint of a mapping
+WIRE_CORENAMES = ["internal", "external"]
+
+
+class PortmapError(Exception):
+    """Raised for invalid port map specifications"""
+
+
+def _endpoint(corename, if_name, port, bits=None, **options):
+    return {
+        "corename": corename,
+        "if_name": if_name,
+        "port": port,
+        "bits": list(bits or []),
+        **options,
+    }
+
+
+def _interface_ports(peripherals, corename, if_name):
+    """Return names of the ports of interface `if_name` of instance `corename`"""
+    for instance in peripherals:
+        if instance.name != corename:
+            continue
+        for interface in instance.ios:
+            if interface["name"] == if_name:
+                return [port["name"] for port in interface["ports"]]
+        raise PortmapError(f"Instance '{corename}' has no interface '{if_name}'.")
+    raise PortmapError(f"Instance '{corename}' not found in peripherals list.")
+
+
+class _PortmapSpec:
+    def __init__(self, corename, if_name, ports, expand_port):
+        self.corename = corename
+        self.if_name = if_name
+        # None: every port of the interface; "": whole interface in one mapping; list: selected ports
+        self.ports = ports
+        # Function that returns the mapping tuple of a port
+        self.expand_port = expand_port
+
+    def expand(self, peripherals=None):
+        """Generate mapping tuples of this spec"""
+        if self.ports is None:
+            ports = _interface_ports(peripherals or [], self.corename, self.if_name)
+        elif self.ports == "":
+            ports = [""]
+        else:
+            ports = self.ports
+        for port in ports:
+            yield self.expand_port(port)
+
+
+def to_external(corename, if_name, ports=None, external_if_name=None, **options):
+    """Map ports of an instance's interface to external IOs of the system.
+    ports: list of port names. None maps every port of the interface individually;
+           "" maps the whole interface in a single entry.
+    external_if_name: name of the external interface (default: corename)
+    options: extra keys of the external endpoint (like `ios_table_prefix`)
+    """
+    external_if_name = external_if_name or corename
+    return _PortmapSpec(
+        corename,
+        if_name,
+        ports,
+        lambda port: (
+            _endpoint(corename, if_name, port),
+            _endpoint("external", external_if_name, "", **options),
+        ),
+    )
+
+
+def to_internal(corename, if_name, ports=None, wire_name=None):
+    """Map ports of an instance's interface to internal system wires.
+    ports: same as in `to_external`
+    wire_name: prefix of the internal wires (default: corename)
+    """
+    wire_name = wire_name or corename
+    return _PortmapSpec(
+        corename,
+        if_name,
+        ports,
+        lambda port: (
+            _endpoint(corename, if_name, port),
+            _endpoint("internal", wire_name, ""),
+        ),
+    )
+
+
+def connect(corename, if_name, to_corename, to_if_name, port_pairs):
+    """Connect ports of two instances.
+    port_pairs: list of (port, to_port) or (port, to_port, to_bits) tuples
+    """
+    pairs = {pair[0]: pair[1:] for pair in port_pairs}
+    return _PortmapSpec(
+        corename,
+        if_name,
+        list(pairs),
+        lambda port: (
+            _endpoint(corename, if_name, port),
+            _endpoint(to_corename, to_if_name, *pairs[port]),
+        ),
+    )
+
+
+def expand_portmap(specs, peripherals=None):
+    """Generate mapping tuples of a list of specs"""
+    for spec in specs:
+        yield from spec.expand(peripherals)
+
+
+def _bits_overlap(bits_a, bits_b):
+    # Empty list represents every bit of the port
+    return not bits_a or not bits_b or not set(bits_a).isdisjoint(bits_b)
+
+
+class PortmapIndex(list):
+    """Port map (list of mapping tuples) with connections indexed by
+    (corename, if_name, port) of each endpoint.
+    Mapping tuples are checked and indexed when they are added to the list, and
+    the index is rebuilt when they are replaced or removed.
+    """
+
+    def __init__(self, specs=None, peripherals=None, portmap=None):
+        """specs: list of specs (see `to_external`, `to_internal`, `connect`)
+        peripherals: instances of the system, to expand specs of every interface port
+        portmap: mapping tuples already in the port map (added before the specs)
+        """
+        super().__init__()
+        # Dictionary with list of (own endpoint, peer endpoint) for each endpoint key
+        self.connections = {}
+        # Dictionary with set of mapped ports for each (corename, if_name)
+        self.interfaces = {}
+        self.extend(portmap or [])
+        self.extend(expand_portmap(specs or [], peripherals))
+
+    @staticmethod
+    def key(endpoint):
+        return (endpoint["corename"], endpoint["if_name"], endpoint["port"])
+
+    def _mapped_ports(self, endpoint):
+        """Return keys of the mapped ports that overlap the given endpoint"""
+        corename, if_name, port = self.key(endpoint)
+        ports = self.interfaces.get((corename, if_name), set())
+        if port == "":
+            # Whole interface overlaps every port of the interface
+            overlapping = ports
+        else:
+            overlapping = {port, ""} & ports
+        keys = []
+        for other in sorted(overlapping):
+            key = (corename, if_name, other)
+            for existing, existing_peer in self.connections[key]:
+                if other != port or _bits_overlap(
+                    existing.get("bits", []), endpoint.get("bits", [])
+                ):
+                    keys.append(self.key(existing_peer))
+        return keys
+
+    def append(self, mapping):
+        """Add a mapping tuple. Raises PortmapError if a port bit is already mapped."""
+        for own, peer in (mapping, mapping[::-1]):
+            # Many ports may be connected to the same internal/external wires
+            if own["corename"] in WIRE_CORENAMES:
+                continue
+            existing_peers = self._mapped_ports(own)
+            if existing_peers:
+                raise PortmapError(
+                    f"Port {self.key(own)} mapped more than once: "
+                    f"to {existing_peers[0]} and {self.key(peer)}."
+                )
+        for own, peer in (mapping, mapping[::-1]):
+            if own["corename"] in WIRE_CORENAMES:
+                continue
+            self.connections.setdefault(self.key(own), []).append((own, peer))
+            self.interfaces.setdefault(self.key(own)[:2], set()).add(own["port"])
+        super().append(mapping)
+
+    def extend(self, mappings):
+        for mapping in mappings:
+            self.append(mapping)
+
+    def __iadd__(self, mappings):
+        self.extend(mappings)
+        return self
+
+    def _replace(self, mappings):
+        """Replace all mapping tuples. Raises PortmapError (and keeps the current
+        ones) if a port bit is mapped more than once.
+        """
+        index = PortmapIndex(portmap=mappings)
+        self.connections = index.connections
+        self.interfaces = index.interfaces
+        super().__setitem__(slice(None), list(index))
+
+    def insert(self, position, mapping):
+        mappings = list(self)
+        mappings.insert(position, mapping)
+        self._replace(mappings)
+
+    def __setitem__(self, position, mapping):
+        mappings = list(self)
+        mappings[position] = mapping
+        self._replace(mappings)
+
+    def __delitem__(self, position):
+        mappings = list(self)
+        del mappings[position]
+        self._replace(mappings)
+
+    def pop(self, position=-1):
+        mapping = self[position]
+        del self[position]
+        return mapping
+
+    def remove(self, mapping):
+        del self[self.index(mapping)]
+
+    def clear(self):
+        self._replace([])
+
+    def __reduce__(self):
+        # Copies and pickles are indexed again by __init__
+        return (PortmapIndex, (None, None, list(self)))
+
+    def lookup(self, corename, if_name, port):
+        """Return list of peer endpoints connected to the given port (on its own or
+        with its whole interface)
+        """
+        return [
+            peer
+            for key in [(corename, if_name, port), (corename, if_name, "")]
+            for _, peer in self.connections.get(key, [])
+        ]
+
+    def internal_wire(self, corename, if_name, port):
+        """Return name of the internal wire connected to the given port.
+        Raises PortmapError if the port is not mapped to an internal wire.
+        """
+        for peer in self.lookup(corename, if_name, port):
+            if peer["corename"] == "internal":
+                return f"{peer['if_name']}_{port}"
+        raise PortmapError(
+            f"Port {(corename, if_name, port)} is not mapped to an internal wire."
+        )
@@ -0,0 +1,140 @@
+# Shared, immutable register model.
+#
+# Register definitions are stored once, as frozen `Register` records. Modules
+# that need the registers (like the SUT and its REGFILEIF) get lightweight
+# `RegisterView` objects instead of deep copies. A view behaves like the usual
+# register dictionary: it reads the fields of the shared record, and stores any
+# key written by the setup scripts (like the `addr` computed by the LIB) in a
+# small per-view dictionary. An inverted view swaps the `W` and `R` types, for
+# the inverted register file accessed by the SUT.
+import sys
+import copy
+from collections.abc import Mapping, MutableMapping
+
+FIELDS = tuple(
+    sys.intern(f)
+    for f in ["name", "type", "n_bits", "rst_val", "log2n_items", "autoreg", "descr"]
+)
+
+INVERTED_TYPES = {"W": "R", "R": "W"}
+
+
+class Register(Mapping):
+    """Immutable register definition (read-only mapping with the register fields)"""
+
+    __slots__ = FIELDS
+
+    def __init__(
+        self, name, type, n_bits, rst_val=0, log2n_items=0, autoreg=True, descr=""
+    ):
+        values = [name, type, n_bits, rst_val, log2n_items, autoreg, descr]
+        for field, value in zip(FIELDS, values):
+            if isinstance(value, str) and field != "descr":
+                value = sys.intern(value)
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Register '{self.name}' is immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Register '{self.name}' is immutable.")
+
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, f) for f in FIELDS))
+
+    def __repr__(self):
+        return f"Register({', '.join(repr(getattr(self, f)) for f in FIELDS)})"
+
+    # Records are shared, never copied
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (Register, tuple(getattr(self, f) for f in FIELDS))
+
+
+class RegisterView(MutableMapping):
+    """Register dictionary backed by a shared Register record.
+    Written keys are stored in the view only. Copying a view never copies the record.
+    """
+
+    __slots__ = ("record", "inverted", "overrides")
+
+    def __init__(self, record, inverted=False, overrides=None):
+        self.record = record
+        self.inverted = inverted
+        self.overrides = overrides
+
+    def __getitem__(self, key):
+        if self.overrides and key in self.overrides:
+            return self.overrides[key]
+        value = self.record[key]
+        if self.inverted and key == "type":
+            value = INVERTED_TYPES.get(value, value)
+        return value
+
+    def __setitem__(self, key, value):
+        if self.overrides is None:
+            self.overrides = {}
+        self.overrides[key] = value
+
+    def __delitem__(self, key):
+        if not self.overrides or key not in self.overrides:
+            raise KeyError(f"Field '{key}' of register record can't be deleted.")
+        del self.overrides[key]
+
+    def __iter__(self):
+        yield from FIELDS
+        if self.overrides:
+            yield from (key for key in self.overrides if key not in FIELDS)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def __copy__(self):
+        return RegisterView(self.record, self.inverted, dict(self.overrides or {}))
+
+    def __deepcopy__(self, memo):
+        return RegisterView(
+            self.record, self.inverted, copy.deepcopy(self.overrides, memo)
+        )
+
+    def __reduce__(self):
+        return (RegisterView, (self.record, self.inverted, self.overrides))
+
+
+def register_views(groups, inverted=False):
+    """Return a new list of register groups, with views of the registers of `groups`.
+    groups: list of register group dictionaries, with `regs` lists of Register records or views
+    inverted: swap the `W` and `R` types of the registers
+    """
+    return [
+        {
+            **group,
+            "regs": [
+                RegisterView(
+                    reg.record if isinstance(reg, RegisterView) else reg,
+                    inverted != (isinstance(reg, RegisterView) and reg.inverted),
+                )
+                for reg in group["regs"]
+            ],
+        }
+        for group in groups
+    ]
@@ -0,0 +1,119 @@
+# Generate C headers with bulk access functions for register arrays.
+#
+# Register arrays are registers with `log2n_items` > 0. The software register
+# headers generated by the LIB (`<prefix>_swreg.h`) only access one item per
+# call, so moving N items takes N function calls. The functions generated here
+# access a range of items with a single loop of volatile loads/stores.
+import os
+import math
+
+from reg_model import Register
+
+
+def reg_array(name, type, n_bits, n_items, descr):
+    """Return a register array definition for a `regs` group.
+    n_items: number of items in the array (rounded up to a power of 2)
+    """
+    return Register(
+        name,
+        type,
+        n_bits,
+        log2n_items=math.ceil(math.log2(n_items)) if n_items > 1 else 0,
+        descr=descr,
+    )
+
+
+def _c_type(n_bits):
+    for width in [8, 16, 32]:
+        if n_bits <= width:
+            return f"uint{width}_t", width // 8
+    raise ValueError(f"Register arrays wider than 32 bits are not supported ({n_bits}).")
+
+
+def _n_bytes(reg):
+    """Return bytes of address space of a register (all items of an array)"""
+    n_bits = int(reg["n_bits"])
+    item_bytes = _c_type(n_bits)[1] if n_bits <= 32 else (n_bits + 31) // 32 * 4
+    return item_bytes * 2 ** reg["log2n_items"]
+
+
+def _stride_check(prefix, name, regs):
+    """Return preprocessor check that the items of register array `name` are
+    `<prefix>_<name>_STRIDE` bytes apart in the register map of the LIB
+    (`<prefix>_swreg.h`): aligned, and without other registers in between.
+    """
+    addr = f"{prefix}_{name}_ADDR"
+    end = f"({addr} + {prefix}_{name}_N * {prefix}_{name}_STRIDE)"
+    conditions = [f"({addr} % {prefix}_{name}_STRIDE)"]
+    for group in regs:
+        for reg in group["regs"]:
+            if reg["name"] == name:
+                continue
+            other = f"{prefix}_{reg['name']}_ADDR"
+            conditions.append(
+                f"({other} < {end} && {other} + {_n_bytes(reg)} > {addr})"
+            )
+    return (
+        "#if " + " || \\\n    ".join(conditions) + "\n"
+        f'#error "{prefix}_{name}: items are not {prefix}_{name}_STRIDE bytes apart"\n'
+        "#endif\n"
+    )
+
+
+def bulk_header(prefix, regs):
+    """Return contents of the bulk access header for the register arrays in `regs`.
+    prefix: uppercase prefix of the register macros (like `IOB_SOC_SUT`)
+    regs: list of register groups (use inverted register views for an inverted register file)
+    """
+    lower = prefix.lower()
+    code = f"""// File generated by regs_bulk_gen.py. Do not edit.
+// Bulk access to register arrays of {lower}.
+// Functions take the base address of the peripheral (like the one given to
+// {prefix}_INIT_BASEADDR).
+#ifndef H_{prefix}_BULK_H
+#define H_{prefix}_BULK_H
+
+#include <stdint.h>
+#include "{lower}_swreg.h"
+"""
+    for group in regs:
+        for reg in group["regs"]:
+            if reg["log2n_items"] == 0:
+                continue
+            name = reg["name"]
+            c_type, n_bytes = _c_type(reg["n_bits"])
+            is_write = reg["type"] == "W"
+            code += f"""
+// {name}: {2**reg['log2n_items']} items of {reg['n_bits']} bits
+#define {prefix}_{name}_N {2**reg['log2n_items']}
+#define {prefix}_{name}_STRIDE {n_bytes}
+"""
+            code += _stride_check(prefix, name, regs)
+            item = (
+                f"(volatile {c_type} *)(base + {prefix}_{name}_ADDR"
+                f" + (first + i) * {prefix}_{name}_STRIDE)"
+            )
+            if is_write:
+                code += f"""// Write n items, starting at item `first`
+static inline void {prefix}_SET_{name}_BULK(uintptr_t base, const {c_type} *values, int first, int n) {{
+  for (int i = 0; i < n; i++)
+    *{item} = values[i];
+}}
+"""
+            else:
+                code += f"""// Read n items, starting at item `first`
+static inline void {prefix}_GET_{name}_BULK(uintptr_t base, {c_type} *values, int first, int n) {{
+  for (int i = 0; i < n; i++)
+    values[i] = *{item};
+}}
+"""
+    code += f"""
+#endif // H_{prefix}_BULK_H
+"""
+    return code
+
+
+def generate_bulk_header(prefix, regs, out_dir):
+    """Write `<prefix>_bulk.h` in out_dir"""
+    with open(os.path.join(out_dir, f"{prefix.lower()}_bulk.h"), "w") as f:
+        f.write(bulk_header(prefix, regs))
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# Incremental setup support for the SUT and Tester build directories.
+#
+# The setup regenerates the whole build directory, which makes every downstream
+# tool (Verilator, Vivado, Quartus, make) rebuild from scratch. This module keeps
+# a manifest in the build directory with:
+# - the fingerprint of the inputs of each generation step (sut_regs, portmap,
+#   confs, inserted Verilog snippets, uut_build.mk fragments, ...) and the files
+#   generated by the step;
+# - the content hash and mtime of every file written by the setup. Files written
+#   by other tools (simulator models, waveforms, logs, bitstreams) are not
+#   tracked.
+# Generation steps with unchanged inputs and outputs are skipped (see
+# `record_step`). After a setup:
+# - files whose contents did not change get their previous mtime back, so
+#   downstream builds stay incremental;
+# - files written by the previous setup but not by this one are removed.
+#
+# Usage from the command line (runs the setup command):
+#   ./setup_cache.py <build_dir> <setup command> [<args>...]
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import subprocess
+from collections.abc import Mapping
+
+MANIFEST_NAME = ".iob_setup_manifest.json"
+# Increase when the format of the manifest changes
+MANIFEST_VERSION = 2
+# Steps executed by the current setup (stored in the manifest by `finalize`)
+STEPS_NAME = ".iob_setup_steps.json"
+
+
+def _json_default(obj):
+    """Convert objects that json does not know about into stable representations"""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=repr)
+    if isinstance(obj, type):
+        return f"{obj.__module__}.{obj.__qualname__}"
+    if hasattr(obj, "__dict__"):
+        return {"__class__": type(obj).__qualname__, **vars(obj)}
+    return repr(obj)
+
+
+def fingerprint(*inputs):
+    """Return a stable hash of the given inputs.
+    inputs: python objects (lists, dicts, strings, ...) used by a generation step
+    """
+    data = json.dumps(inputs, sort_keys=True, default=_json_default)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def file_hash(path):
+    """Return the sha256 of the contents of the given file"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _load_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _save_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(build_dir):
+    """Load manifest of the previous setup of build_dir (empty if there is none)"""
+    manifest = _load_json(os.path.join(build_dir, MANIFEST_NAME), {})
+    if manifest.get("version") != MANIFEST_VERSION:
+        manifest = {}
+    manifest.setdefault("version", MANIFEST_VERSION)
+    manifest.setdefault("steps", {})
+    manifest.setdefault("files", {})
+    return manifest
+
+
+def _file_entry(path):
+    """Return manifest entry of the file (or symlink) in path"""
+    if os.path.islink(path):
+        return {"link": os.readlink(path)}
+    return {"sha": file_hash(path), "mtime_ns": os.stat(path).st_mtime_ns}
+
+
+def record_step(build_dir, step, *inputs, outputs=None):
+    """Store fingerprint of the inputs of a generation step, and the files it generates.
+    build_dir: build directory being generated
+    step: unique name of the generation step
+    inputs: objects that fully determine the outputs of the step
+    outputs: files generated by the step (relative to build_dir). They stay in the
+             build directory when the step is skipped or leaves them unchanged.
+    returns: True if the step must run: its inputs changed since the previous setup,
+             or one of its outputs is missing or was modified since.
+    """
+    if outputs is None:
+        outputs = []
+    fp = fingerprint(*inputs)
+    steps_path = os.path.join(build_dir, STEPS_NAME)
+    steps = _load_json(steps_path, {})
+    steps[step] = {"fingerprint": fp, "outputs": sorted(outputs)}
+    _save_json(steps_path, steps)
+    manifest = load_manifest(build_dir)
+    if manifest["steps"].get(step) != steps[step]:
+        return True
+    for output in outputs:
+        path = os.path.join(build_dir, output)
+        previous = manifest["files"].get(output)
+        if not previous or not os.path.lexists(path):
+            return True
+        current = _file_entry(path)
+        if (current.get("sha"), current.get("link")) != (
+            previous.get("sha"),
+            previous.get("link"),
+        ):
+            return True
+    return False
+
+
+def write_if_changed(path, data):
+    """Write data (str or bytes) to path, only if the file contents differ.
+    The file is written atomically.
+    returns: True if the file was written
+    """
+    mode = "b" if isinstance(data, bytes) else ""
+    if os.path.isfile(path):
+        with open(path, "r" + mode) as f:
+            if f.read() == data:
+                return False
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w" + mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def copy_if_changed(src, dst):
+    """Copy file src to dst, only if the contents differ (keeps file mode).
+    returns: True if the file was copied
+    """
+    with open(src, "rb") as f:
+        data = f.read()
+    written = write_if_changed(dst, data)
+    if written:
+        os.chmod(dst, os.stat(src).st_mode & 0o7777)
+    return written
+
+
+def append_if_missing(path, data):
+    """Append string data to file in path, unless the file already ends with it.
+    Keeps appends idempotent when the build directory is not cleaned between setups.
+    returns: True if data was appended
+    """
+    with open(path) as f:
+        if f.read().endswith(data):
+            return False
+    with open(path, "a") as f:
+        f.write(data)
+    return True
+
+
+def symlink_if_missing(target, link_name):
+    """Create symlink link_name -> target, unless it already exists"""
+    if os.path.islink(link_name) and os.readlink(link_name) == target:
+        return False
+    if os.path.lexists(link_name):
+        os.remove(link_name)
+    os.symlink(target, link_name)
+    return True
+
+
+def _setup_start_ns(build_dir):
+    """Return the file system time at the start of the setup.
+    Uses the ctime of a new file, as files written by the setup have a later ctime
+    (unlike mtime, it can not be preserved by copies).
+    """
+    parent_dir = os.path.dirname(os.path.abspath(build_dir))
+    fd, path = tempfile.mkstemp(prefix=".setup_start_", dir=parent_dir)
+    try:
+        return os.fstat(fd).st_ctime_ns
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def prepare(build_dir):
+    """Prepare the manifest of build_dir for a new setup.
+    The mtime of files modified after the previous setup is not restored, as
+    downstream tools may already have used the modified contents.
+    returns: start time of the setup (see `finalize`)
+    """
+    start_ns = _setup_start_ns(build_dir)
+    manifest = load_manifest(build_dir)
+    manifest["start_ns"] = start_ns
+    for relpath, entry in manifest["files"].items():
+        path = os.path.join(build_dir, relpath)
+        if "mtime_ns" in entry and (
+            not os.path.isfile(path) or os.stat(path).st_mtime_ns != entry["mtime_ns"]
+        ):
+            entry["mtime_ns"] = None
+    if os.path.isdir(build_dir):
+        _save_json(os.path.join(build_dir, MANIFEST_NAME), manifest)
+        if os.path.exists(os.path.join(build_dir, STEPS_NAME)):
+            os.remove(os.path.join(build_dir, STEPS_NAME))
+    return start_ns
+
+
+def _written_since(build_dir, start_ns):
+    """Return relative paths of the files and symlinks written after start_ns"""
+    written = set()
+    for root, dirs, files in os.walk(build_dir):
+        for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            path = os.path.join(root, name)
+            if os.lstat(path).st_ctime_ns >= start_ns:
+                written.add(os.path.relpath(path, build_dir))
+    return written
+
+
+def setup_files(build_dir):
+    """Return relative paths of the files of build_dir that belong to the setup: the
+    files written by the previous setup and the ones written so far by the current one.
+    returns: None if the current setup does not run through `setup_cache.py`, or if
+             there is no previous setup (any file of build_dir may be from the setup)
+    """
+    manifest = load_manifest(build_dir)
+    if manifest.get("start_ns") is None or not manifest["files"]:
+        return None
+    files = {
+        relpath
+        for relpath in manifest["files"]
+        if os.path.lexists(os.path.join(build_dir, relpath))
+    }
+    files |= _written_since(build_dir, manifest["start_ns"])
+    return files | {
+        name
+        for name in [MANIFEST_NAME, STEPS_NAME]
+        if os.path.exists(os.path.join(build_dir, name))
+    }
+
+
+def finalize(build_dir, start_ns):
+    """Restore mtimes of the files written by the setup whose contents did not change
+    since the previous setup, remove the files it no longer generates, and store the
+    new manifest.
+    start_ns: start time of the setup, returned by `prepare`
+    returns: (number of unchanged files, list of steps with changed inputs,
+              list of removed files)
+    """
+    manifest = load_manifest(build_dir)
+    steps = _load_json(os.path.join(build_dir, STEPS_NAME), {})
+    # Files written by the setup (and the outputs of the steps it skipped)
+    written = {
+        output
+        for step in steps.values()
+        for output in step["outputs"]
+        if os.path.lexists(os.path.join(build_dir, output))
+    }
+    written |= _written_since(build_dir, start_ns)
+    written -= {MANIFEST_NAME, STEPS_NAME}
+
+    new_files = {}
+    unchanged = 0
+    for relpath in sorted(written):
+        path = os.path.join(build_dir, relpath)
+        entry = _file_entry(path)
+        previous = manifest["files"].get(relpath, {})
+        if "sha" in entry and previous.get("sha") == entry["sha"]:
+            unchanged += 1
+            if previous.get("mtime_ns") not in (None, entry["mtime_ns"]):
+                os.utime(path, ns=(os.stat(path).st_atime_ns, previous["mtime_ns"]))
+                entry["mtime_ns"] = previous["mtime_ns"]
+        new_files[relpath] = entry
+
+    # Remove files of the previous setup that were not written by this one
+    removed = []
+    for relpath in sorted(manifest["files"].keys() - written):
+        path = os.path.join(build_dir, relpath)
+        if os.path.lexists(path) and os.lstat(path).st_ctime_ns < start_ns:
+            os.remove(path)
+            removed.append(relpath)
+
+    changed_steps = sorted(
+        step
+        for step, info in steps.items()
+        if manifest["steps"].get(step, {}).get("fingerprint") != info["fingerprint"]
+    )
+    _save_json(
+        os.path.join(build_dir, MANIFEST_NAME),
+        {"version": MANIFEST_VERSION, "steps": steps, "files": new_files},
+    )
+    if os.path.exists(os.path.join(build_dir, STEPS_NAME)):
+        os.remove(os.path.join(build_dir, STEPS_NAME))
+    return unchanged, changed_steps, removed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(f"Usage: {sys.argv[0]} <build_dir> <setup command> [<args>...]")
+        sys.exit(1)
+    build_dir = sys.argv[1]
+    start_ns = prepare(build_dir)
+    result = subprocess.run(sys.argv[2:])
+    if result.returncode:
+        sys.exit(result.returncode)
+    unchanged, changed_steps, removed = finalize(build_dir, start_ns)
+    print(f"Setup: {unchanged} unchanged files kept their timestamps.")
+    if changed_steps:
+        print("Setup: generation steps with new inputs: " + ", ".join(changed_steps))
+    if removed:
+        print("Setup: removed files no longer generated: " + ", ".join(removed))
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# Run a matrix of simulation variants concurrently.
+#
+# Each variant (a set of make variables, like INIT_MEM, TESTER, NO_ILA and
+# SIMULATOR) runs in its own build directory, so variants don't clean each
+# other's files. Variants that only differ in run-time variables (like
+# SIMULATOR) share one setup: the build directory is set up once and synced to
+# the build directories of the other variants. Setups and simulations run in
+# parallel, with up to `--jobs` processes at a time.
+#
+# At the end, a report with the time and result of each variant is printed and
+# stored in `<matrix dir>/sim_matrix_report.json`.
+#
+# Usage:
+#   ./sim_matrix.py [--jobs N] [--dir <matrix dir>] [variant ...]
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Variants of the CI workflow (.github/workflows/ci.yml)
+VARIANTS = {
+    "verilator-init_mem": {"SIMULATOR": "verilator"},
+    "verilator-no_init_mem": {"SIMULATOR": "verilator", "INIT_MEM": "0"},
+    "icarus-init_mem": {"SIMULATOR": "icarus"},
+    "tester-icarus-init_mem": {"TESTER": "1", "SIMULATOR": "icarus"},
+    "tester-verilator-init_mem": {"TESTER": "1", "SIMULATOR": "verilator"},
+    "tester-verilator-no_init_mem": {
+        "TESTER": "1",
+        "INIT_MEM": "0",
+        "SIMULATOR": "verilator",
+        "GRAB_TIMEOUT": "1800",
+    },
+}
+
+# Variables that change the generated build directory
+SETUP_VARS = ["INIT_MEM", "TESTER", "TESTER_ONLY", "NO_ILA", "RUN_LINUX", "AXIS_TDATA_W"]
+
+
+def setup_key(variables):
+    return tuple((var, variables[var]) for var in SETUP_VARS if var in variables)
+
+
+def sync_tree(src, dst):
+    """Copy build directory src to dst. Files with the same contents are not
+    copied, so they keep their timestamps (and the simulator does not rebuild them).
+    """
+    for root, dirs, files in os.walk(src):
+        out_root = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(out_root, exist_ok=True)
+        for name in dirs + files:
+            path = os.path.join(root, name)
+            out_path = os.path.join(out_root, name)
+            if os.path.islink(path):
+                if os.path.lexists(out_path):
+                    os.remove(out_path)
+                os.symlink(os.readlink(path), out_path)
+            elif name in files and not _same_file(path, out_path):
+                shutil.copy2(path, out_path)
+
+
+def _same_file(path, out_path):
+    if not os.path.isfile(out_path) or os.path.islink(out_path):
+        return False
+    if os.path.getsize(path) != os.path.getsize(out_path):
+        return False
+    with open(path, "rb") as f1, open(out_path, "rb") as f2:
+        return f1.read() == f2.read()
+
+
+def _make(args, log_path):
+    """Run make with args, appending output to log. returns: (exit code, seconds)"""
+    start = time.time()
+    with open(log_path, "a") as log:
+        log.write(f"$ make {' '.join(args)}\n")
+        log.flush()
+        result = subprocess.run(
+            ["make"] + args, stdout=log, stderr=subprocess.STDOUT, cwd=os.getcwd()
+        )
+    return result.returncode, time.time() - start
+
+
+def run_matrix(variants, matrix_dir, jobs):
+    os.makedirs(matrix_dir, exist_ok=True)
+    groups = {}
+    for name, variables in variants.items():
+        groups.setdefault(setup_key(variables), []).append(name)
+
+    results = {
+        name: {
+            "variables": variables,
+            "build_dir": os.path.join(matrix_dir, name),
+            "log": os.path.join(matrix_dir, f"{name}.log"),
+        }
+        for name, variables in variants.items()
+    }
+    for result in results.values():
+        open(result["log"], "w").close()
+
+    def run_group(key):
+        names = groups[key]
+        setup_dir = results[names[0]]["build_dir"]
+        setup_args = [f"{var}={val}" for var, val in key]
+        code, seconds = _make(
+            ["setup", f"BUILD_DIR={setup_dir}"] + setup_args,
+            results[names[0]]["log"],
+        )
+        for name in names:
+            results[name]["setup_s"] = seconds
+            results[name]["setup_shared_with"] = names[0]
+        if code:
+            for name in names:
+                results[name]["status"] = "setup failed"
+            return []
+        # Share setup with the other variants of the group
+        for name in names[1:]:
+            sync_tree(setup_dir, results[name]["build_dir"])
+        return names
+
+    def run_sim(name):
+        variables = results[name]["variables"]
+        code, seconds = _make(
+            ["-C", results[name]["build_dir"], "sim-run"]
+            + [f"{var}={val}" for var, val in variables.items()],
+            results[name]["log"],
+        )
+        results[name]["sim_s"] = seconds
+        results[name]["status"] = "failed" if code else "passed"
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        # Each group starts its simulations as soon as its setup is done
+        setups = [pool.submit(run_group, key) for key in groups]
+        sims = []
+        for setup in as_completed(setups):
+            sims += [pool.submit(run_sim, name) for name in setup.result()]
+        for sim in sims:
+            sim.result()
+    wall_s = time.time() - start
+
+    report = {
+        "wall_s": wall_s,
+        # Time to run all variants one after another, each with its own setup
+        "serial_s": sum(
+            r.get("setup_s", 0) + r.get("sim_s", 0) for r in results.values()
+        ),
+        "variants": results,
+    }
+    with open(os.path.join(matrix_dir, "sim_matrix_report.json"), "w") as f:
+        json.dump(report, f, indent=4)
+    return report
+
+
+def print_report(report):
+    print(f"{'Variant':32} {'Setup (s)':>10} {'Sim (s)':>10}  Status")
+    for name, result in report["variants"].items():
+        shared = result.get("setup_shared_with")
+        setup = f"{result.get('setup_s', 0):.0f}" + ("*" if shared != name else "")
+        print(
+            f"{name:32} {setup:>10} {result.get('sim_s', 0):10.0f}  {result.get('status', 'not run')}"
+        )
+    print("(*) Setup shared with another variant.")
+    print(
+        f"Wall clock: {report['wall_s']:.0f} s (one after another: {report['serial_s']:.0f} s)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run simulation variants in parallel"
+    )
+    parser.add_argument(
+        "variants",
+        nargs="*",
+        help=f"Variants to run (default: all of {list(VARIANTS)})",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Max parallel processes",
+    )
+    parser.add_argument(
+        "--dir",
+        default="../iob_soc_sut_matrix",
+        help="Directory of the build directories",
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.variants if name not in VARIANTS]
+    if unknown:
+        sys.exit(f"Unknown variants: {unknown}. Available: {list(VARIANTS)}")
+    selected = {name: VARIANTS[name] for name in args.variants or VARIANTS}
+    report = run_matrix(selected, os.path.abspath(args.dir), max(args.jobs, 1))
+    print_report(report)
+    sys.exit(any(r.get("status") != "passed" for r in report["variants"].values()))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# Report the simulation speed of the Tester+SUT system, in simulated cycles per second.
+#
+# Runs the given simulation command, printing its output. The Tester firmware
+# prints the number of clock cycles since reset at the end of the simulation
+# ("[Tester]: Simulated cycles: <n>"). The simulation speed is the number of
+# cycles divided by the wall-clock time of the command (build the simulation
+# model before, so that it is not included).
+#
+# Usage:
+#   ./sim_speed.py [--label <label>] <simulation command> ...
+# The result is also appended to `sim_speed.log`.
+import re
+import sys
+import time
+import subprocess
+
+CYCLES_RE = re.compile(r"\[Tester\]: Simulated cycles: (\d+)")
+
+
+def run(command):
+    """Run simulation command. returns: (exit code, simulated cycles, seconds)"""
+    cycles = None
+    start = time.time()
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    for line in process.stdout:
+        sys.stdout.write(line)
+        match = CYCLES_RE.search(line)
+        if match:
+            cycles = int(match.group(1))
+    process.wait()
+    return process.returncode, cycles, time.time() - start
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    label = ""
+    if args[:1] == ["--label"]:
+        label = args[1]
+        args = args[2:]
+    if not args:
+        sys.exit("Usage: sim_speed.py [--label <label>] <simulation command> ...")
+    code, cycles, seconds = run(args)
+    if code:
+        sys.exit(code)
+    if cycles is None:
+        sys.exit("Simulated cycles not found in the simulation output.")
+    result = f"{label}: " if label else ""
+    result += f"{cycles} cycles in {seconds:.1f} s: {cycles / seconds:.0f} cycles/s"
+    print(f"Simulation speed: {result}")
+    with open("sim_speed.log", "a") as log:
+        log.write(result + "\n")
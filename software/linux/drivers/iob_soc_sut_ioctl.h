@@ -0,0 +1,47 @@
+/* iob_soc_sut_ioctl.h: ioctl interface of the iob_soc_sut driver.
+ * Shared by the driver and the user space programs (copied next to them by the
+ * `build-driver-headers` target).
+ *
+ * IOB_SOC_SUT_IOC_BATCH runs a list of register accesses in one system call,
+ * without other accesses to the registers in between. The values of read
+ * accesses are returned in the same list.
+ *
+ * The device is pollable: POLLIN is reported when the AXI stream input of the
+ * Tester (AXISTREAMIN0, receiving the stream of the SUT) has data, signaled by
+ * its interrupt.
+ */
+#ifndef H_IOB_SOC_SUT_IOCTL_H
+#define H_IOB_SOC_SUT_IOCTL_H
+
+#include <linux/ioctl.h>
+#include <linux/types.h>
+
+#define IOB_SOC_SUT_OP_READ 0
+#define IOB_SOC_SUT_OP_WRITE 1
+
+// Max number of accesses of one batch
+#define IOB_SOC_SUT_BATCH_MAX 256
+
+// Register access
+struct iob_soc_sut_reg_op {
+  __u32 addr;  // byte address of the register
+  __u32 width; // width of the register in bits (8, 16 or 32)
+  __u32 op;    // IOB_SOC_SUT_OP_READ or IOB_SOC_SUT_OP_WRITE
+  __u32 value; // value to write, or value read
+};
+
+struct iob_soc_sut_batch {
+  __u64 ops;   // user pointer to array of struct iob_soc_sut_reg_op
+  __u32 n_ops; // number of accesses (up to IOB_SOC_SUT_BATCH_MAX)
+  __u32 n_done; // returned: number of accesses done
+};
+
+#define IOB_SOC_SUT_IOC_MAGIC 'S'
+#define IOB_SOC_SUT_IOC_BATCH                                                  \
+  _IOWR(IOB_SOC_SUT_IOC_MAGIC, 1, struct iob_soc_sut_batch)
+/* Acknowledge the AXI stream event reported by poll() (POLLIN), after reading
+ * the stream. The event is reported again while the stream FIFO has data.
+ */
+#define IOB_SOC_SUT_IOC_STREAM_ACK _IO(IOB_SOC_SUT_IOC_MAGIC, 2)
+
+#endif // H_IOB_SOC_SUT_IOCTL_H
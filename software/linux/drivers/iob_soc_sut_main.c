@@ -6,16 +6,24 @@
 
 #include <linux/cdev.h>
 #include <linux/fs.h>
+#include <linux/interrupt.h>
 #include <linux/io.h>
 #include <linux/ioport.h>
 #include <linux/kernel.h>
+#include <linux/mm.h>
 #include <linux/mod_devicetable.h>
 #include <linux/module.h>
 #include <linux/platform_device.h>
+#include <linux/poll.h>
+#include <linux/slab.h>
+#include <linux/spinlock.h>
 #include <linux/uaccess.h>
+#include <linux/version.h>
+#include <linux/wait.h>
 
 #include "iob_class/iob_class_utils.h"
 #include "iob_soc_sut.h"
+#include "iob_soc_sut_ioctl.h"
 
 static int iob_soc_sut_probe(struct platform_device *);
 static int iob_soc_sut_remove(struct platform_device *);
@@ -24,11 +32,28 @@ static ssize_t iob_soc_sut_read(struct file *, char __user *, size_t, loff_t *);
 static ssize_t iob_soc_sut_write(struct file *, const char __user *, size_t,
                                loff_t *);
 static loff_t iob_soc_sut_llseek(struct file *, loff_t, int);
+static int iob_soc_sut_mmap(struct file *, struct vm_area_struct *);
+static long iob_soc_sut_ioctl(struct file *, unsigned int, unsigned long);
+static __poll_t iob_soc_sut_poll(struct file *, struct poll_table_struct *);
 static int iob_soc_sut_open(struct inode *, struct file *);
 static int iob_soc_sut_release(struct inode *, struct file *);
 
 static struct iob_data iob_soc_sut_data = {0};
+// Physical address of the registers (mapped to user space by mmap)
+static phys_addr_t iob_soc_sut_regphys;
 DEFINE_MUTEX(iob_soc_sut_mutex);
+// Serializes register accesses of read, write and ioctl (batches are atomic)
+static DEFINE_SPINLOCK(iob_soc_sut_reg_lock);
+
+/* AXI stream event (interrupt of the AXI stream input that receives the SUT
+ * stream). The interrupt is level triggered and can only be cleared by reading
+ * the stream, so it is disabled when it fires, until the user acknowledges it.
+ */
+static int iob_soc_sut_irq = -1;
+static bool iob_soc_sut_stream_ready = false;
+static bool iob_soc_sut_irq_disabled = false;
+static DEFINE_SPINLOCK(iob_soc_sut_irq_lock);
+static DECLARE_WAIT_QUEUE_HEAD(iob_soc_sut_stream_wq);
 
 #include "iob_soc_sut_sysfs.h"
 
@@ -37,6 +62,9 @@ static const struct file_operations iob_soc_sut_fops = {
     .write = iob_soc_sut_write,
     .read = iob_soc_sut_read,
     .llseek = iob_soc_sut_llseek,
+    .mmap = iob_soc_sut_mmap,
+    .unlocked_ioctl = iob_soc_sut_ioctl,
+    .poll = iob_soc_sut_poll,
     .open = iob_soc_sut_open,
     .release = iob_soc_sut_release,
 };
@@ -57,6 +85,18 @@ static struct platform_driver iob_soc_sut_driver = {
     .remove = iob_soc_sut_remove,
 };
 
+static irqreturn_t iob_soc_sut_irq_handler(int irq, void *dev_id) {
+  spin_lock(&iob_soc_sut_irq_lock);
+  disable_irq_nosync(irq);
+  iob_soc_sut_irq_disabled = true;
+  iob_soc_sut_stream_ready = true;
+  spin_unlock(&iob_soc_sut_irq_lock);
+
+  wake_up_interruptible(&iob_soc_sut_stream_wq);
+
+  return IRQ_HANDLED;
+}
+
 //
 // Module init and exit functions
 //
@@ -87,6 +127,22 @@ static int iob_soc_sut_probe(struct platform_device *pdev) {
     goto r_ioremmap;
   }
   iob_soc_sut_data.regsize = resource_size(res);
+  iob_soc_sut_regphys = res->start;
+
+  // AXI stream interrupt is optional (without it, poll always reports data)
+  iob_soc_sut_irq = platform_get_irq_optional(pdev, 0);
+  if (iob_soc_sut_irq > 0) {
+    result = devm_request_irq(&pdev->dev, iob_soc_sut_irq,
+                              iob_soc_sut_irq_handler, 0,
+                              IOB_SOC_SUT_DRIVER_NAME, NULL);
+    if (result) {
+      pr_err("[Driver] %s: Failed to request IRQ %d!\n",
+             IOB_SOC_SUT_DRIVER_NAME, iob_soc_sut_irq);
+      goto r_ioremmap;
+    }
+  } else {
+    iob_soc_sut_irq = -1;
+  }
 
   // Alocate char device
   result =
@@ -198,8 +254,10 @@ static ssize_t iob_soc_sut_read(struct file *file, char __user *buf, size_t coun
                               loff_t *ppos) {
   int size = 0;
   u32 value = 0;
+  unsigned long flags;
 
   /* read value from register */
+  spin_lock_irqsave(&iob_soc_sut_reg_lock, flags);
   switch (*ppos) {
   case IOB_SOC_SUT_REG3_ADDR:
     value = iob_data_read_reg(iob_soc_sut_data.regbase, IOB_SOC_SUT_REG3_ADDR,
@@ -226,9 +284,11 @@ static ssize_t iob_soc_sut_read(struct file *file, char __user *buf, size_t coun
     pr_info("[Driver] Read version!\n");
     break;
   default:
+    spin_unlock_irqrestore(&iob_soc_sut_reg_lock, flags);
     // invalid address - no bytes read
     return 0;
   }
+  spin_unlock_irqrestore(&iob_soc_sut_reg_lock, flags);
 
   // Read min between count and REG_SIZE
   if (size > count)
@@ -244,22 +304,27 @@ static ssize_t iob_soc_sut_write(struct file *file, const char __user *buf,
                                size_t count, loff_t *ppos) {
   int size = 0;
   u32 value = 0;
+  unsigned long flags;
 
   switch (*ppos) {
   case IOB_SOC_SUT_REG1_ADDR:
     size = (IOB_SOC_SUT_REG1_W >> 3); // bit to bytes
     if (read_user_data(buf, size, &value))
       return -EFAULT;
+    spin_lock_irqsave(&iob_soc_sut_reg_lock, flags);
     iob_data_write_reg(iob_soc_sut_data.regbase, value, IOB_SOC_SUT_REG1_ADDR,
                        IOB_SOC_SUT_REG1_W);
+    spin_unlock_irqrestore(&iob_soc_sut_reg_lock, flags);
     pr_info("[Driver] REG1 iob_soc_sut: 0x%x\n", value);
     break;
   case IOB_SOC_SUT_REG2_ADDR:
     size = (IOB_SOC_SUT_REG2_W >> 3); // bit to bytes
     if (read_user_data(buf, size, &value))
       return -EFAULT;
+    spin_lock_irqsave(&iob_soc_sut_reg_lock, flags);
     iob_data_write_reg(iob_soc_sut_data.regbase, value, IOB_SOC_SUT_REG2_ADDR,
                        IOB_SOC_SUT_REG2_W);
+    spin_unlock_irqrestore(&iob_soc_sut_reg_lock, flags);
     pr_info("[Driver] REG2 iob_soc_sut: 0x%x\n", value);
     break;
   default:
@@ -302,6 +367,127 @@ static loff_t iob_soc_sut_llseek(struct file *filp, loff_t offset, int whence) {
   return new_pos;
 }
 
+// Clear AXI stream event and enable the interrupt again
+static long iob_soc_sut_stream_ack(void) {
+  unsigned long flags;
+
+  spin_lock_irqsave(&iob_soc_sut_irq_lock, flags);
+  iob_soc_sut_stream_ready = false;
+  if (iob_soc_sut_irq_disabled) {
+    iob_soc_sut_irq_disabled = false;
+    enable_irq(iob_soc_sut_irq);
+  }
+  spin_unlock_irqrestore(&iob_soc_sut_irq_lock, flags);
+
+  return 0;
+}
+
+static __poll_t iob_soc_sut_poll(struct file *file,
+                                 struct poll_table_struct *wait) {
+  __poll_t mask = 0;
+  unsigned long flags;
+
+  if (iob_soc_sut_irq < 0)
+    return EPOLLIN | EPOLLRDNORM;
+
+  poll_wait(file, &iob_soc_sut_stream_wq, wait);
+
+  spin_lock_irqsave(&iob_soc_sut_irq_lock, flags);
+  if (iob_soc_sut_stream_ready)
+    mask |= EPOLLIN | EPOLLRDNORM;
+  spin_unlock_irqrestore(&iob_soc_sut_irq_lock, flags);
+
+  return mask;
+}
+
+/* Run a batch of register accesses (see iob_soc_sut_ioctl.h).
+ * All accesses are checked first, then run with the register lock held once.
+ */
+static long iob_soc_sut_ioctl(struct file *file, unsigned int cmd,
+                              unsigned long arg) {
+  struct iob_soc_sut_batch batch;
+  struct iob_soc_sut_reg_op *ops;
+  void __user *user_ops;
+  unsigned long flags;
+  u32 i, bytes;
+  long result = 0;
+
+  if (cmd == IOB_SOC_SUT_IOC_STREAM_ACK)
+    return iob_soc_sut_stream_ack();
+  if (cmd != IOB_SOC_SUT_IOC_BATCH)
+    return -ENOTTY;
+
+  if (copy_from_user(&batch, (void __user *)arg, sizeof(batch)))
+    return -EFAULT;
+  if (batch.n_ops == 0 || batch.n_ops > IOB_SOC_SUT_BATCH_MAX)
+    return -EINVAL;
+
+  user_ops = u64_to_user_ptr(batch.ops);
+  ops = memdup_user(user_ops, batch.n_ops * sizeof(*ops));
+  if (IS_ERR(ops))
+    return PTR_ERR(ops);
+
+  for (i = 0; i < batch.n_ops; i++) {
+    bytes = ops[i].width >> 3;
+    if ((bytes != 1 && bytes != 2 && bytes != 4) || ops[i].addr % bytes ||
+        ops[i].addr + bytes > iob_soc_sut_data.regsize ||
+        ops[i].op > IOB_SOC_SUT_OP_WRITE) {
+      result = -EINVAL;
+      goto r_free;
+    }
+  }
+
+  spin_lock_irqsave(&iob_soc_sut_reg_lock, flags);
+  for (i = 0; i < batch.n_ops; i++) {
+    if (ops[i].op == IOB_SOC_SUT_OP_WRITE)
+      iob_data_write_reg(iob_soc_sut_data.regbase, ops[i].value, ops[i].addr,
+                         ops[i].width);
+    else
+      ops[i].value = iob_data_read_reg(iob_soc_sut_data.regbase, ops[i].addr,
+                                       ops[i].width);
+  }
+  spin_unlock_irqrestore(&iob_soc_sut_reg_lock, flags);
+
+  batch.n_done = batch.n_ops;
+  if (copy_to_user(user_ops, ops, batch.n_ops * sizeof(*ops)) ||
+      copy_to_user((void __user *)arg, &batch, sizeof(batch)))
+    result = -EFAULT;
+
+r_free:
+  kfree(ops);
+
+  return result;
+}
+
+/* Map the registers to user space, uncached.
+ * Each register access of the user is a single load/store, instead of a
+ * read/write system call.
+ */
+static int iob_soc_sut_mmap(struct file *file, struct vm_area_struct *vma) {
+  unsigned long size = vma->vm_end - vma->vm_start;
+
+  if (vma->vm_pgoff != 0 || size > PAGE_ALIGN(iob_soc_sut_data.regsize))
+    return -EINVAL;
+
+  // Registers are mapped by whole pages
+  if (iob_soc_sut_regphys & ~PAGE_MASK) {
+    pr_err("[Driver] %s: registers are not page aligned, can not mmap\n",
+           IOB_SOC_SUT_DRIVER_NAME);
+    return -ENXIO;
+  }
+
+  vma->vm_page_prot = pgprot_noncached(vma->vm_page_prot);
+#if LINUX_VERSION_CODE >= KERNEL_VERSION(6, 3, 0)
+  vm_flags_set(vma, VM_IO | VM_DONTEXPAND | VM_DONTDUMP);
+#else
+  vma->vm_flags |= VM_IO | VM_DONTEXPAND | VM_DONTDUMP;
+#endif
+
+  return io_remap_pfn_range(vma, vma->vm_start,
+                            iob_soc_sut_regphys >> PAGE_SHIFT, size,
+                            vma->vm_page_prot);
+}
+
 module_init(iob_soc_sut_init);
 module_exit(iob_soc_sut_exit);
 
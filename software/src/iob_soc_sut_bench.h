@@ -0,0 +1,53 @@
+/*
+ * Throughput and latency benchmark of the links between the Tester and the SUT
+ * (BENCHMARK setup of the Tester).
+ *
+ * Paths measured, with the Tester as the source of the data:
+ * - uart: Tester UART1 to SUT UART0;
+ * - eth: Tester ETH1 to SUT ETH0 (`eth_send_file()`/`eth_rcv_file()`);
+ * - axis: Tester AXISTREAMOUT0 (loaded by DMA0) to SUT AXISTREAMIN0, in one
+ *   packet;
+ * - axis_queue: same, in BENCH_AXIS_PACKETS packets, through the DMA packet
+ *   queue of the Tester (same BENCH_CMD_AXIS command);
+ * - regfileif_write/regfileif_read: SUT registers (DATA_IN/DATA_OUT arrays);
+ * - shmem_write/shmem_read: SUT memory, accessed by the Tester through the
+ *   shared memory zone (MEM_ADDR_OFFSET);
+ * - mbox: Tester to SUT ring of the shared memory mailbox
+ *   (iob_soc_sut_mailbox.h).
+ *
+ * The SUT serves the benchmark before its main test (`bench_serve()`), while
+ * the Tester sends commands via UART1:
+ * 1) Tester sends a command byte and the payload size (4 bytes, little endian).
+ * 2) SUT replies ACK when ready to receive. BENCH_CMD_ADDR replies the address
+ *    of the SUT benchmark buffer (4 bytes) after the ACK.
+ * 3) Tester starts the timer and sends the payload via the selected path.
+ * 4) SUT replies ACK once it received the whole payload. The Tester stops the
+ *    timer: the time includes that ACK (one UART character).
+ * BENCH_CMD_DONE ends the benchmark. The register and shared memory paths
+ * don't need the SUT.
+ *
+ * The Tester prints one line per measurement, parsed by `link_bench.py`:
+ *   [Tester]: BENCH path=<path> size=<bytes> cycles=<clock cycles>
+ */
+#ifndef H_IOB_SOC_SUT_BENCH_H
+#define H_IOB_SOC_SUT_BENCH_H
+
+#include <stdint.h>
+
+#define BENCH_CMD_ADDR 0xb0
+#define BENCH_CMD_UART 0xb1
+#define BENCH_CMD_ETH 0xb2
+#define BENCH_CMD_AXIS 0xb3
+#define BENCH_CMD_MBOX 0xb4
+#define BENCH_CMD_DONE 0xbf
+
+// Payload sizes of the sweep, in bytes (multiples of 4)
+#define BENCH_SIZES {4, 16, 64, 256, 1024, 4096}
+// Size of the SUT benchmark buffer (largest payload)
+#define BENCH_MAX_SIZE 4096
+// UART path is much slower: don't sweep larger payloads
+#define BENCH_UART_MAX_SIZE 256
+// Packets of the axis_queue path
+#define BENCH_AXIS_PACKETS 4
+
+#endif // H_IOB_SOC_SUT_BENCH_H
@@ -10,6 +10,7 @@
 
 #if __has_include("iob_soc_tester_conf.h")
 #define USE_TESTER
+#include "iob_soc_sut_xfer.h"
 #endif
 
 #define PROGNAME "IOb-Bootloader"
@@ -58,6 +59,63 @@ uint32_t uart_recvfile_ethernet(char *file_name) {
   return file_size;
 }
 
+#ifdef USE_TESTER
+// Receive file from the Tester.
+// A bare-metal Tester sends it in chunks via ethernet (see iob_soc_sut_xfer.h);
+// a Tester running Linux sends it via UART.
+uint32_t tester_recvfile_ethernet(char *file_name, char *mem) {
+  uint32_t file_size, n_chunks, index, size;
+  sut_xfer_trailer_t trailer;
+  char saved[sizeof(sut_xfer_trailer_t)];
+  char *chunk;
+
+  uart16550_puts(PROGNAME);
+  uart16550_puts(": requesting to receive file from Tester\n");
+
+  // send file receive request and file name (including end of string)
+  uart16550_putc(FRX);
+  uart16550_puts(file_name); uart16550_putc(0);
+
+  // receive file size
+  file_size = sut_xfer_get_u32(&uart16550_getc);
+
+  // send ACK before receiving file
+  uart16550_putc(ACK);
+
+  if (!(file_size & SUT_XFER_ETH_FLAG)) {
+    for (index = 0; index < file_size; index++)
+      mem[index] = uart16550_getc();
+    return file_size;
+  }
+  file_size &= ~SUT_XFER_ETH_FLAG;
+  n_chunks = sut_xfer_n_chunks(file_size);
+
+  for (index = 0; index < n_chunks;) {
+    chunk = mem + index * SUT_XFER_CHUNK_SIZE;
+    size = sut_xfer_chunk_size(file_size, index);
+    // The trailer is received after the chunk contents, so save the memory
+    // it overwrites (beginning of next chunk or data after the file).
+    memcpy(saved, chunk + size, sizeof(saved));
+    eth_rcv_file(chunk, size + sizeof(trailer));
+    memcpy(&trailer, chunk + size, sizeof(trailer));
+    memcpy(chunk + size, saved, sizeof(saved));
+
+    if (trailer.magic == SUT_XFER_MAGIC && trailer.index == index &&
+        trailer.size == size &&
+        trailer.crc == sut_xfer_crc32((uint8_t *)chunk, size)) {
+      index++;
+      uart16550_putc(ACK);
+    } else {
+      uart16550_putc(NAK);
+    }
+    // request next chunk
+    sut_xfer_put_u32(&uart16550_putc, index);
+  }
+
+  return file_size;
+}
+#endif //USE_TESTER
+
 int main() {
   int i;
   int run_linux = 0;
@@ -111,7 +169,11 @@ int main() {
   // Wait for PHY reset to finish
   eth_wait_phy_rst();
 
+#ifdef USE_TESTER
+  file_size = tester_recvfile_ethernet("../iob_soc_sut_mem.config", prog_start_addr);
+#else
   file_size = uart16550_recvfile("../iob_soc_sut_mem.config", prog_start_addr);
+#endif
   // compute_mem_load_txt
   int state = 0;
   int file_name_count = 0;
@@ -156,8 +218,11 @@ int main() {
 
   for (i = 0; i < file_count; i++) {
     prog_start_addr = (char *)(EXT_MEM + file_address_array[i]);
-    // Receive data from console via Ethernet (only on fpga without tester)
-#if !defined(SIMULATION) && !defined(USE_TESTER)
+#if defined(USE_TESTER)
+    // Receive data from Tester via Ethernet
+    file_size = tester_recvfile_ethernet(file_name_array[i], prog_start_addr);
+#elif !defined(SIMULATION)
+    // Receive data from console via Ethernet (only on fpga)
     file_size = uart_recvfile_ethernet(file_name_array[i]);
     eth_rcv_file(prog_start_addr,file_size);
 #else
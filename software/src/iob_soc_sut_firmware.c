@@ -10,13 +10,36 @@
 #include "iob-eth.h"
 #include "printf.h"
 #include "iob_regfileif_inverted_swreg.h"
+#include "iob_regfileif_inverted_bulk.h"
 #include "iob-axistream-in.h"
 #include "iob-axistream-out.h"
+#include "iob_soc_sut_irq.h"
+#include "iob_soc_sut_phases.h"
+#include "iob_soc_sut_mailbox.h"
 #if __has_include("iob_soc_tester_conf.h")
 #define USE_TESTER
+#include "iob_soc_tester_conf.h"
+#ifdef IOB_SOC_TESTER_BENCHMARK
+#define USE_BENCHMARK
+#include "iob_soc_sut_bench.h"
+#include "iob_soc_sut_xfer.h"
+#endif
 #endif
 
 void axistream_loopback();
+void bench_serve();
+void mailbox_init();
+void mailbox_echo();
+
+// PLIC source of the AXISTREAMIN0 interrupt
+#define AXISTREAMIN0_IRQ 2
+// Max time to wait for AXI stream data (scaled like the Tester's delays)
+#define AXISTREAM_WAIT_TIMEOUT ((FREQ / BAUD) * 4096)
+// 32-bit words of each AXI stream beat (TDATA_W bits). The NWORDS registers
+// of the AXI stream peripherals count beats.
+#define AXIS_BEAT_WORDS (IOB_SOC_SUT_AXIS_TDATA_W / 32)
+// Max number of polls of the mailbox rings without progress
+#define MBOX_WAIT_POLLS ((FREQ / BAUD) * 4096)
 
 void clear_cache(){
   // Delay to ensure all data is written to memory
@@ -57,12 +80,21 @@ int main()
   char buffer[64];
   char file_buffer[256];
   int ethernet_connected = 0;
+  uint32_t data_words[IOB_REGFILEIF_INVERTED_DATA_IN_N];
+  int phase;
+
+  // Record phase timing (read by the Tester via the PHASES register)
+  phases_init(PHASE_CORE_SUT);
+  phase = phase_begin("init");
 
   //init uart
   uart16550_init(UART0_BASE, FREQ/(16*BAUD));
   printf_init(&uart16550_putc);
   //init regfileif
   IOB_REGFILEIF_INVERTED_INIT_BASEADDR(REGFILEIF0_BASE);
+  IOB_REGFILEIF_INVERTED_SET_PHASES((uint32_t)&phase_table);
+  // Shared memory mailbox with the Tester
+  mailbox_init();
   //init gpio
   gpio_init(GPIO0_BASE);   
   //init axistream
@@ -72,10 +104,21 @@ int main()
   IOB_AXISTREAM_OUT_SET_ENABLE(1);
   // init eth
   eth_init(ETH0_BASE, &clear_cache);
+  phase_end(phase);
 
   // Wait for PHY reset to finish
+  phase = phase_begin("phy_reset");
   eth_wait_phy_rst();
+  phase_end(phase);
+
+#ifdef USE_BENCHMARK
+  // Serve the link benchmark of the Tester before the test
+  phase = phase_begin("bench");
+  bench_serve();
+  phase_end(phase);
+#endif
 
+  phase = phase_begin("tester_handshake");
 #ifdef USE_TESTER
   // Receive a special string message from tester to tell if its running linux
   char tester_run_type[] = "TESTER_RUN_";
@@ -118,6 +161,7 @@ int main()
     uart16550_putc(file_buffer[i]);
 #endif //SIMULATION
 #endif //USE_TESTER
+  phase_end(phase);
 
   uart16550_puts("\n\n\n[SUT]: Hello world!\n\n\n");
 
@@ -131,6 +175,7 @@ int main()
     uart16550_putc('\n'); uart16550_putc('\n');
   }
   
+  phase = phase_begin("regfileif_gpio");
   //Print contents of REGFILEIF registers 1 and 2
   uart16550_puts("[SUT]: Reading REGFILEIF contents:\n");
   printf("[SUT]: Register 1: %d \n", IOB_REGFILEIF_INVERTED_GET_REG1());
@@ -140,6 +185,17 @@ int main()
   IOB_REGFILEIF_INVERTED_SET_REG3(128);
   IOB_REGFILEIF_INVERTED_SET_REG4(2048);
   uart16550_puts("[SUT]: Stored values 128 and 2048 in REGFILEIF registers 3 and 4.\n\n");
+
+  //Read the DATA_IN register array in one burst and return each word incremented in DATA_OUT.
+  IOB_REGFILEIF_INVERTED_GET_DATA_IN_BULK(REGFILEIF0_BASE, data_words, 0, IOB_REGFILEIF_INVERTED_DATA_IN_N);
+  uart16550_puts("[SUT]: REGFILEIF register array DATA_IN:");
+  for(i=0; i<IOB_REGFILEIF_INVERTED_DATA_IN_N; i++){
+    printf(" 0x%x", data_words[i]);
+    data_words[i]++;
+  }
+  uart16550_putc('\n');
+  IOB_REGFILEIF_INVERTED_SET_DATA_OUT_BULK(REGFILEIF0_BASE, data_words, 0, IOB_REGFILEIF_INVERTED_DATA_OUT_N);
+  uart16550_puts("[SUT]: Stored incremented words in REGFILEIF register array DATA_OUT.\n\n");
   
   //Print contents of GPIO inputs 
   printf("[SUT]: Pattern read from GPIO inputs: 0x%x\n\n",gpio_get());
@@ -148,8 +204,17 @@ int main()
   gpio_set(0xabcd1234);
   uart16550_puts("[SUT]: Placed test pattern 0xabcd1234 in GPIO outputs.\n\n");
 
+  phase_end(phase);
+
   // Read AXI stream input and relay data to AXI stream output
+  phase = phase_begin("axistream_loopback");
   axistream_loopback();
+  phase_end(phase);
+
+  // Reply to the mailbox message of the Tester
+  phase = phase_begin("mailbox_echo");
+  mailbox_echo();
+  phase_end(phase);
 
   char sutMemoryMessage[]="This message is stored in SUT's memory\n";
 
@@ -166,36 +231,115 @@ int main()
 }
 
 
-// Read AXI stream input, print, and relay data to AXI stream output
+// Relay AXI stream input to AXI stream output, in hardware: in DMA mode, the
+// input FIFO feeds the output FIFO directly (connected in iob_soc_sut.py), and
+// the output asserts TLAST after NWORDS words. The Tester stores the length of
+// the packet in the AXIS_NWORDS register before sending it.
 void axistream_loopback(){
-  uint32_t byte_stream[16] = {0};
-  uint8_t i, received_words;
-  
-  //Check if we are receiving an AXI stream
-  if(!IOB_AXISTREAM_IN_GET_FIFO_EMPTY()){
-    // Read up to NWORD 32-bit words, or up to 16 32-bit words
-    received_words = IOB_AXISTREAM_IN_GET_NWORDS();
-    for(i=0; i<received_words && i<16; i++){
-      byte_stream[i] = IOB_AXISTREAM_IN_GET_DATA();
-    }
-    
-    // Print received bytes
-    // uart16550_puts("[SUT]: Received AXI stream bytes: ");
-    printf("[SUT]: Received AXI stream %d bytes: %d\n\n",received_words*4);
-    // for(i=0;i<received_words*4;i++)
-    //   printf("0x%02x ", ((uint8_t *)byte_stream)[i]);
-    for(i=0;i<received_words;i++)
-      printf("0x%08x ", byte_stream[i]);
-
-    // Send bytes to AXI stream output
-    IOB_AXISTREAM_OUT_SET_NWORDS(received_words);
-    for(i=0;i<received_words;i++)
-      iob_axis_write(byte_stream[i]);
-
-    uart16550_puts("\n[SUT]: Sent AXI stream bytes back via output interface.\n\n");
+  uint32_t n_words;
+
+  //Wait for AXI stream data (sleeps until the AXISTREAMIN0 interrupt)
+  if(axistream_in_wait(AXISTREAMIN0_IRQ, AXISTREAM_WAIT_TIMEOUT)){
+    n_words = IOB_REGFILEIF_INVERTED_GET_AXIS_NWORDS();
+    printf("[SUT]: Received AXI stream packet of %d bytes.\n", n_words*4);
+
+    // Send packet back via the hardware loopback, one word per clock. The
+    // loopback stays enabled: the stream is not used afterwards.
+    IOB_AXISTREAM_OUT_SET_NWORDS(n_words / AXIS_BEAT_WORDS);
+    IOB_AXISTREAM_OUT_SET_MODE(1);
+    IOB_AXISTREAM_IN_SET_MODE(1);
+
+    uart16550_puts("[SUT]: Sent AXI stream bytes back via output interface.\n\n");
   } else {
     // Input AXI stream queue is empty
     uart16550_puts("[SUT]: AXI stream input is empty. Skipping AXI stream tranfer.\n\n");
   }
 
 }
+
+// Mailbox with the Tester, in shared memory (see iob_soc_sut_mailbox.h)
+static mbox_shared_t mbox_shared;
+// Tester to SUT (rx) and SUT to Tester (tx) rings
+static mbox_ring_t mbox_rx, mbox_tx;
+
+static uint32_t mbox_t2s_head() { return IOB_REGFILEIF_INVERTED_GET_T2S_HEAD(); }
+static void mbox_t2s_tail(uint32_t value) { IOB_REGFILEIF_INVERTED_SET_T2S_TAIL(value); }
+static uint32_t mbox_s2t_tail() { return IOB_REGFILEIF_INVERTED_GET_S2T_TAIL(); }
+static void mbox_s2t_head(uint32_t value) { IOB_REGFILEIF_INVERTED_SET_S2T_HEAD(value); }
+
+// Initialize mailbox and publish its address to the Tester
+void mailbox_init(){
+  mbox_shared.magic = MBOX_MAGIC;
+  mbox_shared.ring_size = MBOX_RING_SIZE;
+  mbox_ring_init(&mbox_rx, mbox_shared.t2s, &mbox_t2s_head, &mbox_t2s_tail,
+                 &clear_cache);
+  mbox_ring_init(&mbox_tx, mbox_shared.s2t, &mbox_s2t_tail, &mbox_s2t_head,
+                 &clear_cache);
+  clear_cache();
+  IOB_REGFILEIF_INVERTED_SET_MBOX_BASE((uint32_t)&mbox_shared);
+}
+
+// Reply to the echo message of the Tester: each byte of the payload + 1
+void mailbox_echo(){
+  static uint8_t payload[MBOX_ECHO_SIZE];
+  uint32_t size = 0, i;
+
+  if (mbox_read_all(&mbox_rx, &size, 4, MBOX_WAIT_POLLS) != 4 ||
+      size > MBOX_ECHO_SIZE) {
+    uart16550_puts("[SUT]: No mailbox message from Tester.\n\n");
+    return;
+  }
+  mbox_read_all(&mbox_rx, payload, size, MBOX_WAIT_POLLS);
+  for (i = 0; i < size; i++)
+    payload[i]++;
+  mbox_write_all(&mbox_tx, &size, 4, MBOX_WAIT_POLLS);
+  mbox_write_all(&mbox_tx, payload, size, MBOX_WAIT_POLLS);
+  printf("[SUT]: Replied to mailbox message of %d bytes.\n\n", size);
+}
+
+#ifdef USE_BENCHMARK
+// Receives the payloads of the link benchmark
+static uint32_t bench_buffer[BENCH_MAX_SIZE / 4];
+
+// Serve benchmark commands of the Tester (see iob_soc_sut_bench.h)
+void bench_serve(){
+  uint8_t cmd;
+  uint32_t size, i, j;
+
+  while ((cmd = uart16550_getc()) != BENCH_CMD_DONE) {
+    size = sut_xfer_get_u32(&uart16550_getc);
+    if (size > BENCH_MAX_SIZE)
+      size = BENCH_MAX_SIZE;
+    // Ready to receive
+    uart16550_putc(ACK);
+
+    switch (cmd) {
+    case BENCH_CMD_ADDR:
+      sut_xfer_put_u32(&uart16550_putc, (uint32_t)bench_buffer);
+      continue;
+    case BENCH_CMD_UART:
+      for (i = 0; i < size; i++)
+        ((uint8_t *)bench_buffer)[i] = uart16550_getc();
+      break;
+    case BENCH_CMD_ETH:
+      eth_rcv_file((char *)bench_buffer, size);
+      break;
+    case BENCH_CMD_AXIS:
+      // Read the payload one beat (AXIS_BEAT_WORDS words) at a time. Stop
+      // waiting if the stream stalls, so that the benchmark does not hang.
+      for (i = 0; i < size / 4; i += AXIS_BEAT_WORDS) {
+        if (!axistream_in_wait(AXISTREAMIN0_IRQ, AXISTREAM_WAIT_TIMEOUT))
+          break;
+        for (j = 0; j < AXIS_BEAT_WORDS; j++)
+          bench_buffer[i + j] = IOB_AXISTREAM_IN_GET_DATA();
+      }
+      break;
+    case BENCH_CMD_MBOX:
+      mbox_read_all(&mbox_rx, bench_buffer, size, MBOX_WAIT_POLLS);
+      break;
+    }
+    // Payload received
+    uart16550_putc(ACK);
+  }
+}
+#endif
@@ -0,0 +1,112 @@
+/*
+ * Wait for AXI stream input data with interrupts, instead of busy-waiting.
+ *
+ * The interrupt of the AXISTREAMIN0 peripheral is connected to the PLIC (source
+ * 2 in the SUT, source 3 in the Tester). `axistream_in_wait()` enables it and
+ * sleeps with `wfi` until data arrives, or until the CLINT timer reaches the
+ * timeout. Interrupts stay globally disabled (mstatus.MIE): `wfi` resumes when
+ * an enabled interrupt is pending, without taking a trap, so no trap handler is
+ * needed.
+ *
+ * Without the PLIC0 and CLINT0 peripherals, it polls the FIFO until the timeout
+ * (counted in mcycle clock cycles).
+ *
+ * The CLINT timer compare value and the PLIC enable bits are restored on return.
+ *
+ * Include after "iob-axistream-in.h" and the system peripherals header.
+ */
+#ifndef H_IOB_SOC_SUT_IRQ_H
+#define H_IOB_SOC_SUT_IRQ_H
+
+#include <stdint.h>
+#include "iob_soc_sut_mcycle.h"
+
+#define IRQ_REG(addr) (*(volatile uint32_t *)(addr))
+
+// PLIC registers of context 0 (machine mode of hart 0)
+#define PLIC_PRIORITY(base, id) IRQ_REG((base) + 4 * (id))
+#define PLIC_ENABLE(base) IRQ_REG((base) + 0x2000)
+#define PLIC_THRESHOLD(base) IRQ_REG((base) + 0x200000)
+#define PLIC_CLAIM(base) IRQ_REG((base) + 0x200004)
+
+// CLINT machine timer registers of hart 0
+#define CLINT_MTIMECMP_LO(base) IRQ_REG((base) + 0x4000)
+#define CLINT_MTIMECMP_HI(base) IRQ_REG((base) + 0x4004)
+#define CLINT_MTIME_LO(base) IRQ_REG((base) + 0xbff8)
+#define CLINT_MTIME_HI(base) IRQ_REG((base) + 0xbffc)
+
+// mie bits: machine timer and machine external interrupts
+#define MIE_MTIE (1 << 7)
+#define MIE_MEIE (1 << 11)
+
+#if defined(PLIC0_BASE) && defined(CLINT0_BASE)
+static inline uint64_t irq_read_mtime() {
+  uint32_t lo, hi;
+  do {
+    hi = CLINT_MTIME_HI(CLINT0_BASE);
+    lo = CLINT_MTIME_LO(CLINT0_BASE);
+  } while (hi != CLINT_MTIME_HI(CLINT0_BASE));
+  return ((uint64_t)hi << 32) | lo;
+}
+
+static inline uint64_t irq_get_mtimecmp() {
+  return ((uint64_t)CLINT_MTIMECMP_HI(CLINT0_BASE) << 32) |
+         CLINT_MTIMECMP_LO(CLINT0_BASE);
+}
+
+static inline void irq_set_mtimecmp(uint64_t value) {
+  // Avoid a spurious match while the two halves are written
+  CLINT_MTIMECMP_HI(CLINT0_BASE) = 0xffffffff;
+  CLINT_MTIMECMP_LO(CLINT0_BASE) = (uint32_t)value;
+  CLINT_MTIMECMP_HI(CLINT0_BASE) = (uint32_t)(value >> 32);
+}
+#endif
+
+/* Wait until the AXI stream input FIFO has data.
+ * irq_id: PLIC source of the AXISTREAMIN0 interrupt
+ * timeout: max number of timer ticks (clock cycles, without CLINT) to wait
+ * returns: 1 if there is data, 0 on timeout
+ */
+static inline int axistream_in_wait(uint32_t irq_id, uint32_t timeout) {
+  if (!IOB_AXISTREAM_IN_GET_FIFO_EMPTY())
+    return 1;
+
+#if defined(PLIC0_BASE) && defined(CLINT0_BASE)
+  uint64_t deadline = irq_read_mtime() + timeout;
+  uint32_t claim;
+  // Restored on return, in case the caller uses them
+  uint64_t mtimecmp = irq_get_mtimecmp();
+  uint32_t enable = PLIC_ENABLE(PLIC0_BASE);
+
+#ifdef IOB_AXISTREAM_IN_FIFO_THRESHOLD_ADDR
+  // Interrupt as soon as there is one word
+  IOB_AXISTREAM_IN_SET_FIFO_THRESHOLD(1);
+#endif
+  PLIC_PRIORITY(PLIC0_BASE, irq_id) = 1;
+  PLIC_THRESHOLD(PLIC0_BASE) = 0;
+  PLIC_ENABLE(PLIC0_BASE) |= 1 << irq_id;
+  irq_set_mtimecmp(deadline);
+  asm volatile("csrs mie, %0" ::"r"(MIE_MEIE | MIE_MTIE));
+
+  while (IOB_AXISTREAM_IN_GET_FIFO_EMPTY() && irq_read_mtime() < deadline) {
+    asm volatile("wfi");
+    // Complete the interrupt, so that the PLIC can signal it again
+    claim = PLIC_CLAIM(PLIC0_BASE);
+    if (claim)
+      PLIC_CLAIM(PLIC0_BASE) = claim;
+  }
+
+  asm volatile("csrc mie, %0" ::"r"(MIE_MEIE | MIE_MTIE));
+  PLIC_ENABLE(PLIC0_BASE) = enable;
+  irq_set_mtimecmp(mtimecmp);
+#else
+  uint64_t deadline = read_mcycle() + timeout;
+
+  while (IOB_AXISTREAM_IN_GET_FIFO_EMPTY() && read_mcycle() < deadline)
+    ;
+#endif
+
+  return !IOB_AXISTREAM_IN_GET_FIFO_EMPTY();
+}
+
+#endif // H_IOB_SOC_SUT_IRQ_H
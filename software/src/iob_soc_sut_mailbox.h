@@ -0,0 +1,172 @@
+/*
+ * Mailbox between the Tester and the SUT: two single-producer/single-consumer
+ * rings of bytes in the SUT memory, shared with the Tester.
+ *
+ * The SUT allocates a `mbox_shared_t` in its memory, initializes it and
+ * publishes its address in the MBOX_BASE register. The Tester accesses it via
+ * the SUT's memory zone (address with bit MEM_ADDR_W-1 inverted).
+ * - T2S ring: the Tester writes, the SUT reads.
+ * - S2T ring: the SUT writes, the Tester reads.
+ *
+ * The ring indices are not in memory, but in the SUT registers (T2S_HEAD,
+ * T2S_TAIL, S2T_HEAD, S2T_TAIL), each one written by a single side: the
+ * producer writes the head, after copying the data (doorbell), and the
+ * consumer writes the tail, after copying it out. Indices are free-running
+ * byte counters: `head - tail` bytes are in the ring. Since register accesses
+ * are not cached, only the ring data needs cache maintenance (`sync_cache`).
+ *
+ * The ring functions only depend on the callbacks of `mbox_ring_t`, so they
+ * are shared by the firmwares and the Linux user space library of the Tester.
+ */
+#ifndef H_IOB_SOC_SUT_MAILBOX_H
+#define H_IOB_SOC_SUT_MAILBOX_H
+
+#include <stdint.h>
+#include <string.h>
+
+#define MBOX_MAGIC 0x584f424d // "MBOX"
+// Bytes of each ring (power of 2)
+#ifndef MBOX_RING_SIZE
+#define MBOX_RING_SIZE 4096
+#endif
+
+// Echo test of the firmwares: the Tester sends a message (size, 4 bytes, then
+// payload) and the SUT replies with the same size and each payload byte + 1.
+#define MBOX_ECHO_SIZE 1024
+
+// Mailbox in the SUT memory
+typedef struct {
+  uint32_t magic; // MBOX_MAGIC once initialized
+  uint32_t ring_size;
+  uint8_t t2s[MBOX_RING_SIZE]; // Tester to SUT ring data
+  uint8_t s2t[MBOX_RING_SIZE]; // SUT to Tester ring data
+} mbox_shared_t;
+
+// One side of a ring (producer or consumer)
+typedef struct {
+  volatile uint8_t *data; // Ring data, as seen by this side
+  uint32_t size;
+  uint32_t index; // Own index: head (producer) or tail (consumer)
+  // Read the index of the other side, from its register
+  uint32_t (*read_index)(void);
+  // Write own index to its register
+  void (*write_index)(uint32_t);
+  // Make ring data written by this side visible to the other side, and
+  // data written by the other side visible to this side (NULL if uncached)
+  void (*sync_cache)(void);
+} mbox_ring_t;
+
+static inline void mbox_ring_init(mbox_ring_t *ring, volatile uint8_t *data,
+                                  uint32_t (*read_index)(void),
+                                  void (*write_index)(uint32_t),
+                                  void (*sync_cache)(void)) {
+  ring->data = data;
+  ring->size = MBOX_RING_SIZE;
+  ring->read_index = read_index;
+  ring->write_index = write_index;
+  ring->sync_cache = sync_cache;
+  // Indices start at 0 (reset value of the registers)
+  ring->index = 0;
+}
+
+// Copy between a buffer and the ring, starting at index, wrapping around
+static inline void mbox_copy(mbox_ring_t *ring, uint32_t index, uint8_t *buffer,
+                             uint32_t n, int to_ring) {
+  uint8_t *data = (uint8_t *)ring->data;
+  uint32_t offset = index & (ring->size - 1);
+  // Bytes before the end of the ring
+  uint32_t first = n < ring->size - offset ? n : ring->size - offset;
+
+  if (to_ring) {
+    memcpy(data + offset, buffer, first);
+    memcpy(data, buffer + first, n - first);
+  } else {
+    memcpy(buffer, data + offset, first);
+    memcpy(buffer + first, data, n - first);
+  }
+}
+
+// Bytes that can be written to the ring (producer)
+static inline uint32_t mbox_space(mbox_ring_t *ring) {
+  return ring->size - (ring->index - ring->read_index());
+}
+
+// Bytes that can be read from the ring (consumer)
+static inline uint32_t mbox_available(mbox_ring_t *ring) {
+  return ring->read_index() - ring->index;
+}
+
+/* Write up to `n` bytes to the ring (producer). Does not block.
+ * returns: number of bytes written
+ */
+static inline uint32_t mbox_write(mbox_ring_t *ring, const void *buffer,
+                                  uint32_t n) {
+  uint32_t space = mbox_space(ring);
+
+  if (n > space)
+    n = space;
+  if (!n)
+    return 0;
+  mbox_copy(ring, ring->index, (uint8_t *)buffer, n, 1);
+  if (ring->sync_cache)
+    ring->sync_cache();
+  // Data must be in memory before the doorbell
+  __sync_synchronize();
+  ring->index += n;
+  ring->write_index(ring->index);
+  return n;
+}
+
+/* Read up to `n` bytes from the ring (consumer). Does not block.
+ * returns: number of bytes read
+ */
+static inline uint32_t mbox_read(mbox_ring_t *ring, void *buffer, uint32_t n) {
+  uint32_t available = mbox_available(ring);
+
+  if (n > available)
+    n = available;
+  if (!n)
+    return 0;
+  __sync_synchronize();
+  if (ring->sync_cache)
+    ring->sync_cache();
+  mbox_copy(ring, ring->index, (uint8_t *)buffer, n, 0);
+  __sync_synchronize();
+  ring->index += n;
+  ring->write_index(ring->index);
+  return n;
+}
+
+/* Write `n` bytes to the ring, waiting for space. Gives up after `max_polls`
+ * consecutive polls without space.
+ * returns: number of bytes written
+ */
+static inline uint32_t mbox_write_all(mbox_ring_t *ring, const void *buffer,
+                                      uint32_t n, uint32_t max_polls) {
+  uint32_t done = 0, step, polls = 0;
+
+  while (done < n && polls < max_polls) {
+    step = mbox_write(ring, (const uint8_t *)buffer + done, n - done);
+    polls = step ? 0 : polls + 1;
+    done += step;
+  }
+  return done;
+}
+
+/* Read `n` bytes from the ring, waiting for data. Gives up after `max_polls`
+ * consecutive polls without data.
+ * returns: number of bytes read
+ */
+static inline uint32_t mbox_read_all(mbox_ring_t *ring, void *buffer, uint32_t n,
+                                     uint32_t max_polls) {
+  uint32_t done = 0, step, polls = 0;
+
+  while (done < n && polls < max_polls) {
+    step = mbox_read(ring, (uint8_t *)buffer + done, n - done);
+    polls = step ? 0 : polls + 1;
+    done += step;
+  }
+  return done;
+}
+
+#endif // H_IOB_SOC_SUT_MAILBOX_H
@@ -0,0 +1,21 @@
+/*
+ * Number of clock cycles since reset, from the mcycle CSR.
+ * Shared by the Tester and SUT firmwares.
+ */
+#ifndef H_IOB_SOC_SUT_MCYCLE_H
+#define H_IOB_SOC_SUT_MCYCLE_H
+
+#include <stdint.h>
+
+static inline uint64_t read_mcycle() {
+  uint32_t lo, hi, hi2;
+  // Read high word again, in case the low word wrapped between reads
+  do {
+    asm volatile("csrr %0, mcycleh" : "=r"(hi));
+    asm volatile("csrr %0, mcycle" : "=r"(lo));
+    asm volatile("csrr %0, mcycleh" : "=r"(hi2));
+  } while (hi != hi2);
+  return ((uint64_t)hi << 32) | lo;
+}
+
+#endif // H_IOB_SOC_SUT_MCYCLE_H
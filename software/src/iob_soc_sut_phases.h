@@ -0,0 +1,114 @@
+/*
+ * Phase timing of the Tester and SUT firmwares.
+ *
+ * Each firmware records the start and end clock cycles (mcycle) of its phases
+ * in a table in its memory, with `phase_begin()` and `phase_end()`. Recording
+ * only reads the cycle counter, so it barely changes the timing it measures.
+ * Both cores are reset together and run with the same clock, so their cycle
+ * counts are on the same timeline.
+ *
+ * The SUT stores the address of its table in the PHASES register. At the end
+ * of the test, the Tester reads it via the shared memory zone and sends both
+ * tables to a file (PHASE_TIMING setup), in binary format:
+ * - phases_header_t;
+ * - n_phases x phase_entry_t, of the Tester and then of the SUT.
+ * Decoded by `phase_report.py`.
+ */
+#ifndef H_IOB_SOC_SUT_PHASES_H
+#define H_IOB_SOC_SUT_PHASES_H
+
+#include <stdint.h>
+#include <string.h>
+#include "iob_soc_sut_mcycle.h"
+
+#define PHASES_MAX 32
+#define PHASE_NAME_SIZE 20
+#define PHASES_MAGIC 0x53485050 // "PPHS"
+
+#define PHASE_CORE_TESTER 0
+#define PHASE_CORE_SUT 1
+
+typedef struct {
+  char name[PHASE_NAME_SIZE]; // Ends with \0
+  uint32_t core;              // PHASE_CORE_*
+  uint64_t start;             // mcycle at start of phase
+  uint64_t end;               // mcycle at end of phase (0 if not ended)
+} phase_entry_t;
+
+typedef struct {
+  uint32_t magic; // PHASES_MAGIC once initialized
+  uint32_t core;
+  uint32_t n_phases;
+  uint32_t reserved;
+  phase_entry_t entries[PHASES_MAX];
+} phase_table_t;
+
+// Header of binary dumps of the phase tables
+typedef struct {
+  char magic[4]; // "PHSB"
+  uint16_t version;
+  uint16_t entry_size; // sizeof(phase_entry_t)
+  uint32_t n_phases;
+  uint32_t freq; // Clock frequency
+} phases_header_t;
+
+static phase_table_t phase_table;
+
+static inline void phases_init(uint32_t core) {
+  phase_table.core = core;
+  phase_table.n_phases = 0;
+  phase_table.magic = PHASES_MAGIC;
+}
+
+// Start phase. returns: phase id for `phase_end()` (-1 if table is full)
+static inline int phase_begin(const char *name) {
+  phase_entry_t *entry;
+
+  if (phase_table.n_phases >= PHASES_MAX)
+    return -1;
+  entry = &phase_table.entries[phase_table.n_phases];
+  strncpy(entry->name, name, PHASE_NAME_SIZE - 1);
+  entry->name[PHASE_NAME_SIZE - 1] = '\0';
+  entry->core = phase_table.core;
+  entry->end = 0;
+  entry->start = read_mcycle();
+  return phase_table.n_phases++;
+}
+
+static inline void phase_end(int id) {
+  uint64_t now = read_mcycle();
+
+  if (id >= 0)
+    phase_table.entries[id].end = now;
+}
+
+/* Write binary dump of the local table, followed by the entries of `other`
+ * (table of the other core, ignored if NULL or not initialized).
+ * buffer: NULL to only get the size
+ * returns: size of the dump
+ */
+static inline uint32_t phases_dump(char *buffer, volatile phase_table_t *other,
+                                   uint32_t freq) {
+  uint32_t n_other = 0, n_local = phase_table.n_phases;
+  phases_header_t *header = (phases_header_t *)buffer;
+  phase_entry_t *entries = (phase_entry_t *)(buffer + sizeof(phases_header_t));
+  uint32_t i;
+
+  if (other && other->magic == PHASES_MAGIC)
+    n_other = other->n_phases < PHASES_MAX ? other->n_phases : PHASES_MAX;
+  if (!buffer)
+    return sizeof(phases_header_t) + (n_local + n_other) * sizeof(phase_entry_t);
+
+  memcpy(header->magic, "PHSB", 4);
+  header->version = 1;
+  header->entry_size = sizeof(phase_entry_t);
+  header->n_phases = n_local + n_other;
+  header->freq = freq;
+  memcpy(entries, phase_table.entries, n_local * sizeof(phase_entry_t));
+  for (i = 0; i < n_other; i++)
+    memcpy(&entries[n_local + i], (phase_entry_t *)&other->entries[i],
+           sizeof(phase_entry_t));
+  return sizeof(phases_header_t) + header->n_phases * sizeof(phase_entry_t);
+}
+
+#endif // H_IOB_SOC_SUT_PHASES_H
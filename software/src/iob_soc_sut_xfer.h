@@ -0,0 +1,96 @@
+/*
+ * Chunked file transfer from the Tester to the SUT via ethernet.
+ *
+ * Used by the SUT bootloader to receive its firmware from the Tester, when the
+ * SUT memory is not initialized (INIT_MEM=0).
+ * The file request and the control messages use the UART link between the
+ * Tester (UART1) and the SUT (UART0). The file contents use the ethernet link
+ * between the Tester (ETH1) and the SUT (ETH0).
+ *
+ * Protocol:
+ * 1) SUT sends FRX and the file name (including end of string), like
+ *    `uart16550_recvfile()`.
+ * 2) Tester replies with the file size (4 bytes, little endian), with the
+ *    SUT_XFER_ETH_FLAG bit set. SUT sends ACK.
+ *    Without that flag (Tester running Linux), the file contents are sent via
+ *    UART after the ACK, like `uart16550_recvfile()`.
+ * 3) Tester sends chunk number `index` via ethernet: up to SUT_XFER_CHUNK_SIZE
+ *    bytes of the file, followed by a `sut_xfer_trailer_t`.
+ * 4) SUT checks the trailer and the CRC32 of the chunk, then replies with ACK
+ *    (chunk stored) or NAK (chunk rejected), followed by the index of the next
+ *    chunk it expects (4 bytes, little endian).
+ * 5) Tester goes back to 3) with the requested chunk, until the SUT requests
+ *    the chunk after the last one.
+ * Since the SUT always requests the next missing chunk, a corrupted or lost
+ * chunk only causes that chunk to be sent again, instead of the whole file.
+ */
+#ifndef H_IOB_SOC_SUT_XFER_H
+#define H_IOB_SOC_SUT_XFER_H
+
+#include <stdint.h>
+
+#define SUT_XFER_CHUNK_SIZE 1024
+#define SUT_XFER_MAGIC 0x58545553 // "SUTX"
+#define SUT_XFER_ETH_FLAG 0x80000000
+
+#ifndef NAK
+#define NAK 21 // negative acknowledge
+#endif
+
+// Sent after the contents of each chunk
+typedef struct {
+  uint32_t magic;
+  uint32_t index;
+  uint32_t size;
+  uint32_t crc;
+} sut_xfer_trailer_t;
+
+static inline uint32_t sut_xfer_n_chunks(uint32_t file_size) {
+  return (file_size + SUT_XFER_CHUNK_SIZE - 1) / SUT_XFER_CHUNK_SIZE;
+}
+
+// Size of the contents of chunk `index`
+static inline uint32_t sut_xfer_chunk_size(uint32_t file_size, uint32_t index) {
+  uint32_t offset = index * SUT_XFER_CHUNK_SIZE;
+  return (file_size - offset) < SUT_XFER_CHUNK_SIZE ? (file_size - offset)
+                                                    : SUT_XFER_CHUNK_SIZE;
+}
+
+// CRC-32 (IEEE 802.3), with a lookup table built on first use
+static inline uint32_t sut_xfer_crc32(const uint8_t *data, uint32_t size) {
+  static uint32_t table[256];
+  static int table_ready = 0;
+  uint32_t crc = 0xffffffff;
+  uint32_t i, j;
+
+  if (!table_ready) {
+    for (i = 0; i < 256; i++) {
+      crc = i;
+      for (j = 0; j < 8; j++)
+        crc = (crc & 1) ? (crc >> 1) ^ 0xedb88320 : crc >> 1;
+      table[i] = crc;
+    }
+    table_ready = 1;
+    crc = 0xffffffff;
+  }
+  for (i = 0; i < size; i++)
+    crc = table[(crc ^ data[i]) & 0xff] ^ (crc >> 8);
+  return ~crc;
+}
+
+static inline void sut_xfer_put_u32(void (*putc_fn)(char), uint32_t value) {
+  putc_fn((char)(value & 0x0ff));
+  putc_fn((char)((value & 0x0ff00) >> 8));
+  putc_fn((char)((value & 0x0ff0000) >> 16));
+  putc_fn((char)((value & 0x0ff000000) >> 24));
+}
+
+static inline uint32_t sut_xfer_get_u32(char (*getc_fn)(void)) {
+  uint32_t value = (uint8_t)getc_fn();
+  value |= ((uint32_t)(uint8_t)getc_fn()) << 8;
+  value |= ((uint32_t)(uint8_t)getc_fn()) << 16;
+  value |= ((uint32_t)(uint8_t)getc_fn()) << 24;
+  return value;
+}
+
+#endif // H_IOB_SOC_SUT_XFER_H
@@ -9,7 +9,7 @@ test-ila-vcd:
 ifneq ($(VIVADO_SERVER)$(QUARTUS_SERVER),)
 	scp $(BOARD_USER)@$(BOARD_SERVER):$(REMOTE_FPGA_DIR)/ila_data.bin .
 endif
-	../../scripts/ilaDataToVCD.py ILA0 ila_data.bin ila_data.vcd
+	../../scripts/ila_decode.py ILA0 ila_data.bin ila_data.vcd
 	gtkwave ila_data.vcd
 
 .PHONY: test-ila-vcd
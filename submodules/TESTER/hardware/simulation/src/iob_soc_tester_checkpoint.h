@@ -0,0 +1,121 @@
+/*
+ * Checkpoint and restore of the Verilator model of the Tester+SUT system.
+ *
+ * The Tester firmware sets bit 0 of the GPIO1 outputs once the SUT has booted
+ * and both cores are running their main functions. The Verilog code inserted
+ * in iob_soc_tester.v (SIM_CHECKPOINT setup) then calls
+ * `sim_checkpoint_request()`, via DPI.
+ *
+ * The testbench calls `sim_checkpoint_eval(dut)` after each `dut->eval()`:
+ * - With SIM_CHECKPOINT_SAVE=<file> in the environment, the model state is
+ *   saved to <file> when the checkpoint is requested. The simulation continues.
+ *   The save waits until no character is in transit between the testbench and
+ *   the console (empty handshake files), so a restored run can start with a new
+ *   console.
+ * - With SIM_CHECKPOINT_RESTORE=<file> in the environment, the model state is
+ *   restored from <file> once the testbench releases the reset (first falling
+ *   edge of arst_i). Restoring before would let the reset sequence of the
+ *   testbench clear the restored state. The simulation then continues from the
+ *   checkpoint. The firmware and the model must be the same that saved it.
+ *
+ * The simulation time of the testbench (SIM_CHECKPOINT_TIME, defined by the
+ * setup as `main_time` when the testbench has it) is saved and restored with the
+ * model.
+ *
+ * The model must be built with `--savable`.
+ */
+#ifndef H_IOB_SOC_TESTER_CHECKPOINT_H
+#define H_IOB_SOC_TESTER_CHECKPOINT_H
+
+#include <cstdio>
+#include <cstdlib>
+#include <sys/stat.h>
+
+#include "verilated.h"
+#include "verilated_save.h"
+
+// Files used by the testbench and the console to exchange UART characters
+#define SIM_CHECKPOINT_HANDSHAKE_FILES {"./cnsl2soc", "./soc2cnsl"}
+
+// Simulation time of the testbench (defined by the setup, if the testbench has one)
+#ifdef SIM_CHECKPOINT_TIME
+extern vluint64_t SIM_CHECKPOINT_TIME;
+#endif
+
+static bool sim_checkpoint_requested = false;
+
+// Called by the model (DPI import) when the firmware reaches the checkpoint
+extern "C" void sim_checkpoint_request() { sim_checkpoint_requested = true; }
+
+// Return true if no character is in transit between testbench and console
+static bool sim_checkpoint_console_idle() {
+  const char *files[] = SIM_CHECKPOINT_HANDSHAKE_FILES;
+  struct stat file_stat;
+
+  for (const char *file_name : files)
+    if (!stat(file_name, &file_stat) && file_stat.st_size > 0)
+      return false;
+  return true;
+}
+
+template <class T> void sim_checkpoint_save(T *dut, const char *file_name) {
+  vluint64_t time = 0;
+  VerilatedSave os;
+
+#ifdef SIM_CHECKPOINT_TIME
+  time = SIM_CHECKPOINT_TIME;
+#endif
+  os.open(file_name);
+  os << time;
+  os << *dut;
+  os.close();
+  printf("Saved simulation checkpoint %s\n", file_name);
+}
+
+template <class T> void sim_checkpoint_restore(T *dut, const char *file_name) {
+  vluint64_t time;
+  VerilatedRestore os;
+
+  os.open(file_name);
+  if (!os.isOpen()) {
+    fprintf(stderr, "Could not open simulation checkpoint %s\n", file_name);
+    exit(1);
+  }
+  os >> time;
+  os >> *dut;
+  os.close();
+#ifdef SIM_CHECKPOINT_TIME
+  SIM_CHECKPOINT_TIME = time;
+#endif
+  printf("Restored simulation checkpoint %s\n", file_name);
+}
+
+template <class T> void sim_checkpoint_eval(T *dut) {
+  static bool in_reset = false, reset_done = false;
+  const char *file_name;
+
+  // Restore once the reset sequence of the testbench is over
+  if (!reset_done) {
+    if (dut->arst_i) {
+      in_reset = true;
+    } else if (in_reset) {
+      reset_done = true;
+      file_name = getenv("SIM_CHECKPOINT_RESTORE");
+      if (file_name && *file_name) {
+        sim_checkpoint_restore(dut, file_name);
+        // Don't save the state again
+        sim_checkpoint_requested = false;
+        return;
+      }
+    }
+  }
+
+  if (sim_checkpoint_requested && sim_checkpoint_console_idle()) {
+    sim_checkpoint_requested = false;
+    file_name = getenv("SIM_CHECKPOINT_SAVE");
+    if (file_name && *file_name)
+      sim_checkpoint_save(dut, file_name);
+  }
+}
+
+#endif // H_IOB_SOC_TESTER_CHECKPOINT_H
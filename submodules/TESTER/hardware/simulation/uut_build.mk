@@ -8,7 +8,7 @@ test-ila-vcd:
 ifneq ($(VSIM_SERVER)$(IVSIM_SERVER),)
 	scp $(SIM_SCP_FLAGS) $(SIM_USER)@$(SIM_SERVER):$(REMOTE_SIM_DIR)/ila_data.bin .
 endif
-	../../scripts/ilaDataToVCD.py ILA0 ila_data.bin ila_data.vcd
+	../../scripts/ila_decode.py ILA0 ila_data.bin ila_data.vcd
 	gtkwave ila_data.vcd
 
 .PHONY: test-ila-vcd
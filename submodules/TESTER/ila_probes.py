@@ -0,0 +1,156 @@
+# Declarative configuration of the ILA probes and triggers.
+#
+# One `IlaProbeSpec` describes the signals sampled by an ILA instance. From it:
+# - the SIGNAL_W and TRIGGER_W parameters of the ILA are derived;
+# - the probe and trigger lists for `iob_ila.generate_system_wires()` are created;
+# - the layout of each sample (position of each probe) is written to a C header,
+#   used by the firmware, and to a JSON file, used by `scripts/ila_decode.py`.
+#
+# Each sample has the clock counter in the least significant bits, followed by
+# the probes, in the order of the probe list. The number of 32-bit words of a
+# sample only depends on the total width, so the probes are reordered to reduce
+# the number of probes split between two words: those need two loads to be read
+# by the firmware, and more operations to be decoded.
+import itertools
+import json
+import re
+from collections import namedtuple
+
+# Max number of probes to reorder (all orders are tried)
+MAX_REORDER_PROBES = 8
+
+# signal: hierarchical name of the signal; width: number of bits;
+# label: name of the probe in the C macros (derived from the signal name if empty)
+IlaProbe = namedtuple("IlaProbe", ["signal", "width", "label"], defaults=[""])
+
+
+def _label(probe):
+    if probe.label:
+        return probe.label.upper()
+    return re.sub(r"[^A-Za-z0-9]", "_", probe.signal.split(".")[-1]).upper()
+
+
+class IlaProbeSpec:
+    def __init__(self, probes, triggers, clk_counter_w=16, reorder=True):
+        """probes: list of IlaProbe (or (signal, width[, label]) tuples)
+        triggers: list of 1-bit trigger signals
+        clk_counter_w: width of the clock counter (0 if the CLK_COUNTER parameter is disabled)
+        reorder: reorder probes to reduce probes split between 32-bit words
+        """
+        self.probes = [IlaProbe(*probe) for probe in probes]
+        self.triggers = list(triggers)
+        self.clk_counter_w = clk_counter_w
+        labels = [_label(probe) for probe in self.probes]
+        if len(set(labels)) != len(labels):
+            raise ValueError(f"ILA probe labels must be unique: {labels}")
+        if reorder:
+            self.probes = self._packed(self.probes)
+
+    @property
+    def signal_w(self):
+        """SIGNAL_W parameter of the ILA"""
+        return sum(probe.width for probe in self.probes)
+
+    @property
+    def trigger_w(self):
+        """TRIGGER_W parameter of the ILA"""
+        return len(self.triggers)
+
+    @property
+    def sample_words(self):
+        """Number of 32-bit words of each sample"""
+        return (self.clk_counter_w + self.signal_w + 31) // 32
+
+    @property
+    def probe_list(self):
+        """Probe list for `iob_ila.generate_system_wires()`"""
+        return [(probe.signal, probe.width) for probe in self.probes]
+
+    @property
+    def trigger_list(self):
+        """Trigger list for `iob_ila.generate_system_wires()`"""
+        return list(self.triggers)
+
+    def _split_count(self, probes):
+        """Number of probes split between two 32-bit words"""
+        count = 0
+        lsb = self.clk_counter_w
+        for probe in probes:
+            if probe.width <= 32 and lsb // 32 != (lsb + probe.width - 1) // 32:
+                count += 1
+            lsb += probe.width
+        return count
+
+    def _packed(self, probes):
+        """Return order of probes with fewest split probes (keeps given order on ties)"""
+        if len(probes) > MAX_REORDER_PROBES:
+            return probes
+        return min(itertools.permutations(probes), key=self._split_count)
+
+    def fields(self):
+        """Return list of (probe, lsb) for each probe"""
+        fields = []
+        lsb = self.clk_counter_w
+        for probe in self.probes:
+            fields.append((probe, lsb))
+            lsb += probe.width
+        return fields
+
+    def layout(self, name):
+        """Return layout of the samples, for `scripts/ila_decode.py`"""
+        return {
+            "name": name,
+            "clk_counter_w": self.clk_counter_w,
+            "fields": [
+                {"name": probe.signal, "lsb": lsb, "width": probe.width}
+                for probe, lsb in self.fields()
+            ],
+        }
+
+    def layout_json(self, name):
+        return json.dumps(self.layout(name), indent=4) + "\n"
+
+    def c_header(self, name, buffer_w):
+        """Return C header with the layout of the samples of ILA instance `name`"""
+        fields = self.fields()
+        names = "".join(f"{probe.signal}\\0" for probe, _ in fields)
+        code = f"""// File generated by ila_probes.py. Do not edit.
+// Layout of the {name} samples.
+#ifndef H_{name}_LAYOUT_H
+#define H_{name}_LAYOUT_H
+
+#include <stdint.h>
+
+#define {name}_LAYOUT_BUFFER_W {buffer_w}
+#define {name}_LAYOUT_CLK_COUNTER_W {self.clk_counter_w}
+// Number of 32-bit words of each sample
+#define {name}_LAYOUT_SAMPLE_WORDS {self.sample_words}
+#define {name}_LAYOUT_N_PROBES {len(fields)}
+// {{lsb, width}} of each probe
+#define {name}_LAYOUT_PROBE_FIELDS {{{", ".join(f"{{{lsb}, {probe.width}}}" for probe, lsb in fields)}}}
+// Probe names, separated by \\0
+#define {name}_LAYOUT_PROBE_NAMES "{names}"
+
+// Get probe values from a sample (pointer to its 32-bit words)
+"""
+        getters = []
+        if self.clk_counter_w:
+            getters.append(("CLK_COUNTER", 0, self.clk_counter_w))
+        getters += [(_label(probe), lsb, probe.width) for probe, lsb in fields]
+        for label, lsb, width in getters:
+            code += f"#define {name}_{label}_LSB {lsb}\n#define {name}_{label}_WIDTH {width}\n"
+            word, offset = divmod(lsb, 32)
+            mask = f"0x{(1 << width) - 1:x}" if width < 32 else "0xffffffff"
+            if width > 32:
+                code += f"// {label} is wider than 32 bits: read it with {name}_{label}_LSB\n"
+            elif offset + width <= 32:
+                code += f"#define {name}_GET_{label}(sample) (((sample)[{word}] >> {offset}) & {mask})\n"
+            else:
+                code += (
+                    f"#define {name}_GET_{label}(sample) \\\n"
+                    f"  ((uint32_t)((((uint64_t)(sample)[{word + 1}] << 32) | (sample)[{word}]) >> {offset}) & {mask})\n"
+                )
+        code += f"""
+#endif // H_{name}_LAYOUT_H
+"""
+        return code
@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 import os
 import sys
+import re
 import glob
+import json
 
 from iob_soc_opencryptolinux import iob_soc_opencryptolinux
-from iob_soc_sut import iob_soc_sut
+from iob_soc_sut import iob_soc_sut, AXIS_TDATA_W
 from iob_gpio import iob_gpio
 from iob_uart16550 import iob_uart16550
 from iob_axistream_in import iob_axistream_in
@@ -15,13 +17,56 @@ from iob_dma import iob_dma
 from iob_eth import iob_eth
 from iob_ram_2p_be import iob_ram_2p_be
 from config_gen import append_str_config_build_mk
-from verilog_gen import insert_verilog_in_module, inplace_change
-from iob_pfsm_program import iob_pfsm_program, iob_fsm_record
+from verilog_gen import inplace_change
+from verilog_patch import VerilogPatchSet
+from portmap_gen import PortmapIndex, to_external, to_internal, connect
+from pfsm_compiler import PfsmCompiler
+from ila_probes import IlaProbeSpec, IlaProbe
+from parallel_setup import setup_submodules
+from setup_cache import (
+    record_step,
+    file_hash,
+    append_if_missing,
+    symlink_if_missing,
+    write_if_changed,
+    copy_if_changed,
+)
 
 # Select if should include ILA and PFSM peripherals.
 # Disable this to reduce the amount of FPGA resources used.
 USE_ILA_PFSM = False if "NO_ILA" in sys.argv else True
 
+# Signals sampled and triggers of the ILA0 (SIGNAL_W and TRIGGER_W are derived from them)
+ILA0_PROBES = IlaProbeSpec(
+    probes=[
+        # (signal, width, label used in the C macros)
+        IlaProbe("SUT0.AXISTREAMIN0.axis_tdata_i", AXIS_TDATA_W, "AXIS_TDATA"),
+        IlaProbe("SUT0.AXISTREAMIN0.data_fifo.w_level_o", 5, "FIFO_LEVEL"),
+        IlaProbe("PFSM0.output_ports", 1, "PFSM_OUTPUT"),
+    ],
+    triggers=["SUT0.AXISTREAMIN0.axis_tvalid_i"],
+    # Width of the ILA clock counter (CLK_COUNTER parameter), stored in the least significant bits of each sample
+    clk_counter_w=16,
+)
+
+
+def _argv_value(name, default=None):
+    """Return value of `<name>=<value>` argument given to the setup"""
+    for arg in sys.argv:
+        if arg.startswith(f"{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+# Number of samples of continuous ILA captures (ILA stream). Disabled if not set.
+ILA_STREAM_SAMPLES = _argv_value("ILA_STREAM_SAMPLES", False)
+
+# Save/restore the Verilator model state once both cores reach main
+SIM_CHECKPOINT = "SIM_CHECKPOINT" in sys.argv
+
+# Number of threads of the Verilator model. Single-threaded if not set.
+VERILATOR_THREADS = _argv_value("VERILATOR_THREADS", None)
+
 
 class iob_soc_tester(iob_soc_opencryptolinux):
     name = "iob_soc_tester"
@@ -52,6 +97,20 @@ class iob_soc_tester(iob_soc_opencryptolinux):
             ]
         super()._create_submodules_list(submodules)
 
+    @classmethod
+    def _setup_submodules(cls, submodule_list):
+        """Setup submodules in parallel, using SETUP_JOBS worker processes.
+        The SUT is set up after the other submodules, as it is a system with its own submodules.
+        """
+        setup_submodules(
+            cls.build_dir,
+            super()._setup_submodules,
+            submodule_list,
+            stage_of=lambda submodule: 1
+            if issubclass(submodule, iob_soc_opencryptolinux)
+            else 0,
+        )
+
     @classmethod
     def _create_instances(cls):
         # Instantiate TESTER peripherals
@@ -96,14 +155,14 @@ class iob_soc_tester(iob_soc_opencryptolinux):
             iob_axistream_in(
                 "AXISTREAMIN0",
                 "Tester AXI input stream interface",
-                parameters={"TDATA_W": "32"},
+                parameters={"TDATA_W": str(AXIS_TDATA_W)},
             )
         )
         cls.peripherals.append(
             iob_axistream_out(
                 "AXISTREAMOUT0",
                 "Tester AXI output stream interface",
-                parameters={"TDATA_W": "32"},
+                parameters={"TDATA_W": str(AXIS_TDATA_W)},
             )
         )
         if USE_ILA_PFSM:
@@ -112,8 +171,8 @@ class iob_soc_tester(iob_soc_opencryptolinux):
                 "Tester Integrated Logic Analyzer for SUT signals",
                 parameters={
                     "BUFFER_W": "4",
-                    "SIGNAL_W": "38",
-                    "TRIGGER_W": "1",
+                    "SIGNAL_W": str(ILA0_PROBES.signal_w),
+                    "TRIGGER_W": str(ILA0_PROBES.trigger_w),
                     "CLK_COUNTER": "1",
                     "MONITOR": "1",
                     "MONITOR_STATE_W": "2",
@@ -163,7 +222,12 @@ class iob_soc_tester(iob_soc_opencryptolinux):
     def _generate_monitor_bitstream(cls):
         """Generate bitstream for the Monitor PFSM of the ILA."""
         ila_parameters = cls.ila0_instance.parameters
-        monitor_prog = iob_pfsm_program(
+        # Create a Monitor PFSM program that always has the trigger output
+        # enabled (to keep recording samples) until a certain sequence is detected
+        # in the input.
+        # In this example, When the input is 1 for one pulse, it disables the trigger output
+        # 4 clocks after it. This allows us to record the two pulses emitted by the Tester's example PFSM.
+        monitor_prog = PfsmCompiler(
             ila_parameters[
                 "MONITOR_STATE_W"
             ],  # Monitor STATE_W defined in ILA parameter
@@ -171,86 +235,244 @@ class iob_soc_tester(iob_soc_opencryptolinux):
                 "TRIGGER_W"
             ],  # Monitor INPUT_W = ILA TRIGGER_W because ILA trigger signals connected as inputs of Monitor.
             1,  # Monitor OUTPUT_W always 1. It is the internal trigger signal for the ILA.
-        )
-
-        # Create a Monitor PFSM program that always has the trigger output
-        # enabled (to keep recording samples) until a certain sequence is detected
-        # in the input.
-        # In this example, When the input is 1 for one pulse, it disables the trigger output
-        # 4 clocks after it. This allows us to record the two pulses emitted by the Tester's example PFSM.
-        monitor_prog.set_records(
             [
-                # Format: iob_fsm_record("label", "input_cond", "next_state", "output_expr")
-                iob_fsm_record(
-                    # Keep jumping to this state while input is not high.
-                    "state_0",
-                    "0",
-                    "state_0",
-                    "i[0]",
-                ),
-                iob_fsm_record(
-                    # If the input is still high (more than 1 clock pulse), then go back to state 0.
-                    "",
-                    "1",
-                    "state_0",
-                    "1",
-                ),
-                iob_fsm_record("", "", "", "1"),  # Wait one clock
-                iob_fsm_record("", "-", "state_0", "1"),  # Jump to state 0
-            ]
+                # Format: ("label", "input_cond", "next_state", "output_expr")
+                # Keep jumping to this state while input is not high.
+                ("state_0", "0", "state_0", "i[0]"),
+                # If the input is still high (more than 1 clock pulse), then go back to state 0.
+                ("", "1", "state_0", "1"),
+                ("", "", "", "1"),  # Wait one clock
+                ("", "-", "state_0", "1"),  # Jump to state 0
+            ],
         )
 
-        # monitor_prog.print_truth_table(0)  # DEBUG: Print truth table for record with index given
-
-        # Generate bitstream in simulation directory
-        monitor_prog.generate_bitstream(
-            os.path.join(cls.build_dir, "hardware/simulation/monitor_pfsm.bit")
-        )
+        bitstreams = [
+            "hardware/simulation/monitor_pfsm.bit",
+            "hardware/fpga/monitor_pfsm.bit",
+        ]
+        # Skip if the program and the bitstreams did not change since the previous setup
+        if not record_step(
+            cls.build_dir, "monitor_pfsm", monitor_prog.cache_key(), outputs=bitstreams
+        ):
+            return
+        # Generate bitstream in simulation directory (copied from cache if the program did not change)
+        monitor_prog.compile(os.path.join(cls.build_dir, bitstreams[0]))
         # Create symlink for this bitstream in the fpga directory
-        os.symlink(
+        symlink_if_missing(
             os.path.join("../simulation/monitor_pfsm.bit"),
-            os.path.join(cls.build_dir, "hardware/fpga/monitor_pfsm.bit"),
+            os.path.join(cls.build_dir, bitstreams[1]),
         )
 
     @classmethod
     def _generate_pfsm_bitstream(cls):
         """Generate bitstream for the independent PFSM peripheral."""
-        pfsm_prog = iob_pfsm_program(
+        # Create a PFSM program that pulses two times, when its input is set.
+        pfsm_prog = PfsmCompiler(
             2,  # This PFSM has 2^2 states
             1,  # This PFSM has 1 input
             1,  # This PFSM has 1 output
+            [
+                # Format: ("label", "input_cond", "next_state", "output_expr")
+                # Keep jumping to state_0 while input is not high.
+                ("state_0", "0", "state_0", "0"),
+                ("", "", "", "1"),  # Set output to 1
+                ("", "", "", "0"),  # Set output to 0
+                ("", "-", "state_0", "1"),  # Set output to 1. Always jump to state_0.
+            ],
         )
 
-        # Create a PFSM program that pulses two times, when its input is set.
-        pfsm_prog.set_records(
-            [
-                # Format: iob_fsm_record("label", "input_cond", "next_state", "output_expr")
-                iob_fsm_record(
-                    "state_0", "0", "state_0", "0"
-                ),  # Keep jumping to state_0 while input is not high.
-                iob_fsm_record("", "", "", "1"),  # Set output to 1
-                iob_fsm_record("", "", "", "0"),  # Set output to 0
-                iob_fsm_record(
-                    "", "-", "state_0", "1"
-                ),  # Set output to 1. Always jump to state_0.
-            ]
+        bitstreams = ["hardware/simulation/pfsm.bit", "hardware/fpga/pfsm.bit"]
+        # Skip if the program and the bitstreams did not change since the previous setup
+        if not record_step(
+            cls.build_dir, "pfsm", pfsm_prog.cache_key(), outputs=bitstreams
+        ):
+            return
+        # Generate bitstream in simulation directory (copied from cache if the program did not change)
+        pfsm_prog.compile(os.path.join(cls.build_dir, bitstreams[0]))
+        # Create symlink for this bitstream in the fpga directory
+        symlink_if_missing(
+            os.path.join("../simulation/pfsm.bit"),
+            os.path.join(cls.build_dir, bitstreams[1]),
         )
 
-        # pfsm_prog.print_truth_table(0)  # DEBUG: Print truth table for record with index given
+    @classmethod
+    def _generate_ila_layout(cls):
+        """Generate the layout of the ILA0 samples, for the firmware (C header) and
+        for the capture decoder (JSON file). Copy the decoder to the build directory.
+        """
+        ila_name = cls.ila0_instance.name
+        scripts = ["ila_decode.py", "ila_stream.py"]
+        outputs = {
+            f"scripts/{ila_name}_layout.json": ILA0_PROBES.layout_json(ila_name),
+            f"software/src/{ila_name}_layout.h": ILA0_PROBES.c_header(
+                ila_name, cls.ila0_instance.parameters["BUFFER_W"]
+            ),
+        }
+        script_hashes = [
+            file_hash(os.path.join(os.path.dirname(__file__), "scripts", script))
+            for script in scripts
+        ]
+        if not record_step(
+            cls.build_dir,
+            "ila_layout",
+            outputs,
+            script_hashes,
+            outputs=list(outputs) + [f"scripts/{script}" for script in scripts],
+        ):
+            return
+        os.makedirs(os.path.join(cls.build_dir, "scripts"), exist_ok=True)
+        for path, data in outputs.items():
+            write_if_changed(os.path.join(cls.build_dir, path), data)
+        for script in scripts:
+            copy_if_changed(
+                os.path.join(os.path.dirname(__file__), "scripts", script),
+                os.path.join(cls.build_dir, "scripts", script),
+            )
+
+    @classmethod
+    def _check_axis_tdata_w(cls):
+        """Check that the AXI streams of the Tester have the TDATA_W set by the
+        AXIS_TDATA_W conf of the SUT, as both ends of each stream must match.
+        """
+        sut_tdata_w = next(
+            (c["val"] for c in iob_soc_sut.confs if c["name"] == "AXIS_TDATA_W"), None
+        )
+        if sut_tdata_w is None:
+            raise ValueError(f"{iob_soc_sut.name} has no AXIS_TDATA_W conf")
+        widths = {
+            f"{cls.name}.{instance.name}": instance.parameters["TDATA_W"]
+            for instance in cls.peripherals
+            if instance.name in ["AXISTREAMIN0", "AXISTREAMOUT0"]
+        }
+        widths[f"{cls.name} conf"] = next(
+            c["val"] for c in cls.confs if c["name"] == "AXIS_TDATA_W"
+        )
+        mismatch = {k: v for k, v in widths.items() if int(v) != int(sut_tdata_w)}
+        if mismatch:
+            raise ValueError(
+                f"TDATA_W differs from AXIS_TDATA_W={sut_tdata_w} of the SUT: {mismatch}"
+            )
 
-        # Generate bitstream in simulation directory
-        pfsm_prog.generate_bitstream(
-            os.path.join(cls.build_dir, "hardware/simulation/pfsm.bit")
+    @classmethod
+    def _generate_verilator_threads(cls):
+        """Generate Verilator flags for a multi-threaded model, with a configuration
+        file that keeps the SUT0 instance apart from the Tester, so that both
+        cores can be scheduled on different threads.
+        """
+        threads = int(VERILATOR_THREADS)
+        if threads < 1:
+            raise ValueError(f"VERILATOR_THREADS must be at least 1, got {threads}")
+        # Don't inline the SUT in the Tester: its logic stays in its own scope,
+        # and is grouped into separate tasks by the thread partitioner.
+        config = f"""`verilator_config
+// File generated by iob_soc_tester.py. Do not edit.
+// Partitioning hints for the {threads}-thread model.
+no_inline -module "{iob_soc_sut.name}"
+"""
+        flags = f"VFLAGS+=--threads {threads} iob_soc_tester_threads.vlt\n"
+        # Hierarchical Verilation builds the SUT as a separate model, evaluated
+        # as one task in parallel with the Tester. It does not allow
+        # hierarchical references into the SUT, used by the ILA probes.
+        if not USE_ILA_PFSM:
+            config += f'hier_block -module "{iob_soc_sut.name}"\n'
+            flags += "VFLAGS+=--hierarchical\n"
+        data2append = f"""
+# Multi-threaded Verilator model (VERILATOR_THREADS={threads} in the setup)
+ifeq ($(SIMULATOR),verilator)
+{flags}endif
+"""
+        config_file = "hardware/simulation/iob_soc_tester_threads.vlt"
+        if record_step(
+            cls.build_dir,
+            "verilator_threads",
+            config,
+            data2append,
+            outputs=[config_file],
+        ):
+            write_if_changed(os.path.join(cls.build_dir, config_file), config)
+        # sim_build.mk is written by the setup of the LIB: always append to it
+        append_if_missing(
+            os.path.join(cls.build_dir, "hardware/simulation/sim_build.mk"), data2append
         )
-        # Create symlink for this bitstream in the fpga directory
-        os.symlink(
-            os.path.join("../simulation/pfsm.bit"),
-            os.path.join(cls.build_dir, "hardware/fpga/pfsm.bit"),
+
+    @classmethod
+    def _generate_sim_checkpoint(cls, patches):
+        """Add checkpoint/restore of the Verilator model (see iob_soc_tester_checkpoint.h).
+        The checkpoint is requested by the firmware, through bit 0 of the GPIO1 outputs.
+        """
+        patches.insert(
+            "hardware/src/iob_soc_tester.v",
+            """
+`ifdef VERILATOR
+   // Request simulation checkpoint when the firmware sets GPIO1 output 0
+   import "DPI-C" function void sim_checkpoint_request();
+   reg sim_checkpoint_done = 1'b0;
+   always @(posedge clk_i) begin
+      if (!sim_checkpoint_done && GPIO1_output_ports[0]) begin
+         sim_checkpoint_done <= 1'b1;
+         sim_checkpoint_request();
+      end
+   end
+`endif
+             """,
+        )
+        helper = "hardware/simulation/src/iob_soc_tester_checkpoint.h"
+        data2append = """
+# Model state can be saved and restored (SIM_CHECKPOINT setup)
+ifeq ($(SIMULATOR),verilator)
+VFLAGS+=--savable
+endif
+"""
+        if record_step(
+            cls.build_dir,
+            "sim_checkpoint",
+            file_hash(os.path.join(cls.setup_dir, helper)),
+            data2append,
+            outputs=[helper],
+        ):
+            copy_if_changed(
+                os.path.join(cls.setup_dir, helper), os.path.join(cls.build_dir, helper)
+            )
+        # sim_build.mk is written by the setup of the LIB: always append to it
+        append_if_missing(
+            os.path.join(cls.build_dir, "hardware/simulation/sim_build.mk"), data2append
         )
 
+        # Call the checkpoint helper from the Verilator testbench. The testbench
+        # comes from the LIB: if it does not have the expected code, leave it
+        # unchanged (the simulation runs without checkpoints).
+        for tb_path in glob.glob(
+            os.path.join(cls.build_dir, "hardware/simulation/src/*_tb.cpp")
+        ):
+            with open(tb_path) as f:
+                tb = f.read()
+            if "sim_checkpoint_eval" in tb:
+                continue
+            if "dut->eval();" not in tb or "arst_i" not in tb or "#include" not in tb:
+                print(
+                    f"Warning: {tb_path} does not call `dut->eval()` or reset the system. Simulation checkpoints disabled."
+                )
+                continue
+            tb_file = os.path.relpath(tb_path, cls.build_dir)
+            include = '#include "iob_soc_tester_checkpoint.h"'
+            # Simulation time of the testbench, saved with the model
+            if re.search(r"\bmain_time\b", tb):
+                include = "#define SIM_CHECKPOINT_TIME main_time\n" + include
+            patches.insert(tb_file, include, after_line="#include")
+            patches.replace(
+                tb_file, "dut->eval();", "dut->eval();\n  sim_checkpoint_eval(dut);"
+            )
+
     @classmethod
     def _generate_files(cls):
         super()._generate_files()
+        cls._check_axis_tdata_w()
+        # Store fingerprints of the setup inputs (reported by `setup_cache.py`)
+        record_step(cls.build_dir, f"{cls.name}:portmap", cls.peripheral_portmap)
+        record_step(cls.build_dir, f"{cls.name}:confs", cls.confs)
+
+        # Modifications of the Verilog sources. Each file is written once by `patches.apply()`.
+        patches = VerilogPatchSet(cls.build_dir)
 
         # Don't use hierarchical references for Quartus boards
         if os.getenv("BOARD") != "CYCLONEV-GT-DK" and USE_ILA_PFSM:
@@ -259,35 +481,41 @@ class iob_soc_tester(iob_soc_opencryptolinux):
                 cls.ila0_instance,
                 "hardware/src/iob_soc_tester.v",  # Name of the system file to generate the probe wires
                 sampling_clk="clk_i",  # Name of the internal system signal to use as the sampling clock
-                trigger_list=[
-                    "SUT0.AXISTREAMIN0.axis_tvalid_i"
-                ],  # List of signals to use as triggers
-                probe_list=[  # List of signals to probe
-                    ("SUT0.AXISTREAMIN0.axis_tdata_i", 32),
-                    ("SUT0.AXISTREAMIN0.data_fifo.w_level_o", 5),
-                    ("PFSM0.output_ports", 1),
-                ],
+                trigger_list=ILA0_PROBES.trigger_list,  # List of signals to use as triggers
+                probe_list=ILA0_PROBES.probe_list,  # List of signals to probe
             )
+            cls._generate_ila_layout()
 
             # Create a probe for input of (independent) PFSM
             # This PFSM will be used as an example, reacting to values of tvalid_i.
             # The output of this PFSM will be captured by the ILA.
-            insert_verilog_in_module(
+            patches.insert(
+                "hardware/src/iob_soc_tester.v",
                 "   assign PFSM0_input_ports = {SUT0.AXISTREAMIN0.axis_tvalid_i};",
-                cls.build_dir
-                + "/hardware/src/iob_soc_tester.v",  # Name of the system file to generate the probe wires
             )
 
-        # Connect UART0 and UART1 interrupt signals
-        inplace_change(
-            cls.build_dir
-            + "/hardware/src/iob_soc_tester.v",  # Name of the system file to generate the probe wires
+        # Wires used below must be mapped by the port map
+        wire = cls.peripheral_portmap.internal_wire
+        uart1_irq = wire("UART1", "interrupt", "interrupt_o")
+        axis_in_irq = wire("AXISTREAMIN0", "general", "interrupt_o")
+        axis_out_irq = wire("AXISTREAMOUT0", "general", "interrupt_o")
+        gpio1_inputs = wire("GPIO1", "gpio", "input_ports")
+        # Connect UART0, UART1 and AXISTREAMIN0 interrupt signals
+        # (AXISTREAMIN0 is source 3, used by the iob_soc_sut Linux driver)
+        patches.replace(
+            "hardware/src/iob_soc_tester.v",
             ".plicInterrupts({{30{1'b0}}, uart_interrupt_o, 1'b0}),",
-            ".plicInterrupts({{29{1'b0}}, UART1_interrupt_o, uart_interrupt_o, 1'b0}),",
+            f".plicInterrupts({{{{28{{1'b0}}}}, {axis_in_irq}, {uart1_irq}, uart_interrupt_o, 1'b0}}),",
+        )
+        # AXI stream FIFO interrupts can also be read from GPIO1
+        patches.insert(
+            "hardware/src/iob_soc_tester.v",
+            f"   assign {gpio1_inputs} = {{{axis_out_irq}, {axis_in_irq}}};",
         )
 
         # Connect General signals from iob-axis cores
-        insert_verilog_in_module(
+        patches.insert(
+            "hardware/src/iob_soc_tester.v",
             """
     assign SUT_AXISTREAMIN_AXISTREAMIN0_axis_clk_i = clk_i;
     assign SUT_AXISTREAMIN_AXISTREAMIN0_axis_cke_i = cke_i;
@@ -302,11 +530,10 @@ class iob_soc_tester(iob_soc_opencryptolinux):
     assign AXISTREAMOUT0_axis_cke_i = cke_i;
     assign AXISTREAMOUT0_axis_arst_i = arst_i;
              """,
-            cls.build_dir
-            + "/hardware/src/iob_soc_tester.v",  # Name of the system file to generate the probe wires
         )
 
-        insert_verilog_in_module(
+        patches.insert(
+            "hardware/src/iob_soc_tester.v",
             """
     // Connect ethernet clocks
     assign ETH1_MTxClk = ETH0_MTxClk;
@@ -319,25 +546,28 @@ class iob_soc_tester(iob_soc_opencryptolinux):
     assign SUT0_ETH0_ETH0_MColl = 1'b0;
     assign SUT0_ETH0_ETH0_MCrS = 1'b0;
              """,
-            cls.build_dir
-            + "/hardware/src/iob_soc_tester.v",  # Name of the system file to generate the probe wires
         )
 
-        if USE_ILA_PFSM:
-            cls._generate_monitor_bitstream()
-            cls._generate_pfsm_bitstream()
-
         # Temporary fix for regfileif (will not be needed with python-gen)
         if cls.is_top_module:
-            insert_verilog_in_module(
+            patches.insert(
+                "hardware/simulation/src/iob_soc_tester_sim_wrapper.v",
                 """
 `include "iob_regfileif_inverted_swreg_def.vh"
                 """,
-                cls.build_dir
-                + "/hardware/simulation/src/iob_soc_tester_sim_wrapper.v",  # Name of the system file to generate the probe wires
                 after_line="iob_soc_tester_wrapper_pwires.vs",
             )
 
+        if cls.is_top_module and SIM_CHECKPOINT:
+            cls._generate_sim_checkpoint(patches)
+
+        record_step(cls.build_dir, f"{cls.name}:verilog_patches", patches.patches)
+        patches.apply()
+
+        if USE_ILA_PFSM:
+            cls._generate_monitor_bitstream()
+            cls._generate_pfsm_bitstream()
+
         if cls.is_top_module:
             # Use Verilator and AES-KU040-DB-G by default.
             append_str_config_build_mk("SIMULATOR ?=verilator\n", cls.build_dir)
@@ -369,8 +599,10 @@ endif
 # Targets to copy ila_data.bin from remote machines
 copy_remote_fpga_ila_data:
 	scp $(BOARD_USER)@$(BOARD_SERVER):$(REMOTE_FPGA_DIR)/ila_data.bin . 2> /dev/null | true
+	scp $(BOARD_USER)@$(BOARD_SERVER):$(REMOTE_FPGA_DIR)/ila_stream.bin* . 2> /dev/null | true
 copy_remote_simulation_ila_data:
 	scp $(SIM_SCP_FLAGS) $(SIM_USER)@$(SIM_SERVER):$(REMOTE_SIM_DIR)/ila_data.bin . 2> /dev/null | true
+	scp $(SIM_SCP_FLAGS) $(SIM_USER)@$(SIM_SERVER):$(REMOTE_SIM_DIR)/ila_stream.bin* . 2> /dev/null | true
 .PHONY: copy_remote_fpga_ila_data copy_remote_simulation_ila_data
 
                 """,
@@ -387,8 +619,20 @@ copy_remote_simulation_ila_data:
                 os.path.join(cls.setup_dir, filepath.rsplit("/", 1)[0], "uut_build.mk")
             ) as fp:
                 data2append = fp.read()
-            with open(os.path.join(cls.build_dir, filepath), "a") as fp:
-                fp.write(data2append)
+            record_step(cls.build_dir, f"uut_build:{filepath}", data2append)
+            append_if_missing(os.path.join(cls.build_dir, filepath), data2append)
+        # Hex file generator used by the rules of uut_build.mk
+        sut_hex = os.path.join(os.path.dirname(__file__), "scripts", "sut_hex.py")
+        if record_step(
+            cls.build_dir, "sut_hex", file_hash(sut_hex), outputs=["scripts/sut_hex.py"]
+        ):
+            os.makedirs(os.path.join(cls.build_dir, "scripts"), exist_ok=True)
+            copy_if_changed(
+                sut_hex, os.path.join(cls.build_dir, "scripts", "sut_hex.py")
+            )
+
+        if cls.is_top_module and VERILATOR_THREADS:
+            cls._generate_verilator_threads()
 
         # Replace `MEM_ADDR_W` macro in *_firmware.S files by `SRAM_ADDR_W`
         # This prevents the Tester+SUT from using entire shared memory, therefore preventing conflicts
@@ -399,945 +643,197 @@ copy_remote_simulation_ila_data:
     @classmethod
     def _setup_portmap(cls):
         super()._setup_portmap()
-        cls.peripheral_portmap += [
+        portmap_specs = [
             # ================================================================== SUT IO mappings ==================================================================
             # SUT UART0
             # Map interrupt port to internal wire
-            (
-                {
-                    "corename": "UART1",
-                    "if_name": "interrupt",
-                    "port": "interrupt_o",
-                    "bits": [],
-                },
-                {"corename": "internal", "if_name": "UART1", "port": "", "bits": []},
-            ),
-            # Connect RX and TX of UART1 and SUT
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "uart",
-                    "port": "uart_rxd_i",
-                    "bits": [],
-                },
-                {"corename": "UART1", "if_name": "rs232", "port": "txd_o", "bits": []},
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "uart",
-                    "port": "uart_txd_o",
-                    "bits": [],
-                },
-                {"corename": "UART1", "if_name": "rs232", "port": "rxd_i", "bits": []},
-            ),
-            # Connect CTS and RTS of UART1 and SUT
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "uart",
-                    "port": "uart_cts_i",
-                    "bits": [],
-                },
-                {"corename": "UART1", "if_name": "rs232", "port": "rts_o", "bits": []},
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "uart",
-                    "port": "uart_rts_o",
-                    "bits": [],
-                },
-                {"corename": "UART1", "if_name": "rs232", "port": "cts_i", "bits": []},
+            to_internal("UART1", "interrupt", ["interrupt_o"]),
+            # Connect RX, TX, CTS and RTS of UART1 and SUT
+            connect(
+                "SUT0",
+                "uart",
+                "UART1",
+                "rs232",
+                [
+                    ("uart_rxd_i", "txd_o"),
+                    ("uart_txd_o", "rxd_i"),
+                    ("uart_cts_i", "rts_o"),
+                    ("uart_rts_o", "cts_i"),
+                ],
             ),
-            # SUT ETHERNET0
-            ####({'corename':'SUT0', 'if_name':'ETHERNET0_ethernet', 'port':'', 'bits':[]},         {'corename':'', 'if_name':'', 'port':'', 'bits':[]}), #Map ETHERNET0 of Tester to external interface
-            ####({'corename':'SUT0', 'if_name':'ETHERNET1_ethernet', 'port':'', 'bits':[]},         {'corename':'ETHERNET0', 'if_name':'ethernet', 'port':'', 'bits':[]}), #Map ETHERNET0 of SUT to ETHERNET0 of Tester
             # SUT GPIO0
-            (
-                {
-                    "corename": "GPIO0",
-                    "if_name": "gpio",
-                    "port": "input_ports",
-                    "bits": [],
-                },
-                {
-                    "corename": "SUT0",
-                    "if_name": "GPIO0",
-                    "port": "GPIO0_output_ports",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "GPIO0",
-                    "if_name": "gpio",
-                    "port": "output_ports",
-                    "bits": [],
-                },
-                {
-                    "corename": "SUT0",
-                    "if_name": "GPIO0",
-                    "port": "GPIO0_input_ports",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "GPIO0",
-                    "if_name": "gpio",
-                    "port": "output_enable",
-                    "bits": [],
-                },
-                {"corename": "external", "if_name": "GPIO", "port": "", "bits": []},
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "GPIO0",
-                    "port": "GPIO0_output_enable",
-                    "bits": [],
-                },
-                {"corename": "external", "if_name": "SUT", "port": "", "bits": []},
+            connect(
+                "GPIO0",
+                "gpio",
+                "SUT0",
+                "GPIO0",
+                [
+                    ("input_ports", "GPIO0_output_ports"),
+                    ("output_ports", "GPIO0_input_ports"),
+                ],
             ),
+            to_external("GPIO0", "gpio", ["output_enable"], "GPIO"),
+            to_external("SUT0", "GPIO0", ["GPIO0_output_enable"], "SUT"),
             # SUT AXISTREAM IN - General signals
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "AXISTREAMIN0_axis_clk_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT_AXISTREAMIN",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "AXISTREAMIN0_axis_cke_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT_AXISTREAMIN",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "AXISTREAMIN0_axis_arst_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT_AXISTREAMIN",
-                    "port": "",
-                    "bits": [],
-                },
+            to_internal(
+                "SUT0",
+                "AXISTREAMIN0",
+                [
+                    "AXISTREAMIN0_axis_clk_i",
+                    "AXISTREAMIN0_axis_cke_i",
+                    "AXISTREAMIN0_axis_arst_i",
+                ],
+                "SUT_AXISTREAMIN",
             ),
             # Tester AXISTREAM IN - General signals
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_clk_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_cke_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_arst_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "",
-                    "bits": [],
-                },
+            to_internal(
+                "AXISTREAMIN0", "axistream", ["axis_clk_i", "axis_cke_i", "axis_arst_i"]
             ),
             # SUT AXISTREAM IN
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "AXISTREAMIN0_axis_tvalid_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_tvalid_o",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "AXISTREAMIN0_axis_tready_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_tready_i",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "AXISTREAMIN0_axis_tdata_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_tdata_o",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMIN0",
-                    "port": "AXISTREAMIN0_axis_tlast_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_tlast_o",
-                    "bits": [],
-                },
+            connect(
+                "SUT0",
+                "AXISTREAMIN0",
+                "AXISTREAMOUT0",
+                "axistream",
+                [
+                    ("AXISTREAMIN0_axis_tvalid_i", "axis_tvalid_o"),
+                    ("AXISTREAMIN0_axis_tready_o", "axis_tready_i"),
+                    ("AXISTREAMIN0_axis_tdata_i", "axis_tdata_o"),
+                    ("AXISTREAMIN0_axis_tlast_i", "axis_tlast_o"),
+                ],
             ),
             # SUT AXISTREAM OUT - General signals
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "AXISTREAMOUT0_axis_clk_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT_AXISTREAMOUT",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "AXISTREAMOUT0_axis_cke_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT_AXISTREAMOUT",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "AXISTREAMOUT0_axis_arst_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT_AXISTREAMOUT",
-                    "port": "",
-                    "bits": [],
-                },
+            to_internal(
+                "SUT0",
+                "AXISTREAMOUT0",
+                [
+                    "AXISTREAMOUT0_axis_clk_i",
+                    "AXISTREAMOUT0_axis_cke_i",
+                    "AXISTREAMOUT0_axis_arst_i",
+                ],
+                "SUT_AXISTREAMOUT",
             ),
             # Tester AXISTREAM OUT - General signals
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_clk_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_cke_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "axistream",
-                    "port": "axis_arst_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "",
-                    "bits": [],
-                },
+            to_internal(
+                "AXISTREAMOUT0",
+                "axistream",
+                ["axis_clk_i", "axis_cke_i", "axis_arst_i"],
             ),
             # SUT AXISTREAM OUT
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "AXISTREAMOUT0_axis_tvalid_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_tvalid_i",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "AXISTREAMOUT0_axis_tready_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_tready_o",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "AXISTREAMOUT0_axis_tdata_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_tdata_i",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "AXISTREAMOUT0",
-                    "port": "AXISTREAMOUT0_axis_tlast_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "axistream",
-                    "port": "axis_tlast_i",
-                    "bits": [],
-                },
+            connect(
+                "SUT0",
+                "AXISTREAMOUT0",
+                "AXISTREAMIN0",
+                "axistream",
+                [
+                    ("AXISTREAMOUT0_axis_tvalid_o", "axis_tvalid_i"),
+                    ("AXISTREAMOUT0_axis_tready_i", "axis_tready_o"),
+                    ("AXISTREAMOUT0_axis_tdata_o", "axis_tdata_i"),
+                    ("AXISTREAMOUT0_axis_tlast_o", "axis_tlast_i"),
+                ],
             ),
             # Tester AXISTREAM IN DMA
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tvalid_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "DMA0",
-                    "if_name": "dma_input",
-                    "port": "tvalid_i",
-                    "bits": [0],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tready_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "DMA0",
-                    "if_name": "dma_input",
-                    "port": "tready_o",
-                    "bits": [0],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tdata_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "DMA0",
-                    "if_name": "dma_input",
-                    "port": "tdata_i",
-                    "bits": list(range(32)),
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMIN0",
-                    "if_name": "general",
-                    "port": "interrupt_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "GPIO1",
-                    "if_name": "gpio",
-                    "port": "input_ports",
-                    "bits": [0],
-                },
+            connect(
+                "AXISTREAMIN0",
+                "sys_axis",
+                "DMA0",
+                "dma_input",
+                [
+                    ("sys_tvalid_o", "tvalid_i", [0]),
+                    ("sys_tready_i", "tready_o", [0]),
+                    ("sys_tdata_o", "tdata_i", list(range(32))),
+                ],
             ),
+            # Interrupt goes to the PLIC and to GPIO1 input 0
+            to_internal("AXISTREAMIN0", "general", ["interrupt_o"]),
             # TESTER AXISTREAM OUT DMA
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tvalid_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "DMA0",
-                    "if_name": "dma_output",
-                    "port": "tvalid_o",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tready_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "DMA0",
-                    "if_name": "dma_output",
-                    "port": "tready_i",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "sys_axis",
-                    "port": "sys_tdata_i",
-                    "bits": [],
-                },
-                {
-                    "corename": "DMA0",
-                    "if_name": "dma_output",
-                    "port": "tdata_o",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "AXISTREAMOUT0",
-                    "if_name": "general",
-                    "port": "interrupt_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "GPIO1",
-                    "if_name": "gpio",
-                    "port": "input_ports",
-                    "bits": [1],
-                },
-            ),
-            # GPIO1 unused ports
-            # Connect them to internal floating wires
-            (
-                {
-                    "corename": "GPIO1",
-                    "if_name": "gpio",
-                    "port": "output_ports",
-                    "bits": [],
-                },
-                {"corename": "internal", "if_name": "GPIO1", "port": "", "bits": []},
+            connect(
+                "AXISTREAMOUT0",
+                "sys_axis",
+                "DMA0",
+                "dma_output",
+                [
+                    ("sys_tvalid_i", "tvalid_o"),
+                    ("sys_tready_o", "tready_i"),
+                    ("sys_tdata_i", "tdata_o"),
+                ],
             ),
-            (
-                {
-                    "corename": "GPIO1",
-                    "if_name": "gpio",
-                    "port": "output_enable",
-                    "bits": [],
-                },
-                {"corename": "internal", "if_name": "GPIO1", "port": "", "bits": []},
+            # Interrupt goes to GPIO1 input 1
+            to_internal("AXISTREAMOUT0", "general", ["interrupt_o"]),
+            # GPIO1 inputs are assigned the AXI stream interrupts.
+            # Unused ports are connected to internal floating wires.
+            to_internal(
+                "GPIO1", "gpio", ["input_ports", "output_ports", "output_enable"]
             ),
             # ETHERNET 1
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "general",
-                    "port": "inta_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "ETH1",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
+            to_internal("ETH1", "general", ["inta_o"]),
             # phy - connect to SUT ETH0 interface
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MTxClk",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "ETH1",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MTxD",
-                    "bits": [],
-                },
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MRxD",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MTxEn",
-                    "bits": [],
-                },
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MRxDv",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MTxErr",
-                    "bits": [],
-                },
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MRxErr",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MRxClk",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "ETH1",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MRxDv",
-                    "bits": [],
-                },
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MTxEn",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MRxD",
-                    "bits": [],
-                },
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MTxD",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MRxErr",
-                    "bits": [],
-                },
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MTxErr",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MColl",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "ETH1",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MCrS",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "ETH1",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MDC",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "ETH1",
-                    "port": "",
-                    "bits": [],
-                },
+            to_internal("ETH1", "phy", ["MTxClk"]),
+            connect(
+                "ETH1",
+                "phy",
+                "SUT0",
+                "ETH0",
+                [
+                    ("MTxD", "ETH0_MRxD"),
+                    ("MTxEn", "ETH0_MRxDv"),
+                    ("MTxErr", "ETH0_MRxErr"),
+                ],
             ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "MDIO",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "ETH1",
-                    "port": "",
-                    "bits": [],
-                },
+            to_internal("ETH1", "phy", ["MRxClk"]),
+            connect(
+                "ETH1",
+                "phy",
+                "SUT0",
+                "ETH0",
+                [
+                    ("MRxDv", "ETH0_MTxEn"),
+                    ("MRxD", "ETH0_MTxD"),
+                    ("MRxErr", "ETH0_MTxErr"),
+                ],
             ),
-            (
-                {
-                    "corename": "ETH1",
-                    "if_name": "phy",
-                    "port": "phy_rstn_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "ETH1",
-                    "port": "",
-                    "bits": [],
-                },
+            to_internal(
+                "ETH1", "phy", ["MColl", "MCrS", "MDC", "MDIO", "phy_rstn_o"]
             ),
             # Remaining SUT0 ETH0 signals
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MTxClk",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT0_ETH0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MRxClk",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT0_ETH0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MColl",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT0_ETH0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MCrS",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT0_ETH0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MDC",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT0_ETH0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_phy_rstn_o",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT0_ETH0",
-                    "port": "",
-                    "bits": [],
-                },
-            ),
-            (
-                {
-                    "corename": "SUT0",
-                    "if_name": "ETH0",
-                    "port": "ETH0_MDIO",
-                    "bits": [],
-                },
-                {
-                    "corename": "internal",
-                    "if_name": "SUT0_ETH0",
-                    "port": "",
-                    "bits": [],
-                },
+            to_internal(
+                "SUT0",
+                "ETH0",
+                [
+                    "ETH0_MTxClk",
+                    "ETH0_MRxClk",
+                    "ETH0_MColl",
+                    "ETH0_MCrS",
+                    "ETH0_MDC",
+                    "ETH0_phy_rstn_o",
+                    "ETH0_MDIO",
+                ],
+                "SUT0_ETH0",
             ),
         ]
-
         if USE_ILA_PFSM:
-            cls.peripheral_portmap += [
+            portmap_specs += [
                 # ILA IO --- Connect IOs of Integrated Logic Analyzer to internal system signals
-                (
-                    {
-                        "corename": "ILA0",
-                        "if_name": "ila",
-                        "port": "signal",
-                        "bits": [],
-                    },
-                    {
-                        "corename": "internal",
-                        "if_name": "ILA0",
-                        "port": "",
-                        "bits": [],
-                    },
-                ),
-                (
-                    {
-                        "corename": "ILA0",
-                        "if_name": "ila",
-                        "port": "trigger",
-                        "bits": [],
-                    },
-                    {
-                        "corename": "internal",
-                        "if_name": "ILA0",
-                        "port": "",
-                        "bits": [],
-                    },
-                ),
-                (
-                    {
-                        "corename": "ILA0",
-                        "if_name": "ila",
-                        "port": "sampling_clk",
-                        "bits": [],
-                    },
-                    {
-                        "corename": "internal",
-                        "if_name": "ILA0",
-                        "port": "",
-                        "bits": [],
-                    },
-                ),
+                to_internal("ILA0", "ila", ["signal", "trigger", "sampling_clk"]),
                 # ILA DMA
-                # Connect these signals to internal floating wires.
-                (
-                    {
-                        "corename": "ILA0",
-                        "if_name": "dma",
-                        "port": "tvalid_o",
-                        "bits": [],
-                    },
-                    {
-                        "corename": "DMA0",
-                        "if_name": "dma_input",
-                        "port": "tvalid_i",
-                        "bits": [1],
-                    },
-                ),
-                (
-                    {
-                        "corename": "ILA0",
-                        "if_name": "dma",
-                        "port": "tready_i",
-                        "bits": [],
-                    },
-                    {
-                        "corename": "DMA0",
-                        "if_name": "dma_input",
-                        "port": "tready_o",
-                        "bits": [1],
-                    },
-                ),
-                (
-                    {
-                        "corename": "ILA0",
-                        "if_name": "dma",
-                        "port": "tdata_o",
-                        "bits": [],
-                    },
-                    {
-                        "corename": "DMA0",
-                        "if_name": "dma_input",
-                        "port": "tdata_i",
-                        "bits": list(range(32, 64)),
-                    },
+                connect(
+                    "ILA0",
+                    "dma",
+                    "DMA0",
+                    "dma_input",
+                    [
+                        ("tvalid_o", "tvalid_i", [1]),
+                        ("tready_i", "tready_o", [1]),
+                        ("tdata_o", "tdata_i", list(range(32, 64))),
+                    ],
                 ),
                 # PFSM IO --- Connect IOs of Programmable Finite State Machine to internal system signals
-                (
-                    {
-                        "corename": "PFSM0",
-                        "if_name": "pfsm",
-                        "port": "input_ports",
-                        "bits": [],
-                    },
-                    {
-                        "corename": "internal",
-                        "if_name": "PFSM0",
-                        "port": "",
-                        "bits": [],
-                    },
-                ),
-                (
-                    {
-                        "corename": "PFSM0",
-                        "if_name": "pfsm",
-                        "port": "output_ports",
-                        "bits": [],
-                    },
-                    {
-                        "corename": "internal",
-                        "if_name": "PFSM0",
-                        "port": "",
-                        "bits": [],
-                    },
-                ),
+                to_internal("PFSM0", "pfsm", ["input_ports", "output_ports"]),
             ]
+        # Index connections by port, to detect ports mapped more than once
+        cls.peripheral_portmap = PortmapIndex(
+            portmap_specs, cls.peripherals, cls.peripheral_portmap
+        )
 
     @classmethod
     def _setup_confs(cls):
@@ -1353,6 +849,54 @@ copy_remote_simulation_ila_data:
                     "max": "32",
                     "descr": "SRAM address width",
                 },
+                {
+                    "name": "PFSM_REPROGRAM",
+                    "type": "M",
+                    "val": "PFSM_REPROGRAM" in sys.argv,
+                    "min": "0",
+                    "max": "1",
+                    "descr": "Reprogram PFSMs at runtime with bitstreams given by the console (see scripts/pfsm_reprogram.py)",
+                },
+                {
+                    "name": "SIM_CHECKPOINT",
+                    "type": "M",
+                    "val": SIM_CHECKPOINT,
+                    "min": "0",
+                    "max": "1",
+                    "descr": "Request a checkpoint of the simulation (GPIO1 output 0) once both cores reach main",
+                },
+                {
+                    "name": "BENCHMARK",
+                    "type": "M",
+                    "val": "BENCHMARK" in sys.argv,
+                    "min": "0",
+                    "max": "1",
+                    "descr": "Measure throughput and latency of the links to the SUT before the test (see link_bench.py)",
+                },
+                {
+                    "name": "PHASE_TIMING",
+                    "type": "M",
+                    "val": "PHASE_TIMING" in sys.argv,
+                    "min": "0",
+                    "max": "1",
+                    "descr": "Send the phase timing of the Tester and SUT firmwares to phases.bin at the end of the test (see phase_report.py)",
+                },
+                {
+                    "name": "AXIS_TDATA_W",
+                    "type": "M",
+                    "val": str(AXIS_TDATA_W),
+                    "min": "32",
+                    "max": "128",
+                    "descr": "Width of the data (TDATA_W) of the AXI streams between the Tester and the SUT, in bits",
+                },
+                {
+                    "name": "ILA_STREAM_SAMPLES",
+                    "type": "M",
+                    "val": ILA_STREAM_SAMPLES if USE_ILA_PFSM else False,
+                    "min": "0",
+                    "max": "NA",
+                    "descr": "Number of samples of continuous ILA capture streamed to external memory (see scripts/ila_stream.py)",
+                },
             ]
         )
 
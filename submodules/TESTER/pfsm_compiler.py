@@ -0,0 +1,201 @@
+# Compiler for PFSM programs with unreachable record removal and bitstream cache.
+#
+# Programs are lists of records with the same fields as `iob_fsm_record`:
+#   (label, input_cond, next_state, output_expr)
+# - input_cond: string of '0', '1' and '-' (don't care) characters, one per input
+#   bit (MSB first). If it matches the inputs, the PFSM jumps to the record with
+#   label `next_state`. Otherwise (or with an empty input_cond), it continues to
+#   the next record. The last record continues to state len(records), which is
+#   not programmed, unless the program uses all the 2**STATE_W states (then it
+#   wraps around to the first record).
+#
+# The compiler:
+# - evaluates the input conditions of all records for every input value at once
+#   (vectorized with numpy when available), to obtain the state transition table;
+# - removes the records that are unreachable from the first record, so they do
+#   not use PFSM states;
+# - caches the generated bitstream, keyed by the hash of the widths, the records,
+#   and the source of `iob_pfsm_program`. Unchanged programs are copied from the
+#   cache instead of being generated again.
+#
+# The cache is stored in $PFSM_CACHE_DIR (default: $XDG_CACHE_HOME/iob_pfsm or ~/.cache/iob_pfsm).
+import os
+import sys
+import shutil
+import hashlib
+import inspect
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from iob_pfsm_program import iob_pfsm_program, iob_fsm_record
+
+# Increase when the output of this compiler changes, to invalidate old cache entries
+COMPILER_VERSION = 1
+
+
+class PfsmCompileError(Exception):
+    """Raised for invalid PFSM programs"""
+
+
+def cache_dir():
+    """Return directory of the bitstream cache"""
+    if os.getenv("PFSM_CACHE_DIR"):
+        return os.getenv("PFSM_CACHE_DIR")
+    xdg_cache = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(xdg_cache, "iob_pfsm")
+
+
+def _program_source_hash():
+    """Hash of the bitstream generator source, so cache entries follow its changes"""
+    try:
+        with open(inspect.getsourcefile(iob_pfsm_program), "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (OSError, TypeError):
+        return getattr(sys.modules[iob_pfsm_program.__module__], "__version__", "")
+
+
+class PfsmCompiler:
+    def __init__(self, state_w, input_w, output_w, records):
+        """state_w, input_w, output_w: widths of the PFSM
+        records: list of (label, input_cond, next_state, output_expr) tuples
+        """
+        # Widths may be given as strings, like the parameters of the instances
+        self.state_w = int(state_w)
+        self.input_w = int(input_w)
+        self.output_w = int(output_w)
+        self.records = [tuple(record) for record in records]
+        self.labels = {}
+        for idx, (label, _, _, _) in enumerate(self.records):
+            if label:
+                if label in self.labels:
+                    raise PfsmCompileError(f"Duplicate PFSM label '{label}'.")
+                self.labels[label] = idx
+        if len(self.records) > 2**self.state_w:
+            raise PfsmCompileError(
+                f"PFSM program has {len(self.records)} records, but STATE_W={self.state_w} only allows {2**self.state_w}."
+            )
+
+    def _cond_masks(self, cond):
+        """Return (care_mask, value_mask) of an input condition"""
+        if len(cond) > self.input_w or any(c not in "01-" for c in cond):
+            raise PfsmCompileError(
+                f"Invalid input condition '{cond}' for INPUT_W={self.input_w}."
+            )
+        care, value = 0, 0
+        for bit, c in enumerate(reversed(cond)):
+            if c != "-":
+                care |= 1 << bit
+                value |= int(c) << bit
+        return care, value
+
+    def transition_table(self):
+        """Return next record index of each record, for each input value.
+        returns: list with one row per record (numpy array if available), with 2**INPUT_W entries each.
+        """
+        n_inputs = 2**self.input_w
+        inputs = np.arange(n_inputs) if np else range(n_inputs)
+        table = []
+        for idx, (_, cond, next_state, _) in enumerate(self.records):
+            fall_through = self._fall_through(idx)
+            if not cond:
+                row = [fall_through] * n_inputs
+                table.append(np.array(row) if np else row)
+                continue
+            if next_state not in self.labels:
+                raise PfsmCompileError(f"Unknown PFSM label '{next_state}'.")
+            target = self.labels[next_state]
+            care, value = self._cond_masks(cond)
+            if np:
+                table.append(np.where((inputs & care) == value, target, fall_through))
+            else:
+                table.append(
+                    [target if (i & care) == value else fall_through for i in inputs]
+                )
+        return table
+
+    def _fall_through(self, state):
+        """Return next state of `state` when it does not jump, like the hardware"""
+        return (state + 1) % 2**self.state_w
+
+    def reachable(self):
+        """Return sorted indexes of records reachable from the first record"""
+        table = self.transition_table()
+        visited = {0}
+        pending = [0]
+        while pending:
+            state = pending.pop()
+            # State after the last record is not programmed: no known transitions
+            if state >= len(self.records):
+                continue
+            row = table[state]
+            for nxt in set(np.unique(row).tolist() if np else row):
+                if nxt not in visited:
+                    visited.add(nxt)
+                    pending.append(nxt)
+        return sorted(idx for idx in visited if idx < len(self.records))
+
+    def minimized_records(self):
+        """Return records without the unreachable ones"""
+        reachable = self.reachable()
+        kept = [self.records[idx] for idx in reachable]
+        # Fall-through must keep pointing to the same state: jump explicitly if needed
+        for pos, idx in enumerate(reachable):
+            if self._always_jumps(self.records[idx]):
+                continue
+            old_next = self._fall_through(idx)
+            new_next = self._fall_through(pos)
+            if old_next < len(self.records):
+                same = new_next < len(kept) and reachable[new_next] == old_next
+            else:
+                # Both must fall through to the state after the program
+                same = new_next >= len(kept)
+            if not same:
+                raise PfsmCompileError(
+                    f"Record {idx} falls through to state {old_next}, which changes"
+                    " when unreachable records are removed."
+                )
+        return kept
+
+    def _always_jumps(self, record):
+        cond = record[1]
+        return bool(cond) and self._cond_masks(cond)[0] == 0
+
+    def cache_key(self):
+        data = repr(
+            (
+                COMPILER_VERSION,
+                _program_source_hash(),
+                self.state_w,
+                self.input_w,
+                self.output_w,
+                self.records,
+            )
+        )
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def compile(self, bitstream_path):
+        """Generate bitstream in `bitstream_path`, using the cache when possible.
+        returns: True if the bitstream was found in the cache
+        """
+        cached = os.path.join(cache_dir(), f"{self.cache_key()}.bit")
+        if os.path.isfile(cached):
+            shutil.copyfile(cached, bitstream_path)
+            return True
+        program = iob_pfsm_program(self.state_w, self.input_w, self.output_w)
+        program.set_records(
+            [iob_fsm_record(*record) for record in self.minimized_records()]
+        )
+        program.generate_bitstream(bitstream_path)
+        try:
+            os.makedirs(cache_dir(), exist_ok=True)
+            tmp_path = f"{cached}.{os.getpid()}.tmp"
+            shutil.copyfile(bitstream_path, tmp_path)
+            os.replace(tmp_path, cached)
+        except OSError as e:
+            print(f"PFSM compiler: could not store bitstream in cache: {e}")
+        return False
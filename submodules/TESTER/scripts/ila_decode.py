@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# Decode ILA captures into VCD files.
+#
+# Two capture formats are supported:
+# - Binary (like `ila_data.bin`, created by `send_ila_capture()` in the Tester
+#   firmware): a header with the ILA configuration and the probe fields (see
+#   `ila_capture_header_t`), followed by the samples, as little-endian 32-bit
+#   words (least significant word first).
+# - Hex text (created by `ila_output_data()` of the ILA drivers): one line per
+#   sample, with the sample value in hexadecimal (most significant digit first).
+#   The position of each probe in the sample is given by the layout file created
+#   during setup (`<ILA instance name>_layout.json`, next to this script), that
+#   follows the probe list passed to `iob_ila.generate_system_wires()`:
+#     {"name": "ILA0", "clk_counter_w": 16,
+#      "fields": [{"name": "SUT0.AXISTREAMIN0.axis_tdata_i", "lsb": 16, "width": 32}, ...]}
+#
+# The capture is memory-mapped and decoded in blocks of samples. With numpy,
+# each block is converted and split into fields with array operations, and only
+# the values that change are written to the VCD file. Without numpy, samples are
+# decoded one by one.
+#
+# Usage:
+#   ila_decode.py <ILA instance name> <capture file> <vcd file> [--layout <layout file>]
+# (The layout file is only used for hex text captures.)
+import os
+import sys
+import json
+import mmap
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Number of samples decoded at once
+BLOCK_SAMPLES = 1 << 16
+
+# Binary capture header: magic, version, header_size, buffer_w, clk_counter_w, sample_words, n_probes, n_samples
+CAPTURE_MAGIC = b"ILAB"
+CAPTURE_HEADER = struct.Struct("<4sHHBBBBI")
+
+
+def load_layout(name, layout_path=None):
+    if not layout_path:
+        layout_path = os.path.join(os.path.dirname(__file__), f"{name}_layout.json")
+    with open(layout_path) as f:
+        return json.load(f)
+
+
+def read_capture_header(name, data):
+    """Read header of binary capture.
+    returns: (layout, header_size, sample_words, n_samples)
+    """
+    (
+        _,
+        version,
+        header_size,
+        _,
+        clk_counter_w,
+        sample_words,
+        n_probes,
+        n_samples,
+    ) = CAPTURE_HEADER.unpack_from(data)
+    if version != 1:
+        sys.exit(f"Unsupported ILA capture version {version}.")
+    offset = CAPTURE_HEADER.size
+    probe_fields = struct.unpack_from(f"<{2 * n_probes}H", data, offset)
+    offset += 4 * n_probes
+    names = bytes(data[offset:header_size]).split(b"\0")
+    layout = {
+        "name": name,
+        "clk_counter_w": clk_counter_w,
+        "fields": [
+            {
+                "name": names[idx].decode(),
+                "lsb": probe_fields[2 * idx],
+                "width": probe_fields[2 * idx + 1],
+            }
+            for idx in range(n_probes)
+        ],
+    }
+    # Captures may be cut short
+    n_samples = min(n_samples, (len(data) - header_size) // (4 * sample_words))
+    return layout, header_size, sample_words, n_samples
+
+
+def vcd_header(layout, ids):
+    header = [
+        "$comment Generated by ila_decode.py. Time unit is one sampling clock cycle. $end",
+        "$timescale 1 ns $end",
+        f"$scope module {layout['name']} $end",
+    ]
+    for field in layout["fields"]:
+        # Hierarchical names are not valid VCD identifiers
+        signal = field["name"].replace(".", "_")
+        header.append(f"$var wire {field['width']} {ids[field['name']]} {signal} $end")
+    header += ["$upscope $end", "$enddefinitions $end", ""]
+    return "\n".join(header)
+
+
+def vcd_value(value, width, id_code):
+    if width == 1:
+        return f"{value}{id_code}"
+    return f"b{value:b} {id_code}"
+
+
+class _Decoder:
+    """Convert decoded sample fields to VCD changes, keeping state between blocks"""
+
+    def __init__(self, layout, out):
+        self.layout = layout
+        self.out = out
+        self.counter_w = layout.get("clk_counter_w", 0)
+        self.ids = {
+            field["name"]: _id_code(idx) for idx, field in enumerate(layout["fields"])
+        }
+        self.time = 0
+        self.last_counter = None
+        self.last_values = None
+        self.n_samples = 0
+
+    def _advance(self, counter):
+        """Return absolute time of sample with (wrapping) clock counter value"""
+        if self.counter_w == 0:
+            return self.n_samples
+        if self.last_counter is not None:
+            self.time += (counter - self.last_counter) % (1 << self.counter_w)
+        self.last_counter = counter
+        return self.time
+
+    def write_sample(self, sample):
+        """Decode one sample (python int). Used without numpy."""
+        counter = sample & ((1 << self.counter_w) - 1)
+        values = [
+            (sample >> f["lsb"]) & ((1 << f["width"]) - 1)
+            for f in self.layout["fields"]
+        ]
+        time = self._advance(counter)
+        changes = [
+            vcd_value(v, f["width"], self.ids[f["name"]])
+            for idx, (f, v) in enumerate(zip(self.layout["fields"], values))
+            if self.last_values is None or self.last_values[idx] != v
+        ]
+        if changes:
+            self.out.write(f"#{time}\n" + "\n".join(changes) + "\n")
+        self.last_values = values
+        self.n_samples += 1
+
+    def write_block(self, words):
+        """Decode block of samples.
+        words: uint64 array with one row per sample, with 32 bits per column (LSB column first)
+        """
+        n = words.shape[0]
+        if self.counter_w:
+            counter = _extract(words, 0, self.counter_w)[:, 0].astype(np.int64)
+            if self.last_counter is None:
+                prev = counter[0]
+            else:
+                prev = np.int64(self.last_counter)
+            deltas = np.diff(counter, prepend=prev) % (1 << self.counter_w)
+            times = self.time + np.cumsum(deltas)
+            self.time = int(times[-1])
+            self.last_counter = int(counter[-1])
+        else:
+            times = np.arange(self.n_samples, self.n_samples + n)
+
+        # Values and changes of each field (fields are arrays of 32-bit limbs)
+        fields = []
+        for field in self.layout["fields"]:
+            limbs = _extract(words, field["lsb"], field["width"])
+            changed = np.empty(n, dtype=bool)
+            changed[1:] = np.any(limbs[1:] != limbs[:-1], axis=1)
+            changed[0] = self.last_values is None or bool(
+                np.any(limbs[0] != self.last_values[len(fields)])
+            )
+            fields.append((field, limbs, changed))
+        self.last_values = [limbs[-1].copy() for _, limbs, _ in fields]
+
+        any_change = np.zeros(n, dtype=bool)
+        for _, _, changed in fields:
+            any_change |= changed
+        lines = []
+        for row in np.flatnonzero(any_change):
+            lines.append(f"#{times[row]}")
+            for field, limbs, changed in fields:
+                if changed[row]:
+                    value = 0
+                    for k, limb in enumerate(limbs[row].tolist()):
+                        value |= limb << (32 * k)
+                    lines.append(
+                        vcd_value(value, field["width"], self.ids[field["name"]])
+                    )
+        if lines:
+            self.out.write("\n".join(lines) + "\n")
+        self.n_samples += n
+
+
+def _id_code(idx):
+    """VCD identifier code: printable characters from '!' to '~'"""
+    code = ""
+    while True:
+        code += chr(33 + idx % 94)
+        idx //= 94
+        if not idx:
+            return code
+
+
+def _extract(words, lsb, width):
+    """Extract bit field from samples.
+    returns: uint64 array with one row per sample, and 32-bit limbs of the field (LSB first)
+    """
+    n_limbs = (width + 31) // 32
+    limbs = np.zeros((words.shape[0], n_limbs), dtype=np.uint64)
+    for k in range(n_limbs):
+        pos = lsb + 32 * k
+        word, offset = divmod(pos, 32)
+        limb = words[:, word] >> np.uint64(offset)
+        if offset and word + 1 < words.shape[1]:
+            limb |= words[:, word + 1] << np.uint64(32 - offset)
+        bits = min(32, width - 32 * k)
+        limbs[:, k] = limb & np.uint64((1 << bits) - 1)
+    return limbs
+
+
+def _hex_lut():
+    lut = np.full(256, 0xFF, dtype=np.uint8)
+    for c in "0123456789abcdef":
+        lut[ord(c)] = int(c, 16)
+        lut[ord(c.upper())] = int(c, 16)
+    return lut
+
+
+def _decode_numpy(data, decoder):
+    raw = np.frombuffer(data, dtype=np.uint8)
+    line_len = data.find(b"\n")
+    if line_len < 0:
+        line_len = len(raw)
+    stride = line_len + 1
+    n_samples = (len(raw) + 1) // stride  # Last line may not end with newline
+    n_words = (line_len + 7) // 8
+    lut = _hex_lut()
+    # Weights of the nibbles of each 32-bit word (most significant first)
+    shifts = np.arange(28, -1, -4, dtype=np.uint64)
+
+    for start in range(0, n_samples, BLOCK_SAMPLES):
+        stop = min(n_samples, start + BLOCK_SAMPLES)
+        block = raw[start * stride : stop * stride]
+        if len(block) < (stop - start) * stride:
+            block = np.append(block, np.uint8(ord("\n")))
+        lines = block.reshape(-1, stride)
+        if np.any(lines[:, line_len] != ord("\n")):
+            sys.exit("ILA capture has lines of different lengths.")
+        nibbles = lut[lines[:, :line_len]]
+        if np.any(nibbles == 0xFF):
+            sys.exit("ILA capture has invalid hexadecimal characters.")
+        # Left-pad to a whole number of 32-bit words
+        pad = n_words * 8 - line_len
+        if pad:
+            nibbles = np.pad(nibbles, ((0, 0), (pad, 0)))
+        nibbles = nibbles.reshape(-1, n_words, 8).astype(np.uint64)
+        words = np.bitwise_or.reduce(nibbles << shifts, axis=2)
+        # LSB word first
+        decoder.write_block(np.ascontiguousarray(words[:, ::-1]))
+
+
+def _decode_binary_numpy(data, decoder, header_size, sample_words, n_samples):
+    words = np.frombuffer(
+        data, dtype="<u4", count=n_samples * sample_words, offset=header_size
+    ).reshape(-1, sample_words)
+    for start in range(0, n_samples, BLOCK_SAMPLES):
+        decoder.write_block(words[start : start + BLOCK_SAMPLES].astype(np.uint64))
+
+
+def _decode_binary_python(data, decoder, header_size, sample_words, n_samples):
+    sample_size = 4 * sample_words
+    for idx in range(n_samples):
+        offset = header_size + idx * sample_size
+        decoder.write_sample(
+            int.from_bytes(data[offset : offset + sample_size], "little")
+        )
+
+
+def _decode_python(data, decoder):
+    for line in bytes(data).split(b"\n"):
+        line = line.strip()
+        if line:
+            decoder.write_sample(int(line, 16))
+
+
+def decode(name, capture_path, vcd_path, layout_path=None):
+    with open(capture_path, "rb") as f, open(vcd_path, "w") as out:
+        if os.fstat(f.fileno()).st_size == 0:
+            layout = load_layout(name, layout_path)
+            out.write(vcd_header(layout, _Decoder(layout, out).ids))
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[: len(CAPTURE_MAGIC)] == CAPTURE_MAGIC:
+                layout, *capture = read_capture_header(name, data)
+                decoder = _Decoder(layout, out)
+                out.write(vcd_header(layout, decoder.ids))
+                if np:
+                    _decode_binary_numpy(data, decoder, *capture)
+                else:
+                    _decode_binary_python(data, decoder, *capture)
+            else:
+                layout = load_layout(name, layout_path)
+                decoder = _Decoder(layout, out)
+                out.write(vcd_header(layout, decoder.ids))
+                if np:
+                    _decode_numpy(data, decoder)
+                else:
+                    _decode_python(data, decoder)
+    return decoder.n_samples
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    layout_path = None
+    if "--layout" in args:
+        idx = args.index("--layout")
+        layout_path = args[idx + 1]
+        del args[idx : idx + 2]
+    if len(args) != 3:
+        sys.exit(
+            "Usage: ila_decode.py <ILA instance name> <capture file> <vcd file> [--layout <layout file>]"
+        )
+    n_samples = decode(*args, layout_path=layout_path)
+    print(f"Decoded {n_samples} ILA samples into {args[2]}")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Assemble ILA streams into binary ILA captures.
+#
+# A stream (like `ila_stream.bin`, created by `ila_stream_capture()` in the
+# Tester firmware) has the same header as binary captures, with the "ILAS"
+# magic. The chunks of the stream follow the header, or are in the part files
+# `<stream file>.0`, `<stream file>.1`, ... sent by the firmware as the chunks
+# were captured. Each chunk has a header (`ila_stream_chunk_t`):
+#   magic ("ILAC"), seq, first_sample, n_lost (bit 31 set if the chunk itself
+#   was overwritten while it was copied)
+# followed by half of the ILA buffer of samples.
+#
+# This script checks the chunks, reports gaps and overruns, and writes the
+# samples to a binary capture ("ILAB"), that can be converted to VCD with
+# `ila_decode.py`.
+#
+# Usage:
+#   ila_stream.py <stream file> <capture file>
+import os
+import sys
+import struct
+
+from ila_decode import CAPTURE_HEADER
+
+CHUNK_HEADER = struct.Struct("<4sIII")
+CHUNK_OVERWRITTEN = 0x80000000
+
+
+def assemble(stream_path, capture_path):
+    """Write samples of stream to capture file.
+    returns: dictionary with stream statistics
+    """
+    stats = {"chunks": 0, "samples": 0, "lost": 0, "gaps": [], "overwritten": []}
+    with open(stream_path, "rb") as f:
+        data = bytearray(f.read())
+    fields = list(CAPTURE_HEADER.unpack_from(data))
+    if fields[0] != b"ILAS":
+        sys.exit(f"{stream_path} is not an ILA stream.")
+    header_size, buffer_w, sample_words = fields[2], fields[3], fields[5]
+    chunk_samples = (1 << buffer_w) // 2
+    chunk_size = CHUNK_HEADER.size + chunk_samples * sample_words * 4
+    # Append the part files with the chunks of the stream (the header has the
+    # number of samples, so part files of previous streams are ignored)
+    stream_size = header_size + fields[-1] // chunk_samples * chunk_size
+    part = 0
+    while len(data) < stream_size and os.path.isfile(f"{stream_path}.{part}"):
+        with open(f"{stream_path}.{part}", "rb") as f:
+            data += f.read()
+        part += 1
+    data = data[:stream_size]
+
+    with open(capture_path, "wb") as out:
+        # Header is written again at the end, with the number of samples
+        out.write(data[:header_size])
+        expected_seq, expected_sample = 0, 0
+        for offset in range(header_size, len(data) - chunk_size + 1, chunk_size):
+            magic, seq, first_sample, n_lost = CHUNK_HEADER.unpack_from(data, offset)
+            if magic != b"ILAC":
+                sys.exit(f"Invalid ILA stream chunk at offset {offset}.")
+            if seq != expected_seq:
+                sys.exit(f"ILA stream chunk {expected_seq} missing (found {seq}).")
+            if n_lost & CHUNK_OVERWRITTEN:
+                stats["overwritten"].append(seq)
+            n_lost &= ~CHUNK_OVERWRITTEN
+            if first_sample != expected_sample + n_lost:
+                sys.exit(
+                    f"ILA stream chunk {seq} starts at sample {first_sample}, expected {expected_sample + n_lost}."
+                )
+            if n_lost:
+                stats["gaps"].append((expected_sample, n_lost))
+                stats["lost"] += n_lost
+            out.write(data[offset + CHUNK_HEADER.size : offset + chunk_size])
+            stats["chunks"] += 1
+            stats["samples"] += chunk_samples
+            expected_seq = seq + 1
+            expected_sample = first_sample + chunk_samples
+
+        fields[0] = b"ILAB"
+        fields[-1] = stats["samples"]
+        out.seek(0)
+        out.write(CAPTURE_HEADER.pack(*fields))
+    return stats
+
+
+def report(stats):
+    print(
+        f"ILA stream: {stats['samples']} samples in {stats['chunks']} chunks, {stats['lost']} samples lost."
+    )
+    for first, n_lost in stats["gaps"]:
+        print(f"  Overrun: {n_lost} samples lost after sample {first}.")
+    for seq in stats["overwritten"]:
+        print(f"  Overrun: chunk {seq} was overwritten while it was copied.")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("Usage: ila_stream.py <stream file> <capture file>")
+    report(assemble(sys.argv[1], sys.argv[2]))
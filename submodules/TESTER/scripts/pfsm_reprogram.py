@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Prepare runtime reprogramming of the Tester's PFSMs.
+#
+# The Tester firmware, when set up with PFSM_REPROGRAM=1, requests the
+# `pfsm_reprogram.txt` command file from the console after the main test, and
+# runs the commands in it. Each command may request a bitstream file, which is
+# transfered via ethernet on the FPGA (UART in simulation).
+#
+# This script copies the bitstreams into the run directory of the console and
+# writes the command file.
+#
+# Usage:
+#   pfsm_reprogram.py <run_dir> <command> [<command> ...]
+# Commands:
+#   pfsm=<file>      Program the independent PFSM (.bit file, or .json program)
+#   monitor=<file>   Program the ILA Monitor PFSM (.bit file, or .json program)
+#   capture          Run a test case: record ILA samples and print them
+#
+# JSON programs are compiled with `pfsm_compiler.py` and have the format:
+#   {"state_w": 2, "input_w": 1, "output_w": 1,
+#    "records": [["label", "input_cond", "next_state", "output_expr"], ...]}
+import os
+import sys
+import json
+import shutil
+
+COMMAND_FILE = "pfsm_reprogram.txt"
+TARGETS = ["pfsm", "monitor"]
+
+
+def stage_bitstream(run_dir, target, path, idx):
+    """Copy (or compile) bitstream into run_dir.
+    returns: name of the bitstream file, relative to run_dir
+    """
+    name = f"{target}_reprogram_{idx}.bit"
+    dest = os.path.join(run_dir, name)
+    if path.endswith(".json"):
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+        from pfsm_compiler import PfsmCompiler
+
+        with open(path) as f:
+            program = json.load(f)
+        PfsmCompiler(
+            program["state_w"],
+            program["input_w"],
+            program["output_w"],
+            program["records"],
+        ).compile(dest)
+    else:
+        shutil.copyfile(path, dest)
+    return name
+
+
+def main(run_dir, commands):
+    if not os.path.isdir(run_dir):
+        sys.exit(f"Run directory '{run_dir}' not found.")
+    lines = []
+    for idx, command in enumerate(commands):
+        target, _, path = command.partition("=")
+        if target in TARGETS and path:
+            lines.append(f"{target} {stage_bitstream(run_dir, target, path, idx)}")
+        elif command == "capture":
+            lines.append("capture")
+        else:
+            sys.exit(f"Invalid command '{command}'.")
+    lines.append("done")
+    with open(os.path.join(run_dir, COMMAND_FILE), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"Wrote {len(lines) - 1} command(s) to {os.path.join(run_dir, COMMAND_FILE)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("Usage: pfsm_reprogram.py <run_dir> <command> [<command> ...]")
+    main(sys.argv[1], sys.argv[2:])
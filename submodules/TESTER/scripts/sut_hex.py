@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Convert a binary memory image into the hex files used to initialize memories.
+#
+# Replaces `makehex.py` followed by `hex_split.py`, in one pass:
+# - <prefix>.hex: one 32-bit word per line (8 hex digits, most significant
+#   first), padded with zeros up to the memory size (2^<address width> bytes);
+# - <prefix>_<i>.hex, for i in 0..3: byte i of each word (2 hex digits per
+#   line), for memories with one RAM per byte lane.
+#
+# The binary is memory-mapped and converted with array operations (with numpy,
+# otherwise word by word). A hash of the inputs is stored in <prefix>.hex.sha256:
+# when it did not change, the hex files are not written again, so they keep
+# their timestamps and the targets that depend on them are not rebuilt.
+#
+# Usage:
+#   sut_hex.py <bin file> <address width> <output prefix>
+import os
+import sys
+import mmap
+import struct
+import hashlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Increment when the format of the output files changes
+FORMAT_VERSION = 1
+# Number of words converted at once
+BLOCK_WORDS = 1 << 18
+N_LANES = 4
+
+
+def _outputs(prefix):
+    return [f"{prefix}.hex"] + [f"{prefix}_{lane}.hex" for lane in range(N_LANES)]
+
+
+def _stamp(data, addr_w):
+    digest = hashlib.sha256(data)
+    digest.update(f"{addr_w}:{FORMAT_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def _hex_lut():
+    """Two lowercase hex digits of each byte value"""
+    return np.frombuffer(
+        "".join(f"{value:02x}" for value in range(256)).encode(), dtype=np.uint8
+    ).reshape(256, 2)
+
+
+def _write_numpy(data, n_words, files):
+    lut = _hex_lut()
+    newline = np.full((BLOCK_WORDS, 1), ord("\n"), dtype=np.uint8)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    for start in range(0, n_words, BLOCK_WORDS):
+        stop = min(n_words, start + BLOCK_WORDS)
+        block = raw[4 * start : 4 * stop].reshape(-1, 4)
+        digits = lut[block]  # (words, byte lane, 2 digits)
+        nl = newline[: stop - start]
+        # Most significant byte first
+        words = np.concatenate([digits[:, ::-1].reshape(-1, 8), nl], axis=1)
+        files[0].write(words.tobytes())
+        for lane in range(N_LANES):
+            lane_digits = np.concatenate([digits[:, lane], nl], axis=1)
+            files[lane + 1].write(lane_digits.tobytes())
+
+
+def _write_python(data, n_words, files):
+    for start in range(0, n_words, BLOCK_WORDS):
+        stop = min(n_words, start + BLOCK_WORDS)
+        words = struct.unpack_from(f"<{stop - start}I", data, 4 * start)
+        files[0].write("".join(f"{word:08x}\n" for word in words).encode())
+        for lane in range(N_LANES):
+            lane_bytes = ((word >> (8 * lane)) & 0xFF for word in words)
+            files[lane + 1].write(
+                "".join(f"{byte:02x}\n" for byte in lane_bytes).encode()
+            )
+
+
+def make_hex(bin_path, addr_w, prefix):
+    """Write hex files of binary.
+    returns: False if they were up to date
+    """
+    mem_words = (1 << addr_w) // 4
+    with open(bin_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > 4 * mem_words:
+            sys.exit(
+                f"{bin_path} ({size} bytes) does not fit in memory "
+                f"of {4 * mem_words} bytes."
+            )
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = mapped
+                if size % 4:
+                    # Last word is padded with zeros
+                    data = bytes(mapped) + bytes(-size % 4)
+                return _make_hex(data, addr_w, prefix, mem_words)
+        return _make_hex(b"", addr_w, prefix, mem_words)
+
+
+def _make_hex(data, addr_w, prefix, mem_words):
+    stamp = _stamp(data, addr_w)
+    stamp_path = f"{prefix}.hex.sha256"
+    if all(os.path.isfile(path) for path in _outputs(prefix)):
+        if os.path.isfile(stamp_path):
+            with open(stamp_path) as f:
+                if f.read().strip() == stamp:
+                    return False
+
+    n_words = len(data) // 4
+    files = [open(path, "wb") for path in _outputs(prefix)]
+    try:
+        if np:
+            _write_numpy(data, n_words, files)
+        else:
+            _write_python(data, n_words, files)
+        # Zero padding up to the memory size
+        for start in range(n_words, mem_words, BLOCK_WORDS):
+            count = min(mem_words, start + BLOCK_WORDS) - start
+            files[0].write(b"00000000\n" * count)
+            for lane_file in files[1:]:
+                lane_file.write(b"00\n" * count)
+    finally:
+        for f in files:
+            f.close()
+    with open(stamp_path, "w") as f:
+        f.write(stamp + "\n")
+    return True
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4:
+        sys.exit("Usage: sut_hex.py <bin file> <address width> <output prefix>")
+    if not make_hex(sys.argv[1], int(sys.argv[2]), sys.argv[3]):
+        print(f"{sys.argv[3]}.hex is up to date.")
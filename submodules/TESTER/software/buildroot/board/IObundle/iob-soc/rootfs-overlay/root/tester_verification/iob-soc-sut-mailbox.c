@@ -0,0 +1,112 @@
+#include <fcntl.h>
+#include <stdio.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+#include "iob-soc-sut-mailbox.h"
+
+// Mapping of the mailbox (NULL if not mapped)
+static void *iob_soc_sut_mbox_map = NULL;
+static size_t iob_soc_sut_mbox_map_size = 0;
+// Tester to SUT (tx) and SUT to Tester (rx) rings
+static mbox_ring_t iob_soc_sut_mbox_tx, iob_soc_sut_mbox_rx;
+
+static uint32_t iob_soc_sut_mbox_read_reg(uint32_t addr, uint32_t width) {
+    uint32_t value = 0;
+
+    if (iob_soc_sut_read_addr(addr, width, &value) == -1)
+        perror("[Tester|User] Failed to read mailbox register");
+    return value;
+}
+
+static void iob_soc_sut_mbox_write_reg(uint32_t addr, uint32_t width,
+                                       uint32_t value) {
+    if (iob_soc_sut_write_addr(addr, width, value) == -1)
+        perror("[Tester|User] Failed to write mailbox register");
+}
+
+// Ring index registers
+static uint32_t iob_soc_sut_t2s_tail() {
+    return iob_soc_sut_mbox_read_reg(IOB_SOC_SUT_T2S_TAIL_ADDR,
+                                     IOB_SOC_SUT_T2S_TAIL_W);
+}
+
+static void iob_soc_sut_t2s_head(uint32_t value) {
+    iob_soc_sut_mbox_write_reg(IOB_SOC_SUT_T2S_HEAD_ADDR, IOB_SOC_SUT_T2S_HEAD_W,
+                               value);
+}
+
+static uint32_t iob_soc_sut_s2t_head() {
+    return iob_soc_sut_mbox_read_reg(IOB_SOC_SUT_S2T_HEAD_ADDR,
+                                     IOB_SOC_SUT_S2T_HEAD_W);
+}
+
+static void iob_soc_sut_s2t_tail(uint32_t value) {
+    iob_soc_sut_mbox_write_reg(IOB_SOC_SUT_S2T_TAIL_ADDR, IOB_SOC_SUT_S2T_TAIL_W,
+                               value);
+}
+
+int iob_soc_sut_mbox_open() {
+    uint32_t base = 0;
+    off_t phys, page_offset;
+    long page_size = sysconf(_SC_PAGESIZE);
+    volatile mbox_shared_t *shared;
+    void *map;
+    int fd;
+
+    if (iob_soc_sut_mbox_map)
+        return 0;
+    if (iob_soc_sut_read_addr(IOB_SOC_SUT_MBOX_BASE_ADDR, IOB_SOC_SUT_MBOX_BASE_W,
+                              &base) == -1 || !base)
+        return -1;
+
+    // Map pages of the mailbox in the SUT's memory zone
+    phys = base ^ IOB_SOC_SUT_MEM_OFFSET;
+    page_offset = phys & (page_size - 1);
+    fd = open("/dev/mem", O_RDWR | O_SYNC);
+    if (fd == -1) {
+        perror("[Tester|User] Failed to open /dev/mem");
+        return -1;
+    }
+    iob_soc_sut_mbox_map_size = page_offset + sizeof(mbox_shared_t);
+    map = mmap(NULL, iob_soc_sut_mbox_map_size, PROT_READ | PROT_WRITE,
+               MAP_SHARED, fd, phys - page_offset);
+    close(fd);
+    if (map == MAP_FAILED) {
+        perror("[Tester|User] Failed to map SUT mailbox");
+        return -1;
+    }
+
+    shared = (volatile mbox_shared_t *)((uint8_t *)map + page_offset);
+    if (shared->magic != MBOX_MAGIC || shared->ring_size != MBOX_RING_SIZE) {
+        puts("[Tester|User] Invalid SUT mailbox\n");
+        munmap(map, iob_soc_sut_mbox_map_size);
+        return -1;
+    }
+    // Mapping is uncached: no cache maintenance needed
+    mbox_ring_init(&iob_soc_sut_mbox_tx, shared->t2s, &iob_soc_sut_t2s_tail,
+                   &iob_soc_sut_t2s_head, NULL);
+    mbox_ring_init(&iob_soc_sut_mbox_rx, shared->s2t, &iob_soc_sut_s2t_head,
+                   &iob_soc_sut_s2t_tail, NULL);
+    iob_soc_sut_mbox_map = map;
+    return 0;
+}
+
+void iob_soc_sut_mbox_close() {
+    if (iob_soc_sut_mbox_map)
+        munmap(iob_soc_sut_mbox_map, iob_soc_sut_mbox_map_size);
+    iob_soc_sut_mbox_map = NULL;
+}
+
+uint32_t iob_soc_sut_mbox_write(const void *buffer, uint32_t n,
+                                uint32_t max_polls) {
+    if (iob_soc_sut_mbox_open() == -1)
+        return 0;
+    return mbox_write_all(&iob_soc_sut_mbox_tx, buffer, n, max_polls);
+}
+
+uint32_t iob_soc_sut_mbox_read(void *buffer, uint32_t n, uint32_t max_polls) {
+    if (iob_soc_sut_mbox_open() == -1)
+        return 0;
+    return mbox_read_all(&iob_soc_sut_mbox_rx, buffer, n, max_polls);
+}
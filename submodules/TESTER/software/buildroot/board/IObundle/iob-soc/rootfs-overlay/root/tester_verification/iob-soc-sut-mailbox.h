@@ -0,0 +1,31 @@
+#include <stdint.h>
+
+#include "iob-soc-sut-user.h"
+// Mailbox layout and ring functions (copied from software/src)
+#include "iob_soc_sut_mailbox.h"
+
+/* Physical address bit that selects the SUT's memory zone of the shared
+ * external memory (bit MEM_ADDR_W-1 of the Tester). The address published by
+ * the SUT in its MBOX_BASE register is accessed with this bit inverted.
+ */
+#ifndef IOB_SOC_SUT_MEM_OFFSET
+#define IOB_SOC_SUT_MEM_OFFSET 0x02000000
+#endif
+
+/* Shared memory mailbox with the SUT.
+ * The mailbox in the SUT memory is mapped via /dev/mem (uncached), and the
+ * ring indices are accessed via the SUT registers.
+ */
+// returns: 0 on success, -1 if the SUT has not initialized its mailbox
+int iob_soc_sut_mbox_open();
+// Unmap mailbox (optional, done on process exit)
+void iob_soc_sut_mbox_close();
+/* Write `n` bytes to the SUT, waiting up to `max_polls` polls without space.
+ * returns: number of bytes written
+ */
+uint32_t iob_soc_sut_mbox_write(const void *buffer, uint32_t n,
+                                uint32_t max_polls);
+/* Read `n` bytes from the SUT, waiting up to `max_polls` polls without data.
+ * returns: number of bytes read
+ */
+uint32_t iob_soc_sut_mbox_read(void *buffer, uint32_t n, uint32_t max_polls);
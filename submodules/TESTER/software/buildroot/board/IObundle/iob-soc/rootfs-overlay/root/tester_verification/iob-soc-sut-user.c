@@ -1,13 +1,97 @@
+#include <fcntl.h>
+#include <poll.h>
+#include <sys/ioctl.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
 #include "iob-soc-sut-user.h"
 
+// Size of the memory mapping (one page holds all registers)
+#define IOB_SOC_SUT_MMAP_SIZE 4096
+
+// Memory mapped registers (NULL if not mapped yet)
+static volatile uint8_t *iob_soc_sut_regs = NULL;
+// 0: not tried yet; 1: using memory mapping; -1: using sysfs files
+static int iob_soc_sut_mmap_state = 0;
+static int iob_soc_sut_fd = -1;
+
+// The driver only allows one open file, shared by the mapping and the batches
+static int iob_soc_sut_open_device() {
+    if (iob_soc_sut_fd == -1)
+        iob_soc_sut_fd = open(IOB_SOC_SUT_DEVICE_FILE, O_RDWR | O_SYNC);
+    return iob_soc_sut_fd;
+}
+
+static int iob_soc_sut_map_regs() {
+    void *regs;
+
+    if (iob_soc_sut_mmap_state)
+        return iob_soc_sut_mmap_state;
+
+    iob_soc_sut_mmap_state = -1;
+    if (iob_soc_sut_open_device() == -1)
+        return iob_soc_sut_mmap_state;
+    regs = mmap(NULL, IOB_SOC_SUT_MMAP_SIZE, PROT_READ | PROT_WRITE, MAP_SHARED,
+                iob_soc_sut_fd, 0);
+    if (regs == MAP_FAILED)
+        return iob_soc_sut_mmap_state;
+    iob_soc_sut_regs = (volatile uint8_t *)regs;
+    iob_soc_sut_mmap_state = 1;
+    return iob_soc_sut_mmap_state;
+}
+
+void iob_soc_sut_unmap_regs() {
+    if (iob_soc_sut_regs)
+        munmap((void *)iob_soc_sut_regs, IOB_SOC_SUT_MMAP_SIZE);
+    if (iob_soc_sut_fd != -1)
+        close(iob_soc_sut_fd);
+    iob_soc_sut_regs = NULL;
+    iob_soc_sut_fd = -1;
+    iob_soc_sut_mmap_state = 0;
+}
+
+// Access register with `width` bits at byte address `addr`
+static void iob_soc_sut_mmap_write(uint32_t addr, uint32_t width,
+                                   uint32_t value) {
+    switch (width >> 3) {
+        case 1:
+            *(volatile uint8_t *)(iob_soc_sut_regs + addr) = value;
+            break;
+        case 2:
+            *(volatile uint16_t *)(iob_soc_sut_regs + addr) = value;
+            break;
+        default:
+            *(volatile uint32_t *)(iob_soc_sut_regs + addr) = value;
+            break;
+    }
+}
+
+static uint32_t iob_soc_sut_mmap_read(uint32_t addr, uint32_t width) {
+    switch (width >> 3) {
+        case 1:
+            return *(volatile uint8_t *)(iob_soc_sut_regs + addr);
+        case 2:
+            return *(volatile uint16_t *)(iob_soc_sut_regs + addr);
+        default:
+            return *(volatile uint32_t *)(iob_soc_sut_regs + addr);
+    }
+}
+
 int iob_soc_sut_set_reg(uint32_t num, uint32_t value){
     int ret = 0;
+    int mapped = iob_soc_sut_map_regs() == 1;
     switch (num) {
         case 1:
-            ret = iob_sysfs_write_file(IOB_SOC_SUT_SYSFILE_REG1, value);
+            if (mapped)
+                iob_soc_sut_mmap_write(IOB_SOC_SUT_REG1_ADDR, IOB_SOC_SUT_REG1_W, value);
+            else
+                ret = iob_sysfs_write_file(IOB_SOC_SUT_SYSFILE_REG1, value);
             break;
         case 2:
-            ret = iob_sysfs_write_file(IOB_SOC_SUT_SYSFILE_REG2, value);
+            if (mapped)
+                iob_soc_sut_mmap_write(IOB_SOC_SUT_REG2_ADDR, IOB_SOC_SUT_REG2_W, value);
+            else
+                ret = iob_sysfs_write_file(IOB_SOC_SUT_SYSFILE_REG2, value);
             break;
         default:
             perror("[Tester|User] Invalid write register number");
@@ -22,15 +106,25 @@ int iob_soc_sut_set_reg(uint32_t num, uint32_t value){
 
 int iob_soc_sut_get_reg(uint32_t num, uint32_t *value) {
     int ret = 0;
+    int mapped = iob_soc_sut_map_regs() == 1;
     switch (num) {
         case 3:
-            ret = iob_sysfs_read_file(IOB_SOC_SUT_SYSFILE_REG3, value);
+            if (mapped)
+                *value = iob_soc_sut_mmap_read(IOB_SOC_SUT_REG3_ADDR, IOB_SOC_SUT_REG3_W);
+            else
+                ret = iob_sysfs_read_file(IOB_SOC_SUT_SYSFILE_REG3, value);
             break;
         case 4:
-            ret = iob_sysfs_read_file(IOB_SOC_SUT_SYSFILE_REG4, value);
+            if (mapped)
+                *value = iob_soc_sut_mmap_read(IOB_SOC_SUT_REG4_ADDR, IOB_SOC_SUT_REG4_W);
+            else
+                ret = iob_sysfs_read_file(IOB_SOC_SUT_SYSFILE_REG4, value);
             break;
         case 5:
-            ret = iob_sysfs_read_file(IOB_SOC_SUT_SYSFILE_REG4, value);
+            if (mapped)
+                *value = iob_soc_sut_mmap_read(IOB_SOC_SUT_REG5_ADDR, IOB_SOC_SUT_REG5_W);
+            else
+                ret = iob_sysfs_read_file(IOB_SOC_SUT_SYSFILE_REG5, value);
             break;
         default:
             perror("[Tester|User] Invalid read register number");
@@ -42,3 +136,79 @@ int iob_soc_sut_get_reg(uint32_t num, uint32_t *value) {
     }
     return ret;
 }
+
+int iob_soc_sut_write_addr(uint32_t addr, uint32_t width, uint32_t value) {
+    struct iob_soc_sut_reg_op op = {0};
+
+    if (iob_soc_sut_map_regs() == 1) {
+        iob_soc_sut_mmap_write(addr, width, value);
+        return 0;
+    }
+    op.addr = addr;
+    op.width = width;
+    op.op = IOB_SOC_SUT_OP_WRITE;
+    op.value = value;
+    return iob_soc_sut_batch(&op, 1) == 1 ? 0 : -1;
+}
+
+int iob_soc_sut_read_addr(uint32_t addr, uint32_t width, uint32_t *value) {
+    struct iob_soc_sut_reg_op op = {0};
+
+    if (iob_soc_sut_map_regs() == 1) {
+        *value = iob_soc_sut_mmap_read(addr, width);
+        return 0;
+    }
+    op.addr = addr;
+    op.width = width;
+    op.op = IOB_SOC_SUT_OP_READ;
+    if (iob_soc_sut_batch(&op, 1) != 1)
+        return -1;
+    *value = op.value;
+    return 0;
+}
+
+int iob_soc_sut_batch(struct iob_soc_sut_reg_op *ops, uint32_t n_ops) {
+    struct iob_soc_sut_batch batch = {0};
+
+    if (iob_soc_sut_open_device() == -1) {
+        perror("[Tester|User] Failed to open SUT device");
+        return -1;
+    }
+    batch.ops = (uintptr_t)ops;
+    batch.n_ops = n_ops;
+    if (ioctl(iob_soc_sut_fd, IOB_SOC_SUT_IOC_BATCH, &batch) == -1) {
+        perror("[Tester|User] Failed to run register batch");
+        return -1;
+    }
+    return batch.n_done;
+}
+
+int iob_soc_sut_wait_stream(int timeout_ms) {
+    struct pollfd pfd = {0};
+    int ret;
+
+    if (iob_soc_sut_open_device() == -1) {
+        perror("[Tester|User] Failed to open SUT device");
+        return -1;
+    }
+    pfd.fd = iob_soc_sut_fd;
+    pfd.events = POLLIN;
+    ret = poll(&pfd, 1, timeout_ms);
+    if (ret == -1) {
+        perror("[Tester|User] Failed to wait for AXI stream");
+        return -1;
+    }
+    return ret > 0 && (pfd.revents & POLLIN);
+}
+
+int iob_soc_sut_ack_stream() {
+    if (iob_soc_sut_open_device() == -1) {
+        perror("[Tester|User] Failed to open SUT device");
+        return -1;
+    }
+    if (ioctl(iob_soc_sut_fd, IOB_SOC_SUT_IOC_STREAM_ACK) == -1) {
+        perror("[Tester|User] Failed to acknowledge AXI stream");
+        return -1;
+    }
+    return 0;
+}
@@ -9,6 +9,39 @@
  * - Register address and width definitions
  */
 #include "iob_soc_sut.h"
+// ioctl interface of the driver (copied from software/linux/drivers)
+#include "iob_soc_sut_ioctl.h"
 
+// Device file of the iob_soc_sut driver, used to mmap the registers
+#ifndef IOB_SOC_SUT_DEVICE_FILE
+#define IOB_SOC_SUT_DEVICE_FILE "/dev/iob_soc_sut"
+#endif
+
+/* Register access functions.
+ * Registers are accessed through a memory mapping of the device, created on the
+ * first access. If the mapping fails (like with older drivers), the sysfs files
+ * are used instead.
+ */
 int iob_soc_sut_set_reg(uint32_t num, uint32_t value);
 int iob_soc_sut_get_reg(uint32_t num, uint32_t *value);
+/* Access register with `width` bits at byte address `addr` (the
+ * IOB_SOC_SUT_<NAME>_ADDR and IOB_SOC_SUT_<NAME>_W definitions), via the memory
+ * mapping or, if not available, a batch of one access.
+ * returns: 0 on success, -1 on error
+ */
+int iob_soc_sut_write_addr(uint32_t addr, uint32_t width, uint32_t value);
+int iob_soc_sut_read_addr(uint32_t addr, uint32_t width, uint32_t *value);
+// Remove memory mapping and close device (optional, done on process exit)
+void iob_soc_sut_unmap_regs();
+/* Run `n_ops` register accesses in one system call (up to IOB_SOC_SUT_BATCH_MAX).
+ * Values of read accesses are returned in `ops`.
+ * returns: number of accesses done, or -1 on error
+ */
+int iob_soc_sut_batch(struct iob_soc_sut_reg_op *ops, uint32_t n_ops);
+/* Wait until the AXI stream from the SUT has data (sleeps on the AXISTREAMIN0
+ * interrupt), up to `timeout_ms` milliseconds (-1: no timeout).
+ * returns: 1 if there is data, 0 on timeout, -1 on error
+ */
+int iob_soc_sut_wait_stream(int timeout_ms);
+// Re-arm the AXI stream interrupt, after the stream is read
+int iob_soc_sut_ack_stream();
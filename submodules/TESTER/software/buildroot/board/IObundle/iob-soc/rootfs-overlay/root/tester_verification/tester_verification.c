@@ -8,6 +8,7 @@
 #include "iob-uart16550.h"
 #include "iob-timer-user.h"
 #include "iob-soc-sut-user.h"
+#include "iob-soc-sut-mailbox.h"
 #include "iob-axistream-in-user.h"
 #include "iob-axistream-out-user.h"
 
@@ -18,6 +19,8 @@
 #include "iob-dma-user.h"
 #define USE_ILA_PFSM
 
+#include "iob_soc_tester_conf.h"
+
 //
 //#include "iob-dma.h"
 //#include "iob-eth.h"
@@ -40,6 +43,17 @@
 
 #define BUFFER_SIZE 5096
 
+// Max time to wait for the AXI stream of the SUT
+#define AXISTREAM_WAIT_TIMEOUT_MS 5000
+
+// Width of the AXI streams, from the Tester configuration generated by the
+// setup (copied by the build-driver-headers target)
+#define AXIS_TDATA_W IOB_SOC_TESTER_AXIS_TDATA_W
+// 32-bit words of each AXI stream beat. NWORDS registers count beats.
+#define AXIS_BEAT_WORDS (AXIS_TDATA_W / 32)
+// Max number of polls of the mailbox rings without progress
+#define MBOX_WAIT_POLLS 1000000
+
 // copied from bsp.h
 #define BAUD 115200
 #define FREQ 100000000
@@ -60,6 +74,8 @@
 void print_ila_samples();
 void send_axistream();
 void receive_axistream();
+void mailbox_send_echo();
+void mailbox_check_echo();
 void pfsm_program(char *, uint32_t);
 void ila_monitor_program(char *, uint32_t);
 //void clear_cache();
@@ -259,6 +275,9 @@ int main() {
 
   // Tell SUT that the Tester is running linux
   uart16550_puts("TESTER_RUN_LINUX\n");
+
+  // Send message to the SUT via the shared memory mailbox (replied later)
+  mailbox_send_echo();
 //    // Test sending data to SUT via ethernet
 //    uart16550_puts("[Tester]: Sending data to SUT via ethernet:\n");
 //    for(i=0; i<64; i++) {
@@ -319,6 +338,9 @@ int main() {
 //
   // Read byte stream via AXI stream
   receive_axistream();
+
+  // Check reply of the SUT to the mailbox message
+  mailbox_check_echo();
 //
 //    uart16550_puts("\n[Tester] Using shared external memory. Obtain SUT memory string "
 //              "pointer via SUT's register 5...\n");
@@ -448,17 +470,17 @@ void send_axistream() {
     printf("0x%08x ", byte_stream[i]);
   printf("\n");
 
-  // Send bytes to AXI stream output via DMA, except the last word.
-  printf("[Tester]: Loading AXI words via DMA...\n");
+  // Send bytes to AXI stream output via DMA (TLAST generated from NWORDS).
+  // The SUT loops the packet back: tell it the packet length.
+  printf("[Tester]: Loading AXI words via DMA...\n\n");
+  iob_soc_sut_write_addr(IOB_SOC_SUT_AXIS_NWORDS_ADDR, IOB_SOC_SUT_AXIS_NWORDS_W,
+                         words_in_byte_stream);
   iob_axis_out_reset();
   iob_sysfs_write_file(IOB_AXISTREAM_OUT_SYSFILE_ENABLE, 1);
   iob_sysfs_write_file(IOB_AXISTREAM_OUT_SYSFILE_MODE, 1);
-  iob_sysfs_write_file(IOB_AXISTREAM_OUT_SYSFILE_NWORDS, words_in_byte_stream);
-  dma_start_transfer(byte_stream, words_in_byte_stream-1, 0, 0);
-  // Send the last word with via SWregs with the TLAST signal.
-  printf("[Tester]: Loading last AXI word via SWregs...\n\n");
-  iob_sysfs_write_file(IOB_AXISTREAM_OUT_SYSFILE_MODE, 0);
-  iob_axis_write(byte_stream[words_in_byte_stream-1]);
+  iob_sysfs_write_file(IOB_AXISTREAM_OUT_SYSFILE_NWORDS,
+                       words_in_byte_stream / AXIS_BEAT_WORDS);
+  dma_start_transfer(byte_stream, words_in_byte_stream, 0, 0);
 
   free(byte_stream);
 }
@@ -466,7 +488,14 @@ void send_axistream() {
 void receive_axistream() {
   uint8_t i;
   uint32_t n_received_words = 0;
+
+  // Sleep until the AXI stream input has data, instead of busy-waiting
+  if (iob_soc_sut_wait_stream(AXISTREAM_WAIT_TIMEOUT_MS) != 1) {
+    printf("[Tester]: Timeout waiting for AXI stream!\n");
+    return;
+  }
   iob_sysfs_read_file(IOB_AXISTREAM_IN_SYSFILE_NWORDS, &n_received_words);
+  n_received_words *= AXIS_BEAT_WORDS;
 
   // Allocate memory for byte stream
   volatile uint32_t *byte_stream = (volatile uint32_t *)malloc((n_received_words)*sizeof(uint32_t));
@@ -487,6 +516,46 @@ void receive_axistream() {
   printf("\n\n");
 
   free((uint32_t *)byte_stream);
+
+  // Stream read: allow the next AXI stream interrupt
+  iob_soc_sut_ack_stream();
+}
+
+// Byte `i` of the mailbox echo message
+#define MBOX_ECHO_BYTE(i) ((uint8_t)((i) * 3))
+
+void mailbox_send_echo() {
+  uint8_t payload[MBOX_ECHO_SIZE];
+  uint32_t size = MBOX_ECHO_SIZE, i;
+
+  if (iob_soc_sut_mbox_open() == -1) {
+    printf("[Tester]: SUT mailbox not found.\n\n");
+    return;
+  }
+  for (i = 0; i < size; i++)
+    payload[i] = MBOX_ECHO_BYTE(i);
+  iob_soc_sut_mbox_write(&size, 4, MBOX_WAIT_POLLS);
+  iob_soc_sut_mbox_write(payload, size, MBOX_WAIT_POLLS);
+  printf("[Tester]: Sent %d bytes to SUT via shared memory mailbox.\n\n", size);
+}
+
+void mailbox_check_echo() {
+  uint8_t payload[MBOX_ECHO_SIZE];
+  uint32_t size = 0, i, n_errors = 0;
+
+  if (iob_soc_sut_mbox_open() == -1)
+    return;
+  if (iob_soc_sut_mbox_read(&size, 4, MBOX_WAIT_POLLS) != 4 ||
+      size != MBOX_ECHO_SIZE) {
+    printf("[Tester]: No mailbox reply from SUT!\n\n");
+    return;
+  }
+  size = iob_soc_sut_mbox_read(payload, size, MBOX_WAIT_POLLS);
+  for (i = 0; i < MBOX_ECHO_SIZE; i++)
+    if (i >= size || payload[i] != (uint8_t)(MBOX_ECHO_BYTE(i) + 1))
+      n_errors++;
+  printf("[Tester]: Mailbox reply from SUT: %d bytes, %d errors.\n\n", size,
+         n_errors);
 }
 
 // void clear_cache(){
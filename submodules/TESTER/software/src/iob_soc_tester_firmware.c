@@ -10,17 +10,34 @@
 // System may not use ILA/PFSM for Quartus boards
 #if __has_include("ILA0.h")
 #include "ILA0.h" // ILA0 instance specific defines
+#include "ILA0_layout.h" // Probe layout of ILA0 samples
 #include "iob-ila.h"
 #include "iob-pfsm.h"
+#if ILA0_AXIS_TDATA_WIDTH > 32
+// Wide AXI stream: show the low 32 bits of the AXIS_TDATA probe
+#define ILA0_GET_AXIS_TDATA(sample)                                            \
+  ((uint32_t)((((uint64_t)(sample)[ILA0_AXIS_TDATA_LSB / 32 + 1] << 32) |     \
+               (sample)[ILA0_AXIS_TDATA_LSB / 32]) >>                          \
+              (ILA0_AXIS_TDATA_LSB % 32)))
+#endif
 #define USE_ILA_PFSM
 #endif
 
 #include "iob-dma.h"
 #include "iob-eth.h"
 #include "iob_soc_sut_swreg.h"
+#include "iob_soc_sut_bulk.h"
+#include "iob_soc_sut_xfer.h"
+#include "iob_soc_sut_mcycle.h"
+#include "iob_soc_sut_irq.h"
+#include "iob_soc_sut_phases.h"
+#include "iob_soc_sut_mailbox.h"
 #include "iob_soc_tester_conf.h"
 #include "iob_soc_tester_periphs.h"
 #include "iob_soc_tester_system.h"
+#ifdef IOB_SOC_TESTER_BENCHMARK
+#include "iob_soc_sut_bench.h"
+#endif
 #include "printf.h"
 #include "stdlib.h"
 #include <stdio.h>
@@ -32,13 +49,34 @@
 // Enable debug messages.
 #define DEBUG 0
 
-#define SUT_FIRMWARE_SIZE 38000
+// PLIC source of the AXISTREAMIN0 interrupt
+#define AXISTREAMIN0_IRQ 3
+// Max time to wait for AXI stream data from the SUT
+#define AXISTREAM_WAIT_TIMEOUT ((FREQ / BAUD) * 4096)
+// 32-bit words of each AXI stream beat (TDATA_W bits). The NWORDS registers
+// of the AXI stream peripherals count beats; DMA transfers count 32-bit words.
+#define AXIS_BEAT_WORDS (IOB_SOC_TESTER_AXIS_TDATA_W / 32)
+// Max number of polls of the mailbox rings without progress
+#define MBOX_WAIT_POLLS ((FREQ / BAUD) * 4096)
 
 void print_ila_samples();
+void send_ila_capture(char *);
+void ila_stream_capture(char *);
 void send_axistream();
 void receive_axistream();
+void axis_queue_reset();
+int axis_queue_push(uint32_t *, uint32_t);
+uint32_t axis_queue_service();
+void axis_queue_flush();
 void pfsm_program(char *);
 void ila_monitor_program(char *);
+void pfsm_reprogram_loop();
+void link_benchmark();
+void send_file_to_console(char *, uint32_t, char *);
+void send_phases(char *);
+int mailbox_open();
+void mailbox_send_echo();
+void mailbox_check_echo();
 
 void clear_cache(){
   // Delay to ensure all data is written to memory
@@ -71,18 +109,93 @@ uint32_t uart_recvfile_ethernet(char *file_name) {
   return file_size;
 }
 
+// Send signal by uart to send file by ethernet
+void uart_sendfile_ethernet(char *file_name, uint32_t file_size, char *buffer) {
+  uart16550_puts(UART_PROGNAME);
+  uart16550_puts (": requesting to send file by ethernet\n");
+
+  //send file send by ethernet request
+  uart16550_putc (0x14);
+
+  //send file name (including end of string)
+  uart16550_puts(file_name); uart16550_putc(0);
+
+  // send file size
+  uart16550_putc((char)(file_size & 0x0ff));
+  uart16550_putc((char)((file_size & 0x0ff00) >> 8));
+  uart16550_putc((char)((file_size & 0x0ff0000) >> 16));
+  uart16550_putc((char)((file_size & 0x0ff000000) >> 24));
+
+  // wait for ACK before sending file
+  while (uart16550_getc() != ACK);
+
+  eth_send_file(buffer, file_size);
+}
+
+// Receive file from the console into a new buffer allocated with malloc.
+// On the FPGA, the file contents are transfered via the console ethernet (ETH0).
+// Returns pointer to the buffer and stores file size in `file_size`.
+// Returns NULL if there is not enough memory for the file.
+char *console_recvfile(char *file_name, uint32_t *file_size) {
+  char *mem;
+#ifdef SIMULATION
+  uint32_t i;
+  char c;
+  uart16550_puts(UART_PROGNAME);
+  uart16550_puts(": requesting to receive file\n");
+  // send file receive request and file name (including end of string)
+  uart16550_putc(FRX);
+  uart16550_puts(file_name); uart16550_putc(0);
+  // receive file size
+  *file_size = sut_xfer_get_u32(&uart16550_getc);
+  mem = (char *)malloc(*file_size);
+  // send ACK before receiving file
+  uart16550_putc(ACK);
+  // Without memory, receive the file anyway, to keep in sync with the console
+  for (i = 0; i < *file_size; i++) {
+    c = uart16550_getc();
+    if (mem)
+      mem[i] = c;
+  }
+#else
+  // Select console eth
+  eth_init(ETH0_BASE, &clear_cache);
+  *file_size = uart_recvfile_ethernet(file_name);
+  mem = (char *)malloc(*file_size);
+  if (mem)
+    eth_rcv_file(mem, *file_size);
+  // Select SUT eth again
+  eth_init_mac(ETH1_BASE, ETH_RMAC_ADDR, ETH_MAC_ADDR);
+#endif
+  return mem;
+}
+
+// Wait for a byte from the SUT (UART1). Returns -1 on timeout.
+int sut_getc_timeout(uint32_t n_polls) {
+  while (!uart16550_rxready())
+    if (!n_polls--)
+      return -1;
+  return (uint8_t)uart16550_getc();
+}
+
+// Number of times a chunk is sent to the SUT without ACK before giving up
+#define SUT_XFER_MAX_RETRIES 16
+
 /*
  * Receive a file transfer request from SUT;
  * relay that request to the console;
- * receive file contents from console; 
- * and send them to the SUT.
+ * receive file contents from console;
+ * and send them to the SUT, in chunks via ethernet (see iob_soc_sut_xfer.h).
  *
  * file_name_buffer: buffer to store file name
- * file_content_buffer: buffer to store file content
+ * returns: 0 on success, -1 if a chunk was not acknowledged after
+ *          SUT_XFER_MAX_RETRIES retries
 */
-void relay_file_transfer_to_sut(char *file_name_buffer, char *file_content_buffer){
-  int i;
-  uint32_t file_size = 0;
+int relay_file_transfer_to_sut(char *file_name_buffer){
+  int i, reply, n_retries = 0;
+  uint32_t file_size = 0, n_chunks, index, size, n_resent = 0;
+  char *file_content, *frame;
+  sut_xfer_trailer_t trailer;
 
   uart16550_base(UART1_BASE);
   // receive file transfer request from SUT
@@ -99,29 +212,71 @@ void relay_file_transfer_to_sut(char *file_name_buffer, char *file_content_buffe
   uart16550_puts("[Tester]: Sending transfer request to console...\n");
 
   // Make request to host
-  file_size = uart16550_recvfile(file_name_buffer, file_content_buffer);
+  file_content = console_recvfile(file_name_buffer, &file_size);
+  if (!file_content) {
+    printf("[Tester]: Not enough memory for %s (%d bytes).\n", file_name_buffer,
+           file_size);
+    return -1;
+  }
+  n_chunks = sut_xfer_n_chunks(file_size);
+  frame = (char *)malloc(SUT_XFER_CHUNK_SIZE + sizeof(trailer));
 
-  uart16550_puts(
-      "[Tester]: SUT file obtained. Transfering it to SUT via UART...\n");
+  printf("[Tester]: SUT file obtained. Transfering it to SUT via ethernet "
+         "in %d chunks...\n", n_chunks);
 
   uart16550_base(UART1_BASE);
-  // send file size
-  uart16550_putc((char)(file_size & 0x0ff));
-  uart16550_putc((char)((file_size & 0x0ff00) >> 8));
-  uart16550_putc((char)((file_size & 0x0ff0000) >> 16));
-  uart16550_putc((char)((file_size & 0x0ff000000) >> 24));
+  // send file size, with flag to select chunked ethernet transfer
+  sut_xfer_put_u32(&uart16550_putc, file_size | SUT_XFER_ETH_FLAG);
   // Wait for ACK signal from SUT
   while (uart16550_getc() != ACK);
 
-  if (DEBUG) {
-    uart16550_base(UART0_BASE);
-    uart16550_puts("[Tester] Got ack! Sending firmware to SUT...\n");
-    uart16550_base(UART1_BASE);
+  // send chunks requested by the SUT, until it received all of them
+  for (index = 0; index < n_chunks;) {
+    size = sut_xfer_chunk_size(file_size, index);
+    trailer.magic = SUT_XFER_MAGIC;
+    trailer.index = index;
+    trailer.size = size;
+    trailer.crc = sut_xfer_crc32(
+        (uint8_t *)file_content + index * SUT_XFER_CHUNK_SIZE, size);
+    memcpy(frame, file_content + index * SUT_XFER_CHUNK_SIZE, size);
+    memcpy(frame + size, &trailer, sizeof(trailer));
+    eth_send_file(frame, size + sizeof(trailer));
+
+    // Wait for SUT reply. Send chunk again if it was lost.
+    reply = sut_getc_timeout(FREQ);
+    if (reply == ACK)
+      n_retries = 0;
+    else if (n_retries++ == SUT_XFER_MAX_RETRIES)
+      break;
+    else
+      n_resent++;
+    if (reply < 0)
+      continue;
+    // SUT resumes transfer from the chunk it requests
+    index = sut_xfer_get_u32(&uart16550_getc);
   }
 
-  // send file contents to SUT
-  for (i = 0; i < file_size; i++)
-    uart16550_putc(file_content_buffer[i]);
+  free(frame);
+  free(file_content);
+
+  uart16550_base(UART0_BASE);
+  if (n_resent)
+    printf("[Tester]: Sent %d chunk(s) to SUT again.\n", n_resent);
+  if (index < n_chunks) {
+    printf("[Tester]: SUT did not acknowledge chunk %d after %d retries. "
+           "Transfer failed!\n", index, SUT_XFER_MAX_RETRIES);
+    return -1;
+  }
+  uart16550_base(UART1_BASE);
+  return 0;
+}
+
+// Report failure to the console and end the connection
+void test_failed(char *fail_string) {
+  uart16550_base(UART0_BASE);
+  uart16550_puts("\n[Tester]: Verification failed!\n\n");
+  uart16550_sendfile("test.log", strlen(fail_string), fail_string);
+  uart16550_finish();
 }
 
 int main() {
@@ -130,9 +285,12 @@ int main() {
   uint32_t file_size = 0;
   char c, buffer[5096], *sutStr;
   int i;
-#ifndef IOB_SOC_TESTER_INIT_MEM
-  char sut_firmware[SUT_FIRMWARE_SIZE];
-#endif
+  uint32_t data_words[IOB_SOC_SUT_DATA_IN_N];
+  int phase;
+
+  // Record phase timing (see iob_soc_sut_phases.h)
+  phases_init(PHASE_CORE_TESTER);
+  phase = phase_begin("init");
 
   // Init uart0
   uart16550_init(UART0_BASE, FREQ/(16*BAUD));
@@ -160,8 +318,12 @@ int main() {
   // init console eth
   eth_init(ETH0_BASE, &clear_cache);
 
+  phase_end(phase);
+
   uart16550_puts("\n[Tester]: Waiting for ethernet PHY reset to finish...\n\n");
+  phase = phase_begin("phy_reset");
   eth_wait_phy_rst();
+  phase_end(phase);
 
 #ifndef SIMULATION
   // Receive data from console via Ethernet
@@ -183,21 +345,31 @@ int main() {
   uart16550_puts("[Tester]: Stored values 64 and 1024 in registers 1 and 2 of the "
             "SUT.\n\n");
 
+  // Write all items of the SUT's DATA_IN register array in one burst.
+  for (i = 0; i < IOB_SOC_SUT_DATA_IN_N; i++)
+    data_words[i] = 0x1000 + i;
+  IOB_SOC_SUT_SET_DATA_IN_BULK(SUT0_BASE, data_words, 0, IOB_SOC_SUT_DATA_IN_N);
+  printf("[Tester]: Stored %d words in register array DATA_IN of the SUT.\n\n",
+         IOB_SOC_SUT_DATA_IN_N);
+
   // Write a test pattern to the GPIO outputs to be read by the SUT.
   gpio_set(0x1234abcd);
   uart16550_puts("[Tester]: Placed test pattern 0x1234abcd in GPIO outputs.\n\n");
 
 #ifdef USE_ILA_PFSM
+    phase = phase_begin("ila_pfsm_program");
     // Program PFSM
-    pfsm_program(buffer);
+    pfsm_program("pfsm.bit");
 
     // Program Monitor PFSM (internal to ILA)
-    ila_monitor_program(buffer);
+    ila_monitor_program("monitor_pfsm.bit");
 
     // Enable all ILA triggers
     ila_enable_all_triggers();
+    phase_end(phase);
 #endif
 
+  phase = phase_begin("sut_handshake");
   uart16550_puts("[Tester]: Initializing SUT via UART...\n");
   // Init and switch to uart1 (connected to the SUT)
   uart16550_init(UART1_BASE, FREQ/(16*BAUD));
@@ -215,38 +387,69 @@ int main() {
 
   uart16550_base(UART0_BASE);
   uart16550_puts("[Tester]: Received SUT UART enquiry and sent acknowledge.\n");
+  phase_end(phase);
   
 #ifndef IOB_SOC_TESTER_INIT_MEM
+  phase = phase_begin("firmware_relay");
   uart16550_base(UART0_BASE);
   uart16550_puts("[Tester]: SUT memory is not initalized. Waiting for config file "
             "transfer request from SUT...\n");
   uart16550_base(UART1_BASE);
 
-  relay_file_transfer_to_sut(buffer, sut_firmware);
+  if (relay_file_transfer_to_sut(buffer)) {
+    test_failed(fail_string);
+    return -1;
+  }
 
   uart16550_base(UART0_BASE);
   uart16550_puts("[Tester]: Waiting for firmware transfer request from SUT...\n");
   uart16550_base(UART1_BASE);
 
-  relay_file_transfer_to_sut(buffer, sut_firmware);
+  if (relay_file_transfer_to_sut(buffer)) {
+    test_failed(fail_string);
+    return -1;
+  }
 
   uart16550_base(UART0_BASE);
   uart16550_puts("[Tester]: SUT firmware transfered.");
+  phase_end(phase);
 
 #endif //IOB_SOC_TESTER_INIT_MEM
 
   //Delay to allow time for sut to run bootloader and enable its axistream
+  phase = phase_begin("sut_boot_delay");
   for ( i = 0; i < (FREQ/BAUD)*256; i++)asm("nop");
+  phase_end(phase);
+
+#ifdef IOB_SOC_TESTER_SIM_CHECKPOINT
+  // Both cores are running their main functions: request simulation checkpoint
+  // (simulations restored from it start here)
+  gpio_init(GPIO1_BASE);
+  gpio_set(1);
+  gpio_init(GPIO0_BASE);
+  uart16550_puts("[Tester]: Reached simulation checkpoint.\n");
+#endif
+
+#ifdef IOB_SOC_TESTER_BENCHMARK
+  // Measure the links to the SUT before the test
+  phase = phase_begin("bench");
+  link_benchmark();
+  phase_end(phase);
+#endif
 
   // Send byte stream via AXI stream
+  phase = phase_begin("send_axistream");
   send_axistream();
+  phase_end(phase);
   
 #ifdef USE_ILA_PFSM
     // Disable all ILA triggers
     ila_disable_all_triggers();
     
     // Print sampled ILA values
+    phase = phase_begin("print_ila_samples");
     print_ila_samples();
+    phase_end(phase);
 #endif
 
   // Tell SUT that the Tester is running baremetal
@@ -255,6 +458,7 @@ int main() {
   uart16550_base(UART0_BASE);
 
   // Test sending data to SUT via ethernet
+  phase = phase_begin("eth_send");
   uart16550_puts("[Tester]: Sending data to SUT via ethernet:\n");
   for(i=0; i<64; i++) {
     buffer[i] = i; 
@@ -263,7 +467,12 @@ int main() {
   uart16550_putc('\n'); uart16550_putc('\n');
   // Send file
   eth_send_file(buffer, 64);
+  phase_end(phase);
+
+  // Send message to the SUT via the shared memory mailbox (replied later)
+  mailbox_send_echo();
   uart16550_puts("\n[Tester]: Reading SUT messages...\n");
+  phase = phase_begin("sut_messages");
   uart16550_base(UART1_BASE);
 
   i = 0;
@@ -296,6 +505,7 @@ int main() {
 
   // End UART1 connection with SUT
   uart16550_finish();
+  phase_end(phase);
 
   // Switch back to UART0
   uart16550_base(UART0_BASE);
@@ -311,13 +521,26 @@ int main() {
   uart16550_puts("[Tester]: Reading SUT's register contents:\n");
   printf("[Tester]: Register 3: %d \n", IOB_SOC_SUT_GET_REG3());
   printf("[Tester]: Register 4: %d \n", IOB_SOC_SUT_GET_REG4());
+  IOB_SOC_SUT_GET_DATA_OUT_BULK(SUT0_BASE, data_words, 0, IOB_SOC_SUT_DATA_OUT_N);
+  uart16550_puts("[Tester]: Register array DATA_OUT:");
+  for (i = 0; i < IOB_SOC_SUT_DATA_OUT_N; i++)
+    printf(" 0x%x", data_words[i]);
+  uart16550_putc('\n');
 
   // Read pattern from GPIO inputs (was set by the SUT)
   printf("\n[Tester]: Pattern read from GPIO inputs: 0x%x\n\n", gpio_get());
 
   // Read byte stream via AXI stream
+  phase = phase_begin("receive_axistream");
   receive_axistream();
+  phase_end(phase);
+
+  // Check reply of the SUT to the mailbox message
+  phase = phase_begin("mailbox_echo");
+  mailbox_check_echo();
+  phase_end(phase);
 
+  phase = phase_begin("shmem_read");
   uart16550_puts("\n[Tester] Using shared external memory. Obtain SUT memory string "
             "pointer via SUT's register 5...\n");
   uart16550_puts("[Tester]: String pointer is: ");
@@ -333,18 +556,34 @@ int main() {
     uart16550_putc(sutStr[i]);
   }
   uart16550_putc('\n');
+  phase_end(phase);
 
 #ifdef USE_ILA_PFSM
-    // Allocate memory for ILA output data
-    const uint32_t ila_n_samples = (1<<4); //Same as buffer size
-    uint32_t ila_data_size = ila_output_data_size(ila_n_samples, ILA0_DWORD_SIZE);
+    phase = phase_begin("ila_dump");
+    // Send ILA samples to file, in binary format
+    send_ila_capture("ila_data.bin");
+#ifdef IOB_SOC_TESTER_ILA_STREAM_SAMPLES
+    // Capture more samples than the ILA buffer holds
+    ila_stream_capture("ila_stream.bin");
+#endif
+    phase_end(phase);
+#endif
 
-    // Write data to allocated memory
-    uint32_t latest_sample_index = ila_number_samples();
-    ila_output_data(buffer, latest_sample_index, (latest_sample_index-1)%ila_n_samples, ila_n_samples, ILA0_DWORD_SIZE);
+#if defined(USE_ILA_PFSM) && defined(IOB_SOC_TESTER_PFSM_REPROGRAM)
+  // Run extra test cases with PFSM programs given by the host
+  phase = phase_begin("pfsm_reprogram");
+  pfsm_reprogram_loop();
+  phase_end(phase);
+#endif
+
+#ifdef IOB_SOC_TESTER_PHASE_TIMING
+  // Send phase timing of the Tester and the SUT to file (see phase_report.py)
+  send_phases("phases.bin");
+#endif
 
-    // Send ila data to file via UART
-    uart16550_sendfile("ila_data.bin", ila_data_size-1, buffer); //Don't send last byte (\0)
+#ifdef SIMULATION
+  // Used by `sim_speed.py` to report simulated cycles per second
+  printf("\n[Tester]: Simulated cycles: %llu\n", read_mcycle());
 #endif
 
   uart16550_puts("\n[Tester]: Verification successful!\n\n");
@@ -354,60 +593,317 @@ int main() {
   uart16550_finish();
 }
 
+// Send file to the console. On the FPGA, the file is sent via ethernet (ETH0).
+void send_file_to_console(char *file_name, uint32_t file_size, char *buffer) {
+#ifdef SIMULATION
+  uart16550_sendfile(file_name, file_size, buffer);
+#else
+  // Select console eth
+  eth_init(ETH0_BASE, &clear_cache);
+  uart_sendfile_ethernet(file_name, file_size, buffer);
+  // Select SUT eth again
+  eth_init_mac(ETH1_BASE, ETH_RMAC_ADDR, ETH_MAC_ADDR);
+#endif
+}
+
 #ifdef USE_ILA_PFSM
+// Receive a bitstream file from the console, in a buffer allocated for its size.
+// On the FPGA, the file contents are transfered via the console ethernet
+// (ETH0), which is much faster than UART for large programs. Simulation uses UART.
+// Returns NULL if there is not enough memory for the bitstream.
+char *recv_bitstream(char *file_name) {
+  uint32_t file_size = 0;
+  char *bitstream = console_recvfile(file_name, &file_size);
+
+  if (!bitstream)
+    printf("[Tester]: Not enough memory for %s (%d bytes).\n\n", file_name,
+           file_size);
+  return bitstream;
+}
+
 // Program independent PFSM peripheral of the Tester
-void pfsm_program(char *bitstreamBuffer){
+void pfsm_program(char *file_name){
+  char *bitstream;
   // init Programmable Finite State Machine
   pfsm_init(PFSM0_BASE, 2, 1, 1);
-  uint32_t file_size = 0;
   // Receive pfsm bitstream
-  file_size = uart16550_recvfile("pfsm.bit", bitstreamBuffer);
+  bitstream = recv_bitstream(file_name);
+  if (!bitstream)
+    return;
   // Program PFSM
   uart16550_puts("[Tester]: Programming PFSM...\n");
   printf("[Tester]: Programmed PFSM with %d bytes.\n\n",
-         pfsm_bitstream_program(bitstreamBuffer)
+         pfsm_bitstream_program(bitstream)
          );
+  free(bitstream);
 }
 
 // Program Monitor PFSM internal to ILA.
-void ila_monitor_program(char *bitstreamBuffer){
+void ila_monitor_program(char *file_name){
+  char *bitstream;
   // init ILA Monitor (PFSM)
   pfsm_init(ila_get_monitor_base_addr(ILA0_BASE), 2, 1, 1);
-  uint32_t file_size = 0;
   // Receive pfsm bitstream
-  file_size = uart16550_recvfile("monitor_pfsm.bit", bitstreamBuffer);
+  bitstream = recv_bitstream(file_name);
+  if (!bitstream)
+    return;
   // Program PFSM
   uart16550_puts("[Tester]: Programming Monitor PFSM...\n");
   printf("[Tester]: Programmed Monitor PFSM with %d bytes.\n\n",
-         pfsm_bitstream_program(bitstreamBuffer)
+         pfsm_bitstream_program(bitstream)
          );
+  free(bitstream);
 }
 
+#ifdef IOB_SOC_TESTER_PFSM_REPROGRAM
+// Reprogram the PFSMs between test cases, without rebooting the Tester.
+// The host stages the bitstreams and a command file (see scripts/pfsm_reprogram.py)
+// with one command per line:
+//   pfsm <file>     Program the independent PFSM with the given bitstream
+//   monitor <file>  Program the ILA Monitor PFSM with the given bitstream
+//   capture         Run a test case: record ILA samples and print them
+//   done            End of commands
+void pfsm_reprogram_loop(){
+  char *file, *commands, *line, *arg;
+  uint32_t size = 0;
+
+  file = console_recvfile("pfsm_reprogram.txt", &size);
+  // Copy with \0 at the end, to parse as a string
+  commands = (char *)malloc(size + 1);
+  if (!file || !commands) {
+    printf("[Tester]: Not enough memory for PFSM reprogram commands.\n");
+    free(file);
+    free(commands);
+    return;
+  }
+  memcpy(commands, file, size);
+  commands[size] = '\0';
+  free(file);
+
+  for (line = commands; line < commands + size && *line != '\0';) {
+    // Split line and its argument
+    char *end = strchr(line, '\n');
+    if (end) *end = '\0';
+    arg = strchr(line, ' ');
+    if (arg) *arg++ = '\0';
+
+    if (!strcmp(line, "pfsm") && arg) {
+      pfsm_program(arg);
+    } else if (!strcmp(line, "monitor") && arg) {
+      ila_monitor_program(arg);
+    } else if (!strcmp(line, "capture")) {
+      uart16550_puts("[Tester]: Running PFSM test case...\n");
+      ila_enable_all_triggers();
+      for (int i = 0; i < (FREQ/BAUD)*16; i++)asm("nop");
+      ila_disable_all_triggers();
+      print_ila_samples();
+    } else if (!strcmp(line, "done")) {
+      break;
+    } else if (*line != '\0') {
+      printf("[Tester]: Unknown PFSM reprogram command: %s\n", line);
+    }
+
+    if (!end) break;
+    line = end + 1;
+  }
+  free(commands);
+}
+#endif
+
+// Header of binary ILA captures (decoded by scripts/ila_decode.py).
+// Followed by the {lsb, width} of each probe (2 x uint16_t), the probe names
+// (separated by \0, padded to 4 bytes) and the samples (SAMPLE_WORDS x uint32_t
+// each, least significant word first).
+typedef struct {
+  char magic[4];        // "ILAB"
+  uint16_t version;
+  uint16_t header_size; // Size of header, probe fields and names
+  uint8_t buffer_w;
+  uint8_t clk_counter_w;
+  uint8_t sample_words; // 32-bit words per sample
+  uint8_t n_probes;
+  uint32_t n_samples;
+} ila_capture_header_t;
+
+// Write header of binary ILA capture to `buffer`.
+// magic: "ILAB" for captures, or "ILAS" for streams (see ila_stream_capture())
+// returns: size of header (multiple of 4 bytes)
+uint32_t ila_capture_header(char *buffer, char *magic, uint32_t n_samples) {
+  const uint16_t probe_fields[][2] = ILA0_LAYOUT_PROBE_FIELDS;
+  const char probe_names[] = ILA0_LAYOUT_PROBE_NAMES;
+  uint32_t header_size = sizeof(ila_capture_header_t) + sizeof(probe_fields) +
+                         ((sizeof(probe_names) + 3) & ~3);
+  ila_capture_header_t *header = (ila_capture_header_t *)buffer;
+
+  if (!buffer)
+    return header_size;
+  memset(buffer, 0, header_size);
+  memcpy(header->magic, magic, 4);
+  header->version = 1;
+  header->header_size = header_size;
+  header->buffer_w = ILA0_LAYOUT_BUFFER_W;
+  header->clk_counter_w = ILA0_LAYOUT_CLK_COUNTER_W;
+  header->sample_words = ILA0_LAYOUT_SAMPLE_WORDS;
+  header->n_probes = ILA0_LAYOUT_N_PROBES;
+  header->n_samples = n_samples;
+  memcpy(buffer + sizeof(ila_capture_header_t), probe_fields, sizeof(probe_fields));
+  memcpy(buffer + sizeof(ila_capture_header_t) + sizeof(probe_fields),
+         probe_names, sizeof(probe_names));
+  return header_size;
+}
+
+// Read all samples of the ILA buffer via DMA and send them to a file, in binary format.
+void send_ila_capture(char *file_name) {
+  const uint32_t n_samples = (1 << ILA0_LAYOUT_BUFFER_W);
+  uint32_t header_size = ila_capture_header(NULL, "ILAB", n_samples);
+  uint32_t file_size = header_size + n_samples * ILA0_LAYOUT_SAMPLE_WORDS * 4;
+  char *capture = (char *)malloc(file_size);
+
+  ila_capture_header(capture, "ILAB", n_samples);
+
+  // Point ila cursor to the latest sample
+  ila_set_cursor(ila_number_samples(), 0);
+  // Store samples after the header via DMA
+  uart16550_puts("[Tester]: Storing ILA capture into memory via DMA...\n");
+  dma_start_transfer((uint32_t *)(capture + header_size),
+                     n_samples * ILA0_LAYOUT_SAMPLE_WORDS, 1, 1);
+  clear_cache();
+
+  send_file_to_console(file_name, file_size, capture);
+
+  free(capture);
+}
+
+#ifdef IOB_SOC_TESTER_ILA_STREAM_SAMPLES
+// Header of each chunk of an ILA stream
+typedef struct {
+  char magic[4];         // "ILAC"
+  uint32_t seq;          // Chunk sequence number
+  uint32_t first_sample; // Index of first sample of chunk (since start of stream)
+  uint32_t n_lost;       // Samples lost before this chunk (overrun)
+} ila_stream_chunk_t;
+
+// Chunks of the ILA stream stored in memory before they are sent to a file
+#define ILA_STREAM_BATCH_CHUNKS 16
+#define ILA_STREAM_CHUNK_SIZE                                                  \
+  (sizeof(ila_stream_chunk_t) +                                                \
+   (1 << ILA0_LAYOUT_BUFFER_W) / 2 * ILA0_LAYOUT_SAMPLE_WORDS * 4)
+static uint32_t ila_stream_buffer[ILA_STREAM_BATCH_CHUNKS *
+                                  ILA_STREAM_CHUNK_SIZE / 4];
+
+/*
+ * Continuous capture of ILA samples, longer than the ILA buffer.
+ *
+ * The ILA circular buffer is split in two halves (ping-pong). While the ILA
+ * writes samples in one half, the DMA copies the other (complete) half to a
+ * chunk in memory. If the ILA writes samples faster than they are copied, the
+ * oldest samples are overwritten: the stream skips to the latest complete half
+ * and records the lost samples in the next chunk.
+ *
+ * Chunks are stored in a fixed buffer of ILA_STREAM_BATCH_CHUNKS chunks. When
+ * it is full, the chunks are sent to the `<file_name>.<n>` file (n = 0, 1, ...)
+ * and the buffer is reused. Samples captured while the chunks are sent are
+ * lost (and recorded in the next chunk).
+ *
+ * The stream ends after IOB_SOC_TESTER_ILA_STREAM_SAMPLES samples, or when no
+ * new samples are captured for a while. Then the "ILAS" capture header is sent
+ * to `<file_name>` (see scripts/ila_stream.py).
+*/
+void ila_stream_capture(char *file_name) {
+  const uint32_t half = (1 << ILA0_LAYOUT_BUFFER_W) / 2;
+  const uint32_t max_chunks = IOB_SOC_TESTER_ILA_STREAM_SAMPLES / half;
+  char *stream = (char *)ila_stream_buffer;
+  char part_name[64];
+  uint32_t start, next, latest, n_chunks = 0, n_lost = 0, total_lost = 0;
+  uint32_t idle_polls = 0, n_batched = 0, n_parts = 0;
+  ila_stream_chunk_t *chunk;
+
+  uart16550_puts("[Tester]: Streaming ILA samples via DMA...\n");
+  start = ila_number_samples();
+  next = start;
+  ila_enable_all_triggers();
+  while (n_chunks < max_chunks && idle_polls < FREQ / 16) {
+    latest = ila_number_samples();
+    // Wait for a complete half of the buffer
+    if (latest - next < half) {
+      idle_polls++;
+      continue;
+    }
+    idle_polls = 0;
+    // Overrun: the half at `next` was already overwritten. Skip to latest complete half.
+    if (latest - next > 2 * half) {
+      n_lost += (latest - next) / half * half - half;
+      next += (latest - next) / half * half - half;
+    }
+
+    chunk = (ila_stream_chunk_t *)(stream + n_batched * ILA_STREAM_CHUNK_SIZE);
+    memcpy(chunk->magic, "ILAC", 4);
+    chunk->seq = n_chunks;
+    chunk->first_sample = next - start;
+    chunk->n_lost = n_lost;
+    ila_set_cursor(next, 0);
+    dma_start_transfer((uint32_t *)(chunk + 1), half * ILA0_LAYOUT_SAMPLE_WORDS,
+                       1, 1);
+    // Samples overwritten while they were copied
+    if (ila_number_samples() - next > 2 * half)
+      chunk->n_lost |= 0x80000000;
+
+    total_lost += n_lost;
+    n_lost = 0;
+    next += half;
+    n_chunks++;
+    n_batched++;
+    // Send full buffer of chunks
+    if (n_batched == ILA_STREAM_BATCH_CHUNKS || n_chunks == max_chunks) {
+      clear_cache();
+      snprintf(part_name, sizeof(part_name), "%s.%d", file_name, n_parts++);
+      send_file_to_console(part_name, n_batched * ILA_STREAM_CHUNK_SIZE, stream);
+      n_batched = 0;
+    }
+  }
+  ila_disable_all_triggers();
+  if (n_batched) {
+    clear_cache();
+    snprintf(part_name, sizeof(part_name), "%s.%d", file_name, n_parts++);
+    send_file_to_console(part_name, n_batched * ILA_STREAM_CHUNK_SIZE, stream);
+  }
+
+  printf("[Tester]: Streamed %d ILA samples in %d chunks (%d samples lost).\n",
+         n_chunks * half, n_chunks, total_lost);
+  // Header, with the number of samples of the stream
+  send_file_to_console(file_name,
+                       ila_capture_header(stream, "ILAS", n_chunks * half),
+                       stream);
+}
+#endif // IOB_SOC_TESTER_ILA_STREAM_SAMPLES
+
 void print_ila_samples() {
-  // From the ILA0 configuration: bits 0-15 are the timestamp; bits 16-47 are fifo_value; bits 48-52 are the fifo_level; bit 53 is PFSM output
-  uint32_t j, i, fifo_value;
+  // Position of the timestamp and probes in each sample is given by ILA0_layout.h
+  uint32_t i;
   uint16_t initial_time = (uint16_t)ila_get_large_value(0,0);
   uint32_t latest_sample_index = ila_number_samples();
-  const uint32_t ila_buffer_size = (1<<4);
+  const uint32_t ila_buffer_size = (1 << ILA0_LAYOUT_BUFFER_W);
 
   // Allocate memory for samples
-  // Each buffer sample has 2 * 32 bit words
-  volatile uint32_t *samples = (volatile uint32_t *)malloc((ila_buffer_size*2)*sizeof(uint32_t));
+  // Each buffer sample has ILA0_LAYOUT_SAMPLE_WORDS * 32 bit words
+  volatile uint32_t *samples = (volatile uint32_t *)malloc((ila_buffer_size*ILA0_LAYOUT_SAMPLE_WORDS)*sizeof(uint32_t));
 
   // Point ila cursor to the latest sample
   ila_set_cursor(latest_sample_index,0);
 
   uart16550_puts("[Tester]: Storing ILA samples into memory via DMA...\n");
-  dma_start_transfer((uint32_t *)samples+i, ila_buffer_size*2, 1, 1);
+  dma_start_transfer((uint32_t *)samples, ila_buffer_size*ILA0_LAYOUT_SAMPLE_WORDS, 1, 1);
 
   clear_cache();
 
   uart16550_puts("[Tester]: ILA values sampled from the AXI input FIFO of SUT: \n");
   uart16550_puts("[Tester]: | Timestamp | FIFO level | AXI input value | PFSM output |\n");
   // For every sample in the buffer
-  for(i=0; i<ila_buffer_size*2; i+=2){
-    fifo_value = samples[i+1]<<16 | samples[i]>>16;
-    printf("[Tester]: | %06d    | 0x%02x       | 0x%08x      | %d           |\n",(uint16_t)(samples[i]-initial_time), samples[i+1]>>16 & 0x1f, fifo_value, samples[i+1]>>21 & 0x1);
+  for(i=0; i<ila_buffer_size*ILA0_LAYOUT_SAMPLE_WORDS; i+=ILA0_LAYOUT_SAMPLE_WORDS){
+    printf("[Tester]: | %06d    | 0x%02x       | 0x%08x      | %d           |\n",
+           (uint16_t)(ILA0_GET_CLK_COUNTER(samples+i)-initial_time),
+           ILA0_GET_FIFO_LEVEL(samples+i), ILA0_GET_AXIS_TDATA(samples+i),
+           ILA0_GET_PFSM_OUTPUT(samples+i));
   }
   uart16550_putc('\n');
 
@@ -415,9 +911,333 @@ void print_ila_samples() {
 }
 #endif //USE_ILA_PFSM
 
+// Mailbox with the SUT, in the SUT's memory (see iob_soc_sut_mailbox.h)
+// Tester to SUT (tx) and SUT to Tester (rx) rings
+static mbox_ring_t mbox_tx, mbox_rx;
+
+uint32_t mbox_t2s_tail() { return IOB_SOC_SUT_GET_T2S_TAIL(); }
+void mbox_t2s_head(uint32_t value) { IOB_SOC_SUT_SET_T2S_HEAD(value); }
+uint32_t mbox_s2t_head() { return IOB_SOC_SUT_GET_S2T_HEAD(); }
+void mbox_s2t_tail(uint32_t value) { IOB_SOC_SUT_SET_S2T_TAIL(value); }
+
+// Find mailbox of the SUT, via its MBOX_BASE register.
+// returns: 0 on success, -1 if the SUT has not initialized it
+int mailbox_open() {
+  volatile mbox_shared_t *shared;
+
+  if (mbox_tx.data)
+    return 0;
+  if (!IOB_SOC_SUT_GET_MBOX_BASE())
+    return -1;
+  // Access mailbox via the SUT's memory zone
+  shared = (volatile mbox_shared_t *)(IOB_SOC_SUT_GET_MBOX_BASE() ^
+                                      (1 << (IOB_SOC_TESTER_MEM_ADDR_W - 1)));
+  clear_cache();
+  if (shared->magic != MBOX_MAGIC || shared->ring_size != MBOX_RING_SIZE)
+    return -1;
+  mbox_ring_init(&mbox_tx, shared->t2s, &mbox_t2s_tail, &mbox_t2s_head,
+                 &clear_cache);
+  mbox_ring_init(&mbox_rx, shared->s2t, &mbox_s2t_head, &mbox_s2t_tail,
+                 &clear_cache);
+  return 0;
+}
+
+// Byte `i` of the mailbox echo message
+#define MBOX_ECHO_BYTE(i) ((uint8_t)((i) * 3))
+
+void mailbox_send_echo() {
+  uint8_t *payload;
+  uint32_t size = MBOX_ECHO_SIZE, i;
+
+  if (mailbox_open()) {
+    uart16550_puts("[Tester]: SUT mailbox not found.\n\n");
+    return;
+  }
+  payload = (uint8_t *)malloc(size);
+  for (i = 0; i < size; i++)
+    payload[i] = MBOX_ECHO_BYTE(i);
+  mbox_write_all(&mbox_tx, &size, 4, MBOX_WAIT_POLLS);
+  mbox_write_all(&mbox_tx, payload, size, MBOX_WAIT_POLLS);
+  printf("[Tester]: Sent %d bytes to SUT via shared memory mailbox.\n\n",
+         size);
+  free(payload);
+}
+
+void mailbox_check_echo() {
+  uint8_t *payload;
+  uint32_t size = 0, i, n_errors = 0;
+
+  if (mailbox_open())
+    return;
+  if (mbox_read_all(&mbox_rx, &size, 4, MBOX_WAIT_POLLS) != 4 ||
+      size != MBOX_ECHO_SIZE) {
+    uart16550_puts("[Tester]: No mailbox reply from SUT!\n\n");
+    return;
+  }
+  payload = (uint8_t *)malloc(size);
+  size = mbox_read_all(&mbox_rx, payload, size, MBOX_WAIT_POLLS);
+  for (i = 0; i < MBOX_ECHO_SIZE; i++)
+    if (i >= size || payload[i] != (uint8_t)(MBOX_ECHO_BYTE(i) + 1))
+      n_errors++;
+  printf("[Tester]: Mailbox reply from SUT: %d bytes, %d errors.\n\n", size,
+         n_errors);
+  free(payload);
+}
+
+#ifdef IOB_SOC_TESTER_PHASE_TIMING
+// Send phase tables of the Tester and the SUT to a file, in binary format.
+// The SUT table is read via the shared memory zone, at the address given by
+// the SUT's PHASES register.
+void send_phases(char *file_name) {
+  volatile phase_table_t *sut_table = NULL;
+  uint32_t size;
+  char *dump;
+
+  if (IOB_SOC_SUT_GET_PHASES())
+    sut_table = (volatile phase_table_t *)(IOB_SOC_SUT_GET_PHASES() ^
+                                           (1 << (IOB_SOC_TESTER_MEM_ADDR_W - 1)));
+  clear_cache();
+  size = phases_dump(NULL, sut_table, FREQ);
+  dump = (char *)malloc(size);
+  phases_dump(dump, sut_table, FREQ);
+  send_file_to_console(file_name, size, dump);
+  free(dump);
+}
+#endif // IOB_SOC_TESTER_PHASE_TIMING
+
+#ifdef IOB_SOC_TESTER_BENCHMARK
+// Result of one benchmark measurement
+typedef struct {
+  char *path;
+  uint32_t size;
+  uint64_t cycles;
+} bench_result_t;
+
+// Wait for ACK from the SUT, skipping other characters (like the last messages
+// of its bootloader)
+void bench_wait_ack() {
+  while (uart16550_getc() != ACK)
+    ;
+}
+
+// Send benchmark command to the SUT (UART1) and wait until it is ready
+void bench_command(uint8_t cmd, uint32_t size) {
+  uart16550_putc(cmd);
+  sut_xfer_put_u32(&uart16550_putc, size);
+  bench_wait_ack();
+}
+
+// Send words to the SUT via AXI stream, in `n_packets` packets of the same
+// length, through the DMA packet queue
+void bench_axis_send(uint32_t *words, uint32_t n_words, uint32_t n_packets) {
+  uint32_t i, packet_words = n_words / n_packets;
+
+  for (i = 0; i < n_packets; i++)
+    axis_queue_push(words + i * packet_words, packet_words);
+  axis_queue_flush();
+}
+
+/*
+ * Measure throughput and latency of the links to the SUT (see
+ * iob_soc_sut_bench.h), for each payload size of BENCH_SIZES.
+ * Measurements use the mcycle counter and are printed at the end, as
+ * "[Tester]: BENCH ..." lines (parsed by link_bench.py).
+ */
+void link_benchmark() {
+  const uint32_t sizes[] = BENCH_SIZES;
+  const uint32_t n_sizes = sizeof(sizes) / sizeof(sizes[0]);
+  uint32_t reg_words[IOB_SOC_SUT_DATA_IN_N], reg_out[IOB_SOC_SUT_DATA_OUT_N];
+  uint32_t i, s, n, size, n_words, n_results = 0;
+  uint64_t start;
+  volatile uint32_t *sut_mem;
+  uint32_t *words = (uint32_t *)malloc(BENCH_MAX_SIZE);
+  bench_result_t *results =
+      (bench_result_t *)malloc(9 * n_sizes * sizeof(bench_result_t));
+
+  for (i = 0; i < BENCH_MAX_SIZE / 4; i++)
+    words[i] = i;
+  // Same values that the test stores in DATA_IN
+  for (i = 0; i < IOB_SOC_SUT_DATA_IN_N; i++)
+    reg_words[i] = 0x1000 + i;
+
+  uart16550_puts("[Tester]: Running link benchmark...\n");
+#ifdef USE_ILA_PFSM
+  // Don't sample benchmark streams
+  ila_disable_all_triggers();
+#endif
+  axis_queue_reset();
+
+  uart16550_base(UART1_BASE);
+  // Get address of the SUT buffer, and access it via the SUT's memory zone
+  bench_command(BENCH_CMD_ADDR, 0);
+  sut_mem = (volatile uint32_t *)(sut_xfer_get_u32(&uart16550_getc) ^
+                                  (1 << (IOB_SOC_TESTER_MEM_ADDR_W - 1)));
+
+  for (s = 0; s < n_sizes; s++) {
+    size = sizes[s];
+    n_words = size / 4;
+
+    if (size <= BENCH_UART_MAX_SIZE) {
+      bench_command(BENCH_CMD_UART, size);
+      start = read_mcycle();
+      for (i = 0; i < size; i++)
+        uart16550_putc(((char *)words)[i]);
+      bench_wait_ack();
+      results[n_results++] = (bench_result_t){"uart", size, read_mcycle() - start};
+    }
+
+    bench_command(BENCH_CMD_ETH, size);
+    start = read_mcycle();
+    eth_send_file((char *)words, size);
+    bench_wait_ack();
+    results[n_results++] = (bench_result_t){"eth", size, read_mcycle() - start};
+
+    // Packets have whole AXI stream beats
+    if (n_words % AXIS_BEAT_WORDS == 0) {
+      bench_command(BENCH_CMD_AXIS, size);
+      start = read_mcycle();
+      bench_axis_send(words, n_words, 1);
+      bench_wait_ack();
+      results[n_results++] =
+          (bench_result_t){"axis", size, read_mcycle() - start};
+    }
+
+    if (n_words >= BENCH_AXIS_PACKETS * AXIS_BEAT_WORDS) {
+      bench_command(BENCH_CMD_AXIS, size);
+      start = read_mcycle();
+      bench_axis_send(words, n_words, BENCH_AXIS_PACKETS);
+      bench_wait_ack();
+      results[n_results++] =
+          (bench_result_t){"axis_queue", size, read_mcycle() - start};
+    }
+
+    if (!mailbox_open()) {
+      bench_command(BENCH_CMD_MBOX, size);
+      start = read_mcycle();
+      mbox_write_all(&mbox_tx, words, size, MBOX_WAIT_POLLS);
+      bench_wait_ack();
+      results[n_results++] = (bench_result_t){"mbox", size, read_mcycle() - start};
+    }
+
+    start = read_mcycle();
+    for (i = 0; i < n_words; i += n) {
+      n = n_words - i < IOB_SOC_SUT_DATA_IN_N ? n_words - i : IOB_SOC_SUT_DATA_IN_N;
+      IOB_SOC_SUT_SET_DATA_IN_BULK(SUT0_BASE, reg_words, 0, n);
+    }
+    results[n_results++] =
+        (bench_result_t){"regfileif_write", size, read_mcycle() - start};
+
+    start = read_mcycle();
+    for (i = 0; i < n_words; i += n) {
+      n = n_words - i < IOB_SOC_SUT_DATA_OUT_N ? n_words - i : IOB_SOC_SUT_DATA_OUT_N;
+      IOB_SOC_SUT_GET_DATA_OUT_BULK(SUT0_BASE, reg_out, 0, n);
+    }
+    results[n_results++] =
+        (bench_result_t){"regfileif_read", size, read_mcycle() - start};
+
+    start = read_mcycle();
+    for (i = 0; i < n_words; i++)
+      sut_mem[i] = words[i];
+    clear_cache();
+    results[n_results++] =
+        (bench_result_t){"shmem_write", size, read_mcycle() - start};
+
+    start = read_mcycle();
+    for (i = 0; i < n_words; i++)
+      words[i] = sut_mem[i];
+    results[n_results++] =
+        (bench_result_t){"shmem_read", size, read_mcycle() - start};
+  }
+  uart16550_putc(BENCH_CMD_DONE);
+  uart16550_base(UART0_BASE);
+
+#ifdef USE_ILA_PFSM
+  ila_enable_all_triggers();
+#endif
+
+  printf("[Tester]: BENCH freq=%d\n", FREQ);
+  for (i = 0; i < n_results; i++)
+    printf("[Tester]: BENCH path=%s size=%d cycles=%llu\n", results[i].path,
+           results[i].size, results[i].cycles);
+  uart16550_putc('\n');
+
+  free(results);
+  free(words);
+}
+#endif // IOB_SOC_TESTER_BENCHMARK
+
+/*
+ * Queue of AXI stream packets sent to AXISTREAMOUT0 via DMA0.
+ * Packets are sent by DMA only: AXISTREAMOUT0 asserts TLAST after NWORDS
+ * words. `axis_queue_service()` starts the next packet once DMA0 is ready, so
+ * the CPU can prepare packets while others are sent. Consecutive packets of
+ * the same length are sent back to back; NWORDS only changes once the output
+ * FIFO is empty.
+ */
+#define AXIS_QUEUE_SIZE 8
+
+typedef struct {
+  uint32_t *words;
+  uint32_t n_words;
+} axis_packet_t;
+
+static axis_packet_t axis_queue[AXIS_QUEUE_SIZE];
+// Free-running indices: packets from tail to head are waiting
+static uint32_t axis_queue_head = 0, axis_queue_tail = 0;
+// NWORDS of the packets being sent (0: not set)
+static uint32_t axis_queue_nwords = 0;
+
+// Reset AXISTREAMOUT0 and empty the queue
+void axis_queue_reset() {
+  iob_axis_out_reset();
+  IOB_AXISTREAM_OUT_SET_ENABLE(1);
+  IOB_AXISTREAM_OUT_SET_MODE(1);
+  axis_queue_head = axis_queue_tail = axis_queue_nwords = 0;
+}
+
+/* Add packet to the queue. n_words: multiple of AXIS_BEAT_WORDS
+ * returns: 0 on success, -1 if the queue is full or n_words is invalid
+ */
+int axis_queue_push(uint32_t *words, uint32_t n_words) {
+  if (axis_queue_head - axis_queue_tail == AXIS_QUEUE_SIZE ||
+      !n_words || n_words % AXIS_BEAT_WORDS)
+    return -1;
+  axis_queue[axis_queue_head % AXIS_QUEUE_SIZE] =
+      (axis_packet_t){words, n_words};
+  axis_queue_head++;
+  return 0;
+}
+
+// Start the next packet, if possible. returns: number of packets waiting
+uint32_t axis_queue_service() {
+  axis_packet_t *packet;
+
+  if (axis_queue_head == axis_queue_tail || !dma_transfer_ready())
+    return axis_queue_head - axis_queue_tail;
+  packet = &axis_queue[axis_queue_tail % AXIS_QUEUE_SIZE];
+  if (packet->n_words != axis_queue_nwords) {
+    // Words of previous packets must leave the FIFO before NWORDS changes
+    if (!IOB_AXISTREAM_OUT_GET_FIFO_EMPTY())
+      return axis_queue_head - axis_queue_tail;
+    IOB_AXISTREAM_OUT_SET_NWORDS(packet->n_words / AXIS_BEAT_WORDS);
+    axis_queue_nwords = packet->n_words;
+  }
+  dma_start_transfer(packet->words, packet->n_words, 0, 0);
+  axis_queue_tail++;
+  return axis_queue_head - axis_queue_tail;
+}
+
+// Send every packet of the queue and wait until DMA0 is done
+void axis_queue_flush() {
+  while (axis_queue_service())
+    ;
+  while (!dma_transfer_ready())
+    ;
+}
+
 void send_axistream() {
-  uint8_t i;
-  uint8_t words_in_byte_stream = 4; 
+  uint32_t i;
+  uint32_t words_in_byte_stream = 4;
   // Allocate memory for byte stream
   uint32_t *byte_stream = (uint32_t *)malloc(words_in_byte_stream*sizeof(uint32_t));
   // Fill byte stream to send
@@ -432,24 +1252,27 @@ void send_axistream() {
     printf("0x%02x ", ((uint8_t *)byte_stream)[i]);
   uart16550_puts("\n");
 
-  // Send bytes to AXI stream output via DMA, except the last word.
-  uart16550_puts("[Tester]: Loading AXI words via DMA...\n");
-  iob_axis_out_reset();
-  IOB_AXISTREAM_OUT_SET_ENABLE(1);
-  IOB_AXISTREAM_OUT_SET_MODE(1);
-  IOB_AXISTREAM_OUT_SET_NWORDS(words_in_byte_stream);
-  dma_start_transfer(byte_stream, words_in_byte_stream-1, 0, 0);
-  // Send the last word with via SWregs with the TLAST signal.
-  uart16550_puts("[Tester]: Loading last AXI word via SWregs...\n\n");
-  IOB_AXISTREAM_OUT_SET_MODE(0);
-  iob_axis_write(byte_stream[words_in_byte_stream-1]);
+  // Send bytes to AXI stream output via DMA (TLAST generated from NWORDS).
+  // The SUT loops the packet back: tell it the packet length.
+  uart16550_puts("[Tester]: Loading AXI words via DMA...\n\n");
+  IOB_SOC_SUT_SET_AXIS_NWORDS(words_in_byte_stream);
+  axis_queue_reset();
+  axis_queue_push(byte_stream, words_in_byte_stream);
+  axis_queue_flush();
 
   free(byte_stream);
 }
 
 void receive_axistream() {
-  uint8_t i;
-  uint8_t n_received_words = IOB_AXISTREAM_IN_GET_NWORDS();
+  uint32_t i;
+  uint32_t n_received_words;
+
+  // Sleep until the SUT sends the AXI stream (AXISTREAMIN0 interrupt)
+  if (!axistream_in_wait(AXISTREAMIN0_IRQ, AXISTREAM_WAIT_TIMEOUT)) {
+    uart16550_puts("[Tester]: Timeout waiting for AXI stream from SUT.\n\n");
+    return;
+  }
+  n_received_words = IOB_AXISTREAM_IN_GET_NWORDS() * AXIS_BEAT_WORDS;
   
   // Allocate memory for byte stream
   volatile uint32_t *byte_stream = (volatile uint32_t *)malloc((n_received_words)*sizeof(uint32_t));
@@ -458,6 +1281,9 @@ void receive_axistream() {
   uart16550_puts("[Tester]: Storing AXI words via DMA...\n");
   IOB_AXISTREAM_IN_SET_MODE(1);
   dma_start_transfer((uint32_t *)byte_stream, n_received_words, 1, 0);
+  // Wait for the DMA to write every word, before reading them
+  while (!dma_transfer_ready())
+    ;
 
   clear_cache();
 
@@ -1,13 +1,12 @@
 #Function to obtain parameter named $(1) from iob_soc_sut_conf.vh
 GET_IOB_SOC_SUT_CONF_MACRO = $(call GET_MACRO,IOB_SOC_SUT_$(1),../src/iob_soc_sut_conf.vh)
 
+# Full and byte lane hex files, in one pass (not rewritten if the binary did not change)
 iob_soc_sut_boot.hex: ../../software/iob_soc_sut_boot.bin
-	../../scripts/makehex.py $< $(call GET_IOB_SOC_SUT_CONF_MACRO,BOOTROM_ADDR_W) > $@
-	../../scripts/hex_split.py iob_soc_sut_boot .
+	../../scripts/sut_hex.py $< $(call GET_IOB_SOC_SUT_CONF_MACRO,BOOTROM_ADDR_W) iob_soc_sut_boot
 
 iob_soc_sut_firmware.hex: iob_soc_sut_firmware.bin
-	../../scripts/makehex.py $< $(call GET_IOB_SOC_SUT_CONF_MACRO,MEM_ADDR_W) > $@
-	../../scripts/hex_split.py iob_soc_sut_firmware .
+	../../scripts/sut_hex.py $< $(call GET_IOB_SOC_SUT_CONF_MACRO,MEM_ADDR_W) iob_soc_sut_firmware
 
 iob_soc_sut_firmware.bin: ../../software/iob_soc_sut_firmware.bin
 	cp $< $@
@@ -0,0 +1,107 @@
+# Batched modifications of generated Verilog files.
+#
+# Collects the code insertions and string replacements for each Verilog file,
+# applies them in memory (in the order they were added), and writes each file
+# only once. All anchors are validated before any file is written, so a missing
+# anchor raises a VerilogPatchError instead of leaving a half-patched build directory.
+#
+# Example:
+#   patches = VerilogPatchSet(build_dir)
+#   patches.insert("hardware/src/iob_soc_sut.v", "   assign a = 1'b0;")
+#   patches.insert("hardware/src/iob_soc_sut.v", "   .b(b),", after_line="soc0")
+#   patches.replace("hardware/src/iob_soc_sut.v", "old_string", "new_string")
+#   patches.apply()
+import os
+import tempfile
+
+
+class VerilogPatchError(Exception):
+    """Raised when anchors of a patch set are not found.
+    Attribute `missing` is a list of (file, kind, anchor) for each failed patch.
+    """
+
+    def __init__(self, missing):
+        self.missing = missing
+        super().__init__(
+            "Verilog patch anchors not found:\n"
+            + "\n".join(
+                f"  {file}: {kind} anchor {repr(anchor)}"
+                for file, kind, anchor in missing
+            )
+        )
+
+
+class VerilogPatchSet:
+    def __init__(self, build_dir=""):
+        """build_dir: directory that file paths of the patches are relative to"""
+        self.build_dir = build_dir
+        # Dictionary with list of patches for each file: (kind, anchor, code)
+        self.patches = {}
+
+    def insert(self, file, verilog_code, after_line=""):
+        """Insert Verilog code in a module.
+        Same behaviour as `insert_verilog_in_module`: if `after_line` is given,
+        insert after the first line that contains it. Otherwise insert before `endmodule`.
+        """
+        if after_line:
+            self.patches.setdefault(file, []).append(
+                ("after_line", after_line, verilog_code)
+            )
+        else:
+            self.patches.setdefault(file, []).append(
+                ("endmodule", "endmodule", verilog_code)
+            )
+
+    def replace(self, file, old_string, new_string):
+        """Replace all occurrences of old_string by new_string (like `inplace_change`)"""
+        self.patches.setdefault(file, []).append(("replace", old_string, new_string))
+
+    @staticmethod
+    def _apply_patch(lines, kind, anchor, code):
+        """Apply a patch to the list of lines of a file.
+        returns: False if the anchor was not found
+        """
+        if kind != "replace" and not code.endswith("\n"):
+            code += "\n"
+        if kind == "after_line":
+            for idx, line in enumerate(lines):
+                if anchor in line:
+                    lines.insert(idx + 1, code)
+                    return True
+        elif kind == "endmodule":
+            for idx in range(len(lines) - 1, -1, -1):
+                if lines[idx].lstrip().startswith("endmodule"):
+                    lines.insert(idx, code)
+                    return True
+        elif kind == "replace":
+            text = "".join(lines)
+            if anchor in text:
+                lines[:] = text.replace(anchor, code).splitlines(keepends=True)
+                return True
+        return False
+
+    def apply(self):
+        """Apply all patches. Each file is read and written once.
+        Raises VerilogPatchError (without writing any file) if an anchor is not found.
+        """
+        new_contents = {}
+        missing = []
+        for file, patches in self.patches.items():
+            path = os.path.join(self.build_dir, file)
+            with open(path) as f:
+                lines = f.readlines()
+            for kind, anchor, code in patches:
+                if not self._apply_patch(lines, kind, anchor, code):
+                    missing.append((file, kind, anchor))
+            new_contents[path] = "".join(lines)
+        if missing:
+            raise VerilogPatchError(missing)
+
+        for path, contents in new_contents.items():
+            # Write atomically: a failed write never leaves a truncated file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+            with os.fdopen(fd, "w") as f:
+                f.write(contents)
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+            os.replace(tmp_path, path)
+        self.patches = {}